@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime
+
+# Добавляем путь к `src/scripts` в пути поиска Python
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'scripts')))
+
+from db_writer import connect, bulk_upsert, snapshot_timestamp
+
+COLUMNS = ('symbol', 'exchange', 'market_type', 'last_price', 'volume_24h', 'price_usdt',
+           'high_price_24h', 'low_price_24h', 'trades_24h', 'timestamp', 'updated_time')
+KEY = ('symbol', 'exchange', 'market_type')
+SIZES = (5_000, 50_000, 500_000)
+
+
+def create_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS market_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            market_type TEXT NOT NULL,
+            last_price REAL,
+            volume_24h REAL,
+            price_usdt REAL,
+            high_price_24h REAL,
+            low_price_24h REAL,
+            trades_24h INTEGER,
+            timestamp DATETIME,
+            updated_time DATETIME
+        );
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_market_data_unique
+        ON market_data (symbol, exchange, market_type);
+    ''')
+    conn.commit()
+
+
+# Генерация синтетических инструментов
+def generate_rows(count, timestamp):
+    rows = []
+    for i in range(count):
+        price = random.uniform(0.001, 50000)
+        volume = random.uniform(1, 1_000_000)
+        rows.append((f"SYM{i}USDT", 'Binance', 'spot', price, volume, price * volume,
+                     price * 1.05, price * 0.95, random.randint(0, 100_000), timestamp, timestamp))
+    return rows
+
+
+# Построчная запись, как в прежнем save_to_db: execute и две временные метки на каждую строку
+def legacy_write(conn, rows):
+    cursor = conn.cursor()
+    for row in rows:
+        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        updated_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute('''
+            INSERT INTO market_data (symbol, exchange, market_type, last_price, volume_24h,
+                                     price_usdt, high_price_24h, low_price_24h, trades_24h, timestamp, updated_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol, exchange, market_type) DO UPDATE SET
+                last_price = excluded.last_price,
+                volume_24h = excluded.volume_24h,
+                price_usdt = excluded.price_usdt,
+                high_price_24h = excluded.high_price_24h,
+                low_price_24h = excluded.low_price_24h,
+                trades_24h = excluded.trades_24h,
+                timestamp = excluded.timestamp,
+                updated_time = excluded.updated_time
+        ''', row[:9] + (timestamp, updated_time))
+    conn.commit()
+
+
+def bulk_write(conn, rows):
+    bulk_upsert(conn, 'market_data', COLUMNS, KEY, COLUMNS[3:], rows)
+
+
+def measure(writer, conn_factory, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = conn_factory(os.path.join(tmp, 'bench.db'))
+        create_table(conn)
+
+        started = time.perf_counter()
+        writer(conn, rows)  # Первый снимок: вставка
+        insert_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        writer(conn, rows)  # Второй снимок: обновление существующих строк
+        update_elapsed = time.perf_counter() - started
+
+        conn.close()
+    return len(rows) / insert_elapsed, len(rows) / update_elapsed
+
+
+def main():
+    random.seed(42)
+    timestamp = snapshot_timestamp()
+    print(f"{'instruments':>12} {'writer':>8} {'insert rows/s':>15} {'upsert rows/s':>15}")
+
+    for size in SIZES:
+        rows = generate_rows(size, timestamp)
+        for name, writer, conn_factory in (('legacy', legacy_write, sqlite3.connect),
+                                           ('bulk', bulk_write, connect)):
+            insert_rate, update_rate = measure(writer, conn_factory, rows)
+            print(f"{size:>12} {name:>8} {insert_rate:>15,.0f} {update_rate:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
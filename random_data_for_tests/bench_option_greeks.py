@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Добавляем путь к `src/scripts` в пути поиска Python
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'scripts')))
+
+from option_greeks import black76, implied_volatility, add_greeks
+
+SIZES = (1_000, 10_000, 100_000)
+REPEATS = 5
+
+
+# Синтетическая цепочка: цены получены из Black-76 с известной волатильностью, которую нужно восстановить
+def generate_contracts(count, rng):
+    forward = np.full(count, 60000.0)
+    strike = forward * rng.uniform(0.5, 1.5, count)
+    t = rng.uniform(1 / 365, 1.0, count)
+    sigma = rng.uniform(0.2, 1.5, count)
+    is_call = rng.random(count) < 0.5
+    price, _ = black76(forward, strike, t, sigma, is_call)
+    return price, forward, strike, t, sigma, is_call
+
+
+# Тот же набор в виде DataFrame из options_frame.normalize_options — для замера полного расчёта с греками
+def contracts_frame(price, forward, strike, t, is_call, now):
+    expiry = now + pd.to_timedelta(t * 365 * 24 * 3600, unit='s') - pd.Timedelta(hours=8)
+    return pd.DataFrame({
+        'underlying': 'BTC', 'expiry_date': expiry.strftime('%Y-%m-%d'), 'expiry': expiry,
+        'last_price': price, 'strike_price': strike, 'underlying_price': forward,
+        'option_type': np.where(is_call, 'Call', 'Put'),
+    })
+
+
+def main():
+    rng = np.random.default_rng(42)
+    now = pd.Timestamp('2026-01-01 00:00:00')
+    print(f"{'contracts':>10} {'iv, ms':>8} {'iv+greeks, ms':>14} {'contracts/s':>12} {'solved':>8} {'max |err|':>10}")
+
+    for size in SIZES:
+        price, forward, strike, t, sigma, is_call = generate_contracts(size, rng)
+
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            iv = implied_volatility(price, forward, strike, t, is_call)
+        iv_elapsed = (time.perf_counter() - started) / REPEATS
+
+        frame = contracts_frame(price, forward, strike, t, is_call, now)
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            add_greeks(frame.copy(), 'Binance', now=now)
+        total_elapsed = (time.perf_counter() - started) / REPEATS
+
+        # Если временная стоимость меньше единицы цены, волатильность по ней не восстановить (NaN или
+        # грубая оценка) — такие цены биржи не котируют, в точности они не учитываются
+        solved = np.isfinite(iv)
+        intrinsic = np.where(is_call, np.maximum(forward - strike, 0), np.maximum(strike - forward, 0))
+        quoted = solved & (price - intrinsic >= 1.0)
+        error = np.max(np.abs(iv[quoted] - sigma[quoted])) if quoted.any() else float('nan')
+        print(f"{size:>10} {iv_elapsed * 1000:>8.1f} {total_elapsed * 1000:>14.1f} {size / total_elapsed:>12,.0f} "
+              f"{solved.mean():>8.2%} {error:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+
+# Добавляем путь к `src/scripts` в пути поиска Python
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'scripts')))
+
+from db_writer import connect, bulk_upsert, snapshot_timestamp
+from options_frame import GREEK_COLUMNS, normalize_options, frame_rows
+from opcion_modul import OPCION_DATA_COLUMNS, OPCION_DATA_KEY, OPCION_DATA_UPDATE_COLUMNS
+
+SIZES = (1_000, 10_000, 100_000)
+MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+
+
+def create_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS opcion_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            market_type TEXT NOT NULL,
+            last_price REAL,
+            volume_24h REAL,
+            options REAL,
+            strike_price REAL,
+            option_type TEXT,
+            expiry_date TEXT,
+            exercise_price REAL,
+            price_usdt REAL,
+            high_price_24h REAL,
+            low_price_24h REAL,
+            trades_24h INTEGER,
+            timestamp DATETIME,
+            updated_time DATETIME,
+            underlying_price REAL,
+            iv REAL,
+            delta REAL,
+            gamma REAL,
+            vega REAL,
+            theta REAL,
+            UNIQUE(symbol, exchange, market_type)
+        );
+    ''')
+    conn.commit()
+
+
+# Синтетические ответы бирж: ~30 дат истечения, страйки вокруг цены базового актива
+def generate_payloads(count):
+    expiries = [datetime(2026, 1 + i % 12, 1 + i % 28) for i in range(30)]
+    binance, bybit, okx = [], [], []
+    for i in range(count):
+        expiry = expiries[i % len(expiries)]
+        strike = 1000 * (i // 60 + 1)
+        kind = 'C' if i % 2 else 'P'
+        price = f"{random.uniform(1, 5000):.2f}"
+        binance.append({'symbol': f"BTC-{expiry:%y%m%d}-{strike}-{kind}", 'lastPrice': price, 'high': price,
+                        'low': price, 'volume': f"{random.uniform(0, 100):.2f}", 'tradeCount': random.randint(0, 500),
+                        'strikePrice': f"{strike}.000", 'exercisePrice': "60000.00",
+                        'expiryDate': f"{expiry:%Y-%m-%d}"})
+        bybit.append({'symbol': f"BTC-{expiry.day}{MONTHS[expiry.month - 1]}{expiry:%y}-{strike}-{kind}",
+                      'lastPrice': price, 'highPrice24h': price, 'lowPrice24h': price,
+                      'turnover24h': f"{random.uniform(0, 1e5):.4f}"})
+        okx.append({'instId': f"BTC-USD-{expiry:%y%m%d}-{strike}-{kind}", 'last': price, 'high24h': price,
+                    'low24h': price, 'volCcy24h': f"{random.uniform(0, 100):.4f}"})
+    return {'Binance': binance, 'Bybit': bybit, 'OKEx': okx}
+
+
+# Построчный разбор, как в прежнем opcion_modul.save_to_db: Decimal, strptime и format(x, 'f') на каждую строку
+def legacy_rows(data, exchange, market_type, timestamp):
+    rows = []
+    for item in data:
+        try:
+            if exchange == 'Binance':
+                symbol = item.get('symbol')
+                strike_price = item.get('strikePrice')
+                option_type = 'Call' if symbol.endswith('-C') else 'Put'
+                expiry_date = item.get('expiryDate')
+                exercise_price = item.get('exercisePrice', '0')
+                last_price = Decimal(str(item.get('lastPrice') or '0'))
+                volume_24h = Decimal(str(item.get('volume') or '0'))
+                high_price_24h = Decimal(str(item.get('high') or '0'))
+                low_price_24h = Decimal(str(item.get('low') or '0'))
+                trades_24h = item.get('tradeCount', '0')
+            elif exchange == 'Bybit':
+                symbol = item.get('symbol')
+                underlying_asset, expiry_str, strike_price, option_code = symbol.split('-')
+                option_type = 'Call' if option_code == 'C' else 'Put'
+                expiry_date = datetime.strptime(expiry_str, '%d%b%y').strftime('%Y-%m-%d')
+                exercise_price = strike_price
+                last_price = Decimal(str(item.get('lastPrice') or '0'))
+                volume_24h = Decimal(str(item.get('turnover24h') or '0'))
+                high_price_24h = Decimal(str(item.get('highPrice24h') or '0'))
+                low_price_24h = Decimal(str(item.get('lowPrice24h') or '0'))
+                trades_24h = '0'
+            else:
+                symbol = item.get('instId')
+                underlying_asset, currency, expiry_str, strike_price, option_code = symbol.split('-')
+                option_type = 'Call' if option_code == 'C' else 'Put'
+                expiry_date = datetime.strptime(expiry_str, '%y%m%d').strftime('%Y-%m-%d')
+                exercise_price = strike_price
+                last_price = Decimal(str(item.get('last') or '0'))
+                volume_24h = Decimal(str(item.get('volCcy24h') or '0'))
+                high_price_24h = Decimal(str(item.get('high24h') or '0'))
+                low_price_24h = Decimal(str(item.get('low24h') or '0'))
+                trades_24h = '0'
+
+            price_usdt = volume_24h * last_price
+            rows.append((symbol, exchange, market_type, format(last_price, 'f'), format(volume_24h, 'f'), symbol,
+                         format(price_usdt, 'f'), format(high_price_24h, 'f'), format(low_price_24h, 'f'),
+                         str(trades_24h), strike_price, option_type, expiry_date, exercise_price,
+                         timestamp, timestamp) + (None,) * len(GREEK_COLUMNS))
+        except (InvalidOperation, TypeError, ValueError, KeyError):
+            continue
+    return rows
+
+
+def vectorized_rows(data, exchange, market_type, timestamp):
+    return frame_rows(normalize_options(data, exchange), exchange, market_type, timestamp)
+
+
+def measure(normalizer, payloads, timestamp):
+    """(строк/с разбора, строк/с разбора вместе с записью в базу)."""
+    total = sum(len(data) for data in payloads.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect(os.path.join(tmp, 'bench.db'))
+        create_table(conn)
+
+        started = time.perf_counter()
+        batches = [(exchange, normalizer(data, exchange, 'options', timestamp)) for exchange, data in payloads.items()]
+        parsed = time.perf_counter() - started
+
+        for exchange, rows in batches:
+            bulk_upsert(conn, 'opcion_data', OPCION_DATA_COLUMNS, OPCION_DATA_KEY, OPCION_DATA_UPDATE_COLUMNS, rows)
+        written = time.perf_counter() - started
+        conn.close()
+    return total / parsed, total / written
+
+
+def main():
+    random.seed(42)
+    timestamp = snapshot_timestamp()
+    print(f"{'contracts':>10} {'parser':>11} {'parse rows/s':>14} {'parse+write rows/s':>19}")
+
+    for size in SIZES:
+        payloads = generate_payloads(size // 3)
+        for name, normalizer in (('legacy', legacy_rows), ('vectorized', vectorized_rows)):
+            parse_rate, total_rate = measure(normalizer, payloads, timestamp)
+            print(f"{size:>10} {name:>11} {parse_rate:>14,.0f} {total_rate:>19,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,679 @@
+"""
+Локальный сервер-заменитель Binance, Bybit и OKX для нагрузочной проверки сборщиков.
+
+Сборщики направляются на него переменной окружения EXCHANGE_BASE_URL (см. http_client.resolve_url):
+запрос https://api.binance.com/api/v3/ticker/24hr превращается в <base>/api.binance.com/api/v3/ticker/24hr,
+wss://stream.bybit.com/v5/public/spot — в ws://<base>/stream.bybit.com/v5/public/spot.
+
+Режимы:
+  * синтетический (по умолчанию): N инструментов, цены случайно блуждают между запросами;
+  * --record DIR: запросы проксируются на настоящие биржи, ответы REST и сообщения WebSocket сохраняются в DIR;
+  * --replay DIR: записанные ответы отдаются повторно, недостающие — синтетические.
+
+Задержка, джиттер, доля принудительных ответов 429 и глубина пагинации настраиваются параметрами,
+лимиты бирж (http_client.EXCHANGE_LIMITS) соблюдаются как на настоящих биржах: при превышении — 429.
+Счётчики запросов доступны по адресу /_stats.
+
+Пример:
+    python mock_exchange.py --port 8765 --instruments 2000 --latency 40 --jitter 20 --rate-429 0.02
+    EXCHANGE_BASE_URL=http://127.0.0.1:8765 python ../src/scripts/main.py
+"""
+import os
+import sys
+import json
+import time
+import random
+import re
+import asyncio
+import hashlib
+import math
+import argparse
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import aiohttp
+from aiohttp import web
+
+# Добавляем путь к `src/scripts` в пути поиска Python
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'scripts')))
+
+from http_client import EXCHANGE_LIMITS, DEFAULT_LIMIT
+from option_greeks import black76
+
+QUOTES = ('USDT', 'BTC', 'ETH')
+MAJORS = {'BTC': 60000.0, 'ETH': 3000.0, 'BNB': 550.0, 'SOL': 150.0, 'XRP': 0.5}
+# Хосты WebSocket: путь на тестовом сервере -> исходный адрес биржи (для записи)
+WS_UPSTREAMS = {
+    'stream.binance.com': "wss://stream.binance.com:9443",
+    'fstream.binance.com': "wss://fstream.binance.com",
+    'stream.bybit.com': "wss://stream.bybit.com",
+    'ws.okx.com': "wss://ws.okx.com:8443",
+}
+
+
+class MockConfig:
+    def __init__(self, instruments=500, latency=0.0, jitter=0.0, rate_429=0.0, pages=10, page_size=100,
+                 ws_interval=0.5, seed=1, record_dir=None, replay_dir=None, enforce_limits=True, trade_rate=0.0):
+        self.instruments = instruments
+        self.latency = latency / 1000      # мс -> сек
+        self.jitter = jitter / 1000
+        self.rate_429 = rate_429
+        self.pages = pages
+        self.page_size = page_size
+        self.ws_interval = ws_interval
+        self.seed = seed
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.enforce_limits = enforce_limits
+        self.trade_rate = trade_rate       # новых сделок в секунду на символ (0 — история не растёт)
+
+
+class Universe:
+    """Синтетический набор инструментов: спот, бессрочные контракты, фьючерсы и опционы."""
+
+    def __init__(self, count, seed):
+        self.random = random.Random(seed)
+        self.prices = dict(MAJORS, USDT=1.0)
+        bases = list(MAJORS) + [f"C{i}" for i in range(max(0, count - len(MAJORS)))]
+        for base in bases:
+            self.prices.setdefault(base, self.random.uniform(0.01, 50))
+        # Каждая база торгуется к USDT, часть — ещё к BTC и ETH (кросс-курсы для пересчёта в USDT)
+        self.pairs = [(base, quote) for base in bases for quote in QUOTES
+                      if base != quote and (quote == 'USDT' or self.random.random() < 0.2)]
+        self.bases = bases
+        self.option_underlyings = ['BTC', 'ETH', 'SOL']
+        self.expiries = ['261127', '261225', '270326']
+
+    def tick(self, base, quote):
+        """Следующая цена пары (случайное блуждание) и объём за 24 часа."""
+        self.prices[base] *= 1 + self.random.gauss(0, 0.001)
+        price = self.prices[base] / self.prices[quote]
+        volume = self.random.uniform(10, 10_000)
+        return price, volume
+
+    def option_price(self, underlying, expiry, strike, kind):
+        """Цена опциона в USD по Black-76 с волатильностью около 60% (улыбка по удалённости страйка)."""
+        forward = self.prices[underlying]
+        expiry_time = datetime.strptime(expiry, '%y%m%d') + timedelta(hours=8)
+        years = max((expiry_time - datetime.utcnow()).total_seconds(), 3600) / (365 * 24 * 3600)
+        sigma = 0.6 + 0.5 * abs(math.log(strike / forward)) + self.random.uniform(-0.02, 0.02)
+        price, _ = black76(forward, strike, years, sigma, kind == 'C')
+        return max(float(price), forward * 1e-4)
+
+    def options(self, underlying):
+        spot = self.prices[underlying]
+        strikes = [round(spot * k, -1 if spot > 100 else 0) for k in (0.8, 0.9, 1.0, 1.1, 1.2)]
+        return [(expiry, strike, kind) for expiry in self.expiries for strike in strikes for kind in 'CP']
+
+
+class MockExchange:
+    def __init__(self, config):
+        self.config = config
+        self.universe = Universe(config.instruments, config.seed)
+        self.stats = defaultdict(int)
+        self._windows = defaultdict(deque)  # ключ лимита -> (время, вес) запросов в текущем окне
+        self._trades = {}
+        self._upstream = None
+
+    # Общая обработка: статистика, задержка, лимиты, 429, запись/воспроизведение
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith('/_'):
+            return await handler(request)
+
+        host = request.path.split('/')[1]
+        self.stats['requests'] += 1
+        self.stats[f"requests:{host}"] += 1
+
+        delay = self.config.latency + random.uniform(-self.config.jitter, self.config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if request.headers.get('Upgrade', '').lower() != 'websocket':
+            if self.config.rate_429 and random.random() < self.config.rate_429:
+                self.stats['injected_429'] += 1
+                return web.json_response({'msg': 'Too many requests (injected)'}, status=429,
+                                         headers={'Retry-After': '1'})
+            limited = self._check_limit(host, request)
+            if limited is not None:
+                return limited
+
+            replayed = self._replay(request)
+            if replayed is not None:
+                return replayed
+            if self.config.record_dir:
+                return await self._record(request, host)
+
+        response = await handler(request)
+        used = self._used_weight(host)
+        if used is not None and isinstance(response, web.Response):
+            response.headers['X-MBX-USED-WEIGHT-1M'] = str(used)
+        return response
+
+    def _limit_key(self, host, request):
+        spec = EXCHANGE_LIMITS.get(host, DEFAULT_LIMIT)
+        path = request.path[len(host) + 1:]
+        key = (host, path) if spec['scope'] == 'path' else host
+        single, full = spec.get('weights', {}).get(path, (1, 1))
+        return spec, key, single if 'symbol' in request.query else full
+
+    def _check_limit(self, host, request):
+        spec, key, cost = self._limit_key(host, request)
+        window = self._windows[key]
+        now = time.monotonic()
+        while window and now - window[0][0] > spec['period']:
+            window.popleft()
+        used = sum(weight for _, weight in window)
+        if self.config.enforce_limits and used + cost > spec['capacity']:
+            self.stats['limit_429'] += 1
+            self.stats[f"limit_429:{host}"] += 1
+            retry_after = max(0.1, spec['period'] - (now - window[0][0]))
+            return web.json_response({'msg': 'Rate limit exceeded'}, status=429,
+                                     headers={'Retry-After': f"{retry_after:.1f}"})
+        window.append((now, cost))
+        return None
+
+    def _used_weight(self, host):
+        spec = EXCHANGE_LIMITS.get(host)
+        if not spec or not spec.get('used_header'):
+            return None
+        return int(sum(weight for _, weight in self._windows[host]))
+
+    # Запись и воспроизведение REST
+    @staticmethod
+    def _record_name(request):
+        query = urlencode(sorted(request.query.items()))
+        digest = hashlib.sha1(f"{request.path}?{query}".encode()).hexdigest()[:16]
+        return f"{request.path.strip('/').replace('/', '_')}-{digest}.json"
+
+    def _replay(self, request):
+        if not self.config.replay_dir:
+            return None
+        path = os.path.join(self.config.replay_dir, self._record_name(request))
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            recorded = json.load(f)
+        self.stats['replayed'] += 1
+        return web.Response(text=recorded['body'], status=recorded['status'], content_type='application/json')
+
+    async def _record(self, request, host):
+        if self._upstream is None:
+            self._upstream = aiohttp.ClientSession()
+        url = f"https://{request.path[1:]}"
+        async with self._upstream.get(url, params=request.query) as upstream:
+            body = await upstream.text()
+            status = upstream.status
+        os.makedirs(self.config.record_dir, exist_ok=True)
+        with open(os.path.join(self.config.record_dir, self._record_name(request)), 'w', encoding='utf-8') as f:
+            json.dump({'url': str(request.rel_url), 'status': status, 'body': body}, f)
+        self.stats['recorded'] += 1
+        return web.Response(text=body, status=status, content_type='application/json')
+
+    # Binance
+    async def binance_exchange_info(self, request):
+        pairs = self.universe.pairs
+        return web.json_response({'symbols': [
+            {'symbol': base + quote, 'baseAsset': base, 'quoteAsset': quote, 'marginAsset': quote,
+             'status': 'TRADING', 'contractType': 'PERPETUAL', 'pair': base + quote}
+            for base, quote in pairs]})
+
+    async def binance_ticker(self, request):
+        out = []
+        for base, quote in self.universe.pairs:
+            price, volume = self.universe.tick(base, quote)
+            out.append({'symbol': base + quote, 'lastPrice': f"{price:.8f}", 'highPrice': f"{price * 1.05:.8f}",
+                        'lowPrice': f"{price * 0.95:.8f}", 'volume': f"{volume:.4f}",
+                        'quoteVolume': f"{volume * price:.4f}", 'count': random.randint(100, 100_000)})
+        return web.json_response(out)
+
+    async def binance_premium_index(self, request):
+        out = []
+        next_funding = (int(time.time()) // 28800 + 1) * 28800 * 1000
+        for base, quote in self.universe.pairs:
+            price, _ = self.universe.tick(base, quote)
+            out.append({'symbol': base + quote, 'markPrice': f"{price:.8f}", 'indexPrice': f"{price * 0.9995:.8f}",
+                        'lastFundingRate': f"{random.uniform(-0.0005, 0.0005):.8f}", 'nextFundingTime': next_funding,
+                        'time': int(time.time() * 1000)})
+        symbol = request.query.get('symbol')
+        if symbol:
+            return web.json_response(next((item for item in out if item['symbol'] == symbol), {}))
+        return web.json_response(out)
+
+    async def binance_open_interest(self, request):
+        return web.json_response({'symbol': request.query.get('symbol'),
+                                  'openInterest': f"{random.uniform(1e2, 1e5):.3f}", 'time': int(time.time() * 1000)})
+
+    def _binance_option_symbols(self):
+        for underlying in self.universe.option_underlyings:
+            for expiry, strike, kind in self.universe.options(underlying):
+                yield underlying, f"{underlying}-{expiry}-{strike:g}-{kind}", strike, kind, expiry
+
+    async def binance_options_info(self, request):
+        return web.json_response({'optionSymbols': [
+            {'symbol': symbol, 'underlying': f"{underlying}USDT", 'quoteAsset': 'USDT', 'unit': 1,
+             'strikePrice': str(strike), 'side': 'CALL' if kind == 'C' else 'PUT', 'status': 'TRADING'}
+            for underlying, symbol, strike, kind, _ in self._binance_option_symbols()]})
+
+    async def binance_options_ticker(self, request):
+        out = []
+        for underlying, symbol, strike, kind, expiry in self._binance_option_symbols():
+            price = self.universe.option_price(underlying, expiry, strike, kind)
+            out.append({'symbol': symbol, 'lastPrice': f"{price:.2f}", 'high': f"{price * 1.1:.2f}",
+                        'low': f"{price * 0.9:.2f}", 'volume': f"{random.uniform(1, 100):.2f}",
+                        'amount': f"{random.uniform(100, 10_000):.2f}", 'tradeCount': random.randint(1, 500),
+                        'strikePrice': str(strike), 'exercisePrice': f"{self.universe.prices[underlying]:.2f}"})
+        return web.json_response(out)
+
+    # Bybit
+    @staticmethod
+    def _bybit_expiry(expiry):
+        # 261127 -> 27NOV26
+        months = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+        return f"{int(expiry[4:])}{months[int(expiry[2:4]) - 1]}{expiry[:2]}"
+
+    def _bybit_list(self, category, base_coin=None):
+        if category == 'option':
+            # Как и Bybit: без baseCoin отдаются только опционы BTC, у неизвестных активов цепочка пустая
+            coins = [coin for coin in [base_coin or 'BTC'] if coin in self.universe.option_underlyings]
+            return [{'symbol': f"{coin}-{self._bybit_expiry(expiry)}-{strike:g}-{kind}", 'baseCoin': coin,
+                     'quoteCoin': 'USDC',
+                     'settleCoin': 'USDC', 'optionsType': 'Call' if kind == 'C' else 'Put', 'status': 'Trading'}
+                    for coin in coins for expiry, strike, kind in self.universe.options(coin)]
+        if category == 'inverse':
+            return [{'symbol': f"{base}USD", 'baseCoin': base, 'quoteCoin': 'USD', 'settleCoin': base,
+                     'contractType': 'InversePerpetual', 'status': 'Trading'} for base in ('BTC', 'ETH')]
+        contract_type = {'linear': 'LinearPerpetual'}.get(category)
+        return [{'symbol': base + quote, 'baseCoin': base, 'quoteCoin': quote, 'settleCoin': quote,
+                 'status': 'Trading', **({'contractType': contract_type} if contract_type else {})}
+                for base, quote in self.universe.pairs]
+
+    async def bybit_instruments(self, request):
+        # Пагинация курсором: каталог делится на config.pages страниц
+        items = self._bybit_list(request.query.get('category'), request.query.get('baseCoin'))
+        page_size = max(1, -(-len(items) // max(1, self.config.pages)))
+        # Курсор непрозрачный, как у Bybit ("first%3D...%26last%3D..."): сборщик должен вернуть его экранированным
+        cursor = request.query.get('cursor') or ''
+        match = re.fullmatch(r'first%3D(\d+)%26last%3D\d+', cursor)
+        if cursor and match is None:
+            return web.json_response({'retCode': 10001, 'retMsg': f"invalid cursor: {cursor}", 'result': {}})
+        start = int(match.group(1)) if match else 0
+        page = items[start:start + page_size]
+        end = start + page_size
+        next_cursor = f"first%3D{end}%26last%3D{min(end + page_size, len(items)) - 1}" if end < len(items) else ''
+        return web.json_response({'retCode': 0, 'result': {
+            'category': request.query.get('category'), 'list': page, 'nextPageCursor': next_cursor}})
+
+    async def bybit_tickers(self, request):
+        category = request.query.get('category')
+        out = []
+        for item in self._bybit_list(category, request.query.get('baseCoin')):
+            base, quote = item['baseCoin'], item['quoteCoin']
+            if category == 'option':
+                _, expiry, strike, kind = item['symbol'].split('-')
+                expiry = datetime.strptime(expiry, '%d%b%y').strftime('%y%m%d')
+                price = self.universe.option_price(base, expiry, float(strike), kind)
+                volume = random.uniform(1, 100)
+                underlying = self.universe.prices[base]
+            else:
+                price, volume = self.universe.tick(base, 'USDT' if quote == 'USD' else quote)
+                underlying = price
+            out.append({'symbol': item['symbol'], 'lastPrice': f"{price:.8f}",
+                        'highPrice24h': f"{price * 1.05:.8f}", 'lowPrice24h': f"{price * 0.95:.8f}",
+                        'volume24h': f"{volume:.4f}", 'turnover24h': f"{volume * price:.4f}",
+                        'markPrice': f"{price:.8f}", 'indexPrice': f"{underlying:.8f}",
+                        'underlyingPrice': f"{underlying:.8f}", 'openInterest': f"{volume * 3:.2f}",
+                        'fundingRate': '0.0001'})
+        return web.json_response({'retCode': 0, 'result': {'category': category, 'list': out}})
+
+    # OKX
+    def _okx_instruments(self, inst_type, uly=None):
+        if inst_type == 'SPOT':
+            return [{'instId': f"{base}-{quote}", 'instType': 'SPOT', 'baseCcy': base, 'quoteCcy': quote,
+                     'state': 'live'} for base, quote in self.universe.pairs]
+        if inst_type in ('SWAP', 'FUTURES'):
+            suffixes = ['SWAP'] if inst_type == 'SWAP' else self.universe.expiries
+            return [{'instId': f"{base}-USDT-{suffix}", 'instType': inst_type, 'uly': f"{base}-USDT",
+                     'settleCcy': 'USDT', 'ctVal': '0.01' if base in MAJORS else '10', 'ctValCcy': base,
+                     'ctType': 'linear', 'state': 'live'}
+                    for base in self.universe.bases for suffix in suffixes]
+        if inst_type == 'OPTION':
+            # Как у OKX: опционы отдаются только по базовому активу (uly/instFamily)
+            coins = [coin for coin in [uly.split('-')[0]] if coin in self.universe.option_underlyings] if uly else []
+            return [{'instId': f"{coin}-USD-{expiry}-{strike:g}-{kind}", 'instType': 'OPTION', 'uly': f"{coin}-USD",
+                     'settleCcy': coin, 'ctVal': '1', 'ctValCcy': coin, 'state': 'live'}
+                    for coin in coins for expiry, strike, kind in self.universe.options(coin)]
+        return []
+
+    def _okx_ticker(self, instrument):
+        inst_id = instrument['instId']
+        base = inst_id.split('-')[0]
+        quote = instrument.get('quoteCcy') or 'USDT'
+        if instrument['instType'] == 'OPTION':
+            # Коин-маржинальные опционы OKX котируются в базовой монете
+            _, _, expiry, strike, kind = inst_id.split('-')
+            price = self.universe.option_price(base, expiry, float(strike), kind) / self.universe.prices[base]
+            volume = random.uniform(1, 100)
+        else:
+            price, volume = self.universe.tick(base, quote if quote in self.universe.prices else 'USDT')
+        return {'instId': inst_id, 'instType': instrument['instType'], 'last': f"{price:.8f}",
+                'high24h': f"{price * 1.05:.8f}", 'low24h': f"{price * 0.95:.8f}", 'vol24h': f"{volume:.4f}",
+                'volCcy24h': f"{volume * price:.4f}", 'ts': str(int(time.time() * 1000))}
+
+    @staticmethod
+    def _okx_family(request):
+        # Для опционов OKX требует uly или instFamily, иначе отвечает ошибкой 50014
+        family = request.query.get('uly') or request.query.get('instFamily')
+        if request.query.get('instType') == 'OPTION' and not family:
+            return None, web.json_response(
+                {'code': '50014', 'msg': "Parameter uly or instFamily can not be empty", 'data': []}, status=400)
+        return family, None
+
+    async def okx_instruments(self, request):
+        family, error = self._okx_family(request)
+        if error is not None:
+            return error
+        return web.json_response({'code': '0', 'data': self._okx_instruments(request.query.get('instType'), family)})
+
+    async def okx_tickers(self, request):
+        family, error = self._okx_family(request)
+        if error is not None:
+            return error
+        instruments = self._okx_instruments(request.query.get('instType'), family)
+        return web.json_response({'code': '0', 'data': [self._okx_ticker(i) for i in instruments]})
+
+    async def okx_underlying(self, request):
+        # Базовые активы по типу инструмента: data — один список, как у OKX
+        if request.query.get('instType') == 'OPTION':
+            underlyings = [f"{coin}-USD" for coin in self.universe.option_underlyings]
+        else:
+            underlyings = [f"{base}-USDT" for base in self.universe.bases]
+        return web.json_response({'code': '0', 'data': [underlyings]})
+
+    async def okx_ticker(self, request):
+        inst_id = request.query.get('instId', '')
+        inst_type = 'SWAP' if inst_id.endswith('SWAP') else 'FUTURES' if inst_id.count('-') == 2 else 'SPOT'
+        return web.json_response({'code': '0', 'data': [self._okx_ticker({'instId': inst_id, 'instType': inst_type})]})
+
+    async def okx_open_interest(self, request):
+        inst_id = request.query.get('instId')
+        instruments = ([{'instId': inst_id}] if inst_id
+                       else self._okx_instruments(request.query.get('instType', 'SWAP')))
+        return web.json_response({'code': '0', 'data': [
+            {'instId': i['instId'], 'oi': f"{random.uniform(1e3, 1e6):.0f}", 'oiCcy': f"{random.uniform(10, 1e4):.2f}",
+             'ts': str(int(time.time() * 1000))} for i in instruments]})
+
+    async def okx_mark_price(self, request):
+        out = []
+        for instrument in self._okx_instruments(request.query.get('instType', 'SWAP')):
+            base = instrument['instId'].split('-')[0]
+            price, _ = self.universe.tick(base, 'USDT')
+            out.append({'instId': instrument['instId'], 'instType': instrument['instType'], 'markPx': f"{price:.8f}",
+                        'ts': str(int(time.time() * 1000))})
+        return web.json_response({'code': '0', 'data': out})
+
+    async def okx_funding_rate(self, request):
+        inst_id = request.query.get('instId', 'ANY')
+        instruments = self._okx_instruments('SWAP')
+        if inst_id != 'ANY':
+            instruments = [i for i in instruments if i['instId'] == inst_id]
+        funding_time = (int(time.time()) // 28800 + 1) * 28800 * 1000
+        return web.json_response({'code': '0', 'data': [
+            {'instId': i['instId'], 'instType': 'SWAP', 'fundingRate': f"{random.uniform(-0.0005, 0.0005):.8f}",
+             'fundingTime': str(funding_time), 'nextFundingTime': str(funding_time + 28800 * 1000)}
+            for i in instruments]})
+
+    async def okx_index_tickers(self, request):
+        quote = request.query.get('quoteCcy', 'USDT')
+        out = []
+        for base in self.universe.bases:
+            if quote not in ('USDT', 'USD', 'USDC'):
+                continue
+            price, _ = self.universe.tick(base, 'USDT')
+            out.append({'instId': f"{base}-{quote}", 'idxPx': f"{price * 0.9995:.8f}",
+                        'ts': str(int(time.time() * 1000))})
+        return web.json_response({'code': '0', 'data': out})
+
+    @staticmethod
+    def _okx_trade(inst_id, trade_id, ts):
+        return {'instId': inst_id, 'tradeId': str(trade_id), 'px': f"{random.uniform(1, 100):.4f}",
+                'sz': f"{random.uniform(0.01, 10):.4f}", 'side': random.choice(('buy', 'sell')), 'ts': str(ts)}
+
+    async def okx_history_trades(self, request):
+        # Пагинация по tradeId: у каждого символа config.pages страниц по config.page_size сделок за последние сутки
+        inst_id = request.query.get('instId', '')
+        limit = min(int(request.query.get('limit', 100)), 100)
+        trades = self._trades.get(inst_id)
+        now = int(time.time() * 1000)
+        if trades is None:
+            total = self.config.pages * self.config.page_size
+            step = 24 * 60 * 60 * 1000 // max(1, total)
+            trades = [self._okx_trade(inst_id, 1_000_000 + k, now - (total - k) * step) for k in range(total)]
+            trades.reverse()  # новые сделки первыми, как у OKX
+            self._trades[inst_id] = trades
+        elif self.config.trade_rate:
+            # История растёт: с прошлого запроса появились новые сделки
+            last = trades[0]
+            step = int(1000 / self.config.trade_rate)
+            fresh = [self._okx_trade(inst_id, int(last['tradeId']) + k, int(last['ts']) + k * step)
+                     for k in range(1, (now - int(last['ts'])) // step + 1)]
+            trades[:0] = fresh[::-1]
+        after = request.query.get('after')
+        start = 0
+        if after:
+            start = next((k for k, trade in enumerate(trades) if int(trade['tradeId']) < int(after)), len(trades))
+        return web.json_response({'code': '0', 'data': trades[start:start + limit]})
+
+    # WebSocket: синтетические потоки, запись или воспроизведение
+    async def websocket(self, request):
+        host = request.path.split('/')[1]
+        ws = web.WebSocketResponse(heartbeat=None, max_msg_size=0)
+        await ws.prepare(request)
+        self.stats['ws_connections'] += 1
+
+        record_path = self._ws_record_path(request)
+        if self.config.replay_dir and os.path.exists(os.path.join(self.config.replay_dir, record_path)):
+            await self._ws_replay(ws, os.path.join(self.config.replay_dir, record_path))
+        elif self.config.record_dir:
+            await self._ws_record(ws, request, host, os.path.join(self.config.record_dir, record_path))
+        else:
+            await self._ws_synthetic(ws, request, host)
+        return ws
+
+    @staticmethod
+    def _ws_record_path(request):
+        return 'ws-' + request.path.strip('/').replace('/', '_').replace('!', '').replace('@', '_') + '.jsonl'
+
+    async def _ws_replay(self, ws, path):
+        # Сообщения отправляются с исходными интервалами
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        started = time.monotonic()
+        for record in records:
+            wait = record['t'] - (time.monotonic() - started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if ws.closed:
+                break
+            await ws.send_str(record['data'])
+            self.stats['ws_messages'] += 1
+
+    async def _ws_record(self, ws, request, host, path):
+        if self._upstream is None:
+            self._upstream = aiohttp.ClientSession()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        url = WS_UPSTREAMS[host] + request.path[len(host) + 1:]
+        started = time.monotonic()
+        async with self._upstream.ws_connect(url, max_msg_size=0) as upstream:
+            async def forward_client():
+                async for message in ws:
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        await upstream.send_str(message.data)
+                await upstream.close()
+
+            client_task = asyncio.create_task(forward_client())
+            with open(path, 'w', encoding='utf-8') as f:
+                async for message in upstream:
+                    if message.type != aiohttp.WSMsgType.TEXT or ws.closed:
+                        break
+                    f.write(json.dumps({'t': round(time.monotonic() - started, 3), 'data': message.data}) + '\n')
+                    await ws.send_str(message.data)
+                    self.stats['ws_messages'] += 1
+            client_task.cancel()
+
+    async def _ws_synthetic(self, ws, request, host):
+        subscriptions = set()
+
+        async def pump():
+            while not ws.closed:
+                for message in self._ws_messages(host, request.path, subscriptions):
+                    await ws.send_str(message)
+                    self.stats['ws_messages'] += 1
+                await asyncio.sleep(self.config.ws_interval)
+
+        task = asyncio.create_task(pump())
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                if message.data == 'ping':
+                    await ws.send_str('pong')
+                    continue
+                payload = json.loads(message.data)
+                if payload.get('op') == 'ping':
+                    await ws.send_str(json.dumps({'op': 'pong', 'success': True}))
+                elif payload.get('op') == 'subscribe':
+                    for arg in payload.get('args', []):
+                        subscriptions.add(json.dumps(arg, sort_keys=True) if isinstance(arg, dict) else arg)
+                    await ws.send_str(json.dumps({'op': 'subscribe', 'success': True, 'event': 'subscribe'}))
+        finally:
+            task.cancel()
+
+    def _ws_messages(self, host, path, subscriptions):
+        universe = self.universe
+        now = int(time.time() * 1000)
+        sample = max(1, len(universe.pairs) // 10)
+        if host in ('stream.binance.com', 'fstream.binance.com'):
+            out = []
+            for base, quote in random.sample(universe.pairs, sample):
+                price, volume = universe.tick(base, quote)
+                out.append({'e': '24hrTicker', 'E': now, 's': base + quote, 'c': f"{price:.8f}",
+                            'h': f"{price * 1.05:.8f}", 'l': f"{price * 0.95:.8f}", 'v': f"{volume:.4f}",
+                            'q': f"{volume * price:.4f}", 'n': random.randint(100, 100_000)})
+            return [json.dumps(out)]
+
+        messages = []
+        topics = list(subscriptions)
+        for topic in random.sample(topics, min(len(topics), sample)):
+            if host == 'stream.bybit.com':
+                channel, symbol = topic.split('.', 1)
+                price = random.uniform(1, 100)
+                if channel == 'tickers':
+                    messages.append(json.dumps({'topic': topic, 'type': 'delta', 'ts': now, 'data': {
+                        'symbol': symbol, 'lastPrice': f"{price:.6f}", 'volume24h': f"{random.uniform(10, 1e4):.2f}"}}))
+                elif channel == 'publicTrade':
+                    messages.append(json.dumps({'topic': topic, 'type': 'snapshot', 'ts': now, 'data': [{
+                        'T': now, 's': symbol, 'S': random.choice(('Buy', 'Sell')), 'v': f"{random.uniform(0.01, 5):.4f}",
+                        'p': f"{price:.6f}", 'i': f"{now}-{random.getrandbits(32)}"}]}))
+            elif host == 'ws.okx.com':
+                arg = json.loads(topic)
+                price = random.uniform(1, 100)
+                if arg.get('channel') == 'tickers':
+                    data = {'instId': arg['instId'], 'last': f"{price:.6f}", 'vol24h': f"{random.uniform(10, 1e4):.2f}",
+                            'volCcy24h': f"{random.uniform(1e3, 1e6):.2f}", 'ts': str(now)}
+                else:
+                    data = {'instId': arg['instId'], 'tradeId': str(random.getrandbits(40)), 'px': f"{price:.6f}",
+                            'sz': f"{random.uniform(0.01, 5):.4f}", 'side': random.choice(('buy', 'sell')), 'ts': str(now)}
+                messages.append(json.dumps({'arg': arg, 'data': [data]}))
+        return messages
+
+    async def stats_handler(self, request):
+        return web.json_response(dict(self.stats))
+
+    async def reset_stats(self, request):
+        self.stats.clear()
+        self._windows.clear()
+        return web.json_response({'ok': True})
+
+    def app(self):
+        app = web.Application(middlewares=[self.middleware])
+        routes = [
+            ('/api.binance.com/api/v3/exchangeInfo', self.binance_exchange_info),
+            ('/api.binance.com/api/v3/ticker/24hr', self.binance_ticker),
+            ('/fapi.binance.com/fapi/v1/exchangeInfo', self.binance_exchange_info),
+            ('/fapi.binance.com/fapi/v1/ticker/24hr', self.binance_ticker),
+            ('/fapi.binance.com/fapi/v1/premiumIndex', self.binance_premium_index),
+            ('/fapi.binance.com/fapi/v1/openInterest', self.binance_open_interest),
+            ('/eapi.binance.com/eapi/v1/exchangeInfo', self.binance_options_info),
+            ('/eapi.binance.com/eapi/v1/ticker', self.binance_options_ticker),
+            ('/api.bybit.com/v5/market/instruments-info', self.bybit_instruments),
+            ('/api.bybit.com/v5/market/tickers', self.bybit_tickers),
+            ('/www.okx.com/api/v5/public/instruments', self.okx_instruments),
+            ('/www.okx.com/api/v5/public/underlying', self.okx_underlying),
+            ('/www.okx.com/api/v5/market/tickers', self.okx_tickers),
+            ('/www.okx.com/api/v5/market/ticker', self.okx_ticker),
+            ('/www.okx.com/api/v5/public/open-interest', self.okx_open_interest),
+            ('/www.okx.com/api/v5/public/mark-price', self.okx_mark_price),
+            ('/www.okx.com/api/v5/public/funding-rate', self.okx_funding_rate),
+            ('/www.okx.com/api/v5/market/index-tickers', self.okx_index_tickers),
+            ('/www.okx.com/api/v5/market/history-trades', self.okx_history_trades),
+            ('/stream.binance.com/ws/{stream:.*}', self.websocket),
+            ('/fstream.binance.com/ws/{stream:.*}', self.websocket),
+            ('/stream.bybit.com/v5/public/{category}', self.websocket),
+            ('/ws.okx.com/ws/v5/public', self.websocket),
+            ('/_stats', self.stats_handler),
+        ]
+        for path, handler in routes:
+            app.router.add_get(path, handler)
+        app.router.add_post('/_stats/reset', self.reset_stats)
+
+        async def close_upstream(app):
+            if self._upstream is not None:
+                await self._upstream.close()
+        app.on_cleanup.append(close_upstream)
+        return app
+
+
+async def start_server(config, host='127.0.0.1', port=8765):
+    """Запускает сервер в текущем цикле событий; возвращает (runner, exchange) для остановки и статистики."""
+    exchange = MockExchange(config)
+    runner = web.AppRunner(exchange.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, exchange
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Локальный сервер-заменитель бирж для нагрузочной проверки сборщиков")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--instruments', type=int, default=500, help="число базовых активов")
+    parser.add_argument('--latency', type=float, default=0, help="задержка ответа, мс")
+    parser.add_argument('--jitter', type=float, default=0, help="разброс задержки, мс")
+    parser.add_argument('--rate-429', type=float, default=0, help="доля случайных ответов 429")
+    parser.add_argument('--pages', type=int, default=10, help="глубина пагинации (страниц на символ/каталог)")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--ws-interval', type=float, default=0.5, help="интервал сообщений WebSocket, сек")
+    parser.add_argument('--no-limits', action='store_true', help="не отвечать 429 при превышении лимитов бирж")
+    parser.add_argument('--trade-rate', type=float, default=0,
+                        help="новых сделок в секунду на символ в истории OKX (0 — история не растёт)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--record', metavar='DIR', help="проксировать запросы на биржи и записывать ответы")
+    parser.add_argument('--replay', metavar='DIR', help="воспроизводить записанные ответы")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = MockConfig(instruments=args.instruments, latency=args.latency, jitter=args.jitter,
+                        rate_429=args.rate_429, pages=args.pages, page_size=args.page_size,
+                        ws_interval=args.ws_interval, seed=args.seed, record_dir=args.record,
+                        replay_dir=args.replay, enforce_limits=not args.no_limits, trade_rate=args.trade_rate)
+    print(f"Тестовый сервер бирж: http://{args.host}:{args.port} "
+          f"(EXCHANGE_BASE_URL=http://{args.host}:{args.port})")
+    web.run_app(MockExchange(config).app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 import pandas as pd
 import sqlite3
 import os
+import sys
+import time
+import threading
 
 # main_logic.py (или файл, где вы объявляете DATABASE_CONFIG)
 import os
@@ -9,6 +12,44 @@ import os
 # Задаем базовый путь к директории `databases`
 DATABASE_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../databases"))
 
+# Добавляем путь к `scripts`, чтобы использовать общие модули сборщиков
+SCRIPTS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "scripts"))
+if SCRIPTS_PATH not in sys.path:
+    sys.path.append(SCRIPTS_PATH)
+
+from market_history import MarketHistory
+from instrument_cache import InstrumentCache
+from symbol_registry import canonical_symbol, registry_from_cache
+from option_chain import CHAIN_COLUMNS, OptionChain, OptionChainIndex
+from options_archive import archive_summary, load_archive
+
+HISTORY_DB_PATH = os.path.join(DATABASE_BASE_PATH, "market_history.db")
+HISTORY_COLUMNS = ["ts", "open", "high", "low", "close", "volume_24h", "price_usdt"]
+
+# Индекс цепочек опционов в памяти: перестраивается по изменениям opcion_data
+OPTIONS_DB_PATH = os.path.join(DATABASE_BASE_PATH, "opcion_data.db")
+OPTION_CHAIN_INDEX = OptionChainIndex(OPTIONS_DB_PATH)
+# Колонки лестницы страйков: коллы слева, страйк посередине, путы справа
+OPTION_CHAIN_COLUMNS = [
+    "call_symbol", "call_volume_24h", "call_delta", "call_iv", "call_last_price", "strike",
+    "put_last_price", "put_iv", "put_delta", "put_volume_24h", "put_symbol"
+]
+
+# Метрики деривативов всех бирж (derivatives.py): добавляются к фьючерсам по (symbol, exchange)
+DERIVATIVES_DB_PATH = os.path.join(DATABASE_BASE_PATH, "derivatives_data.db")
+DERIVATIVES_COLUMNS = [
+    "contract_size", "mark_price", "index_price", "basis_rate", "funding_rate",
+    "open_interest_contracts", "open_interest_base", "open_interest_usd"
+]
+
+# Каталоги инструментов, по которым строится реестр символов
+INSTRUMENT_CACHE_PATH = os.path.join(DATABASE_BASE_PATH, "instrument_cache.db")
+# Колонки из реестра символов: одинаковы для инструмента на всех биржах
+REGISTRY_COLUMNS = ["base_asset", "quote_asset", "kind", "canonical_symbol"]
+# Реестр символов процесса: перестраивается, только когда меняется файл кэша каталогов (по mtime)
+_symbol_registry = {"mtime": None, "registry": None}
+_symbol_registry_lock = threading.Lock()
+
 # Конфигурация баз данных с использованием абсолютных путей
 DATABASE_CONFIG = {
     "Binance": {
@@ -79,7 +120,9 @@ DATABASE_CONFIG = {
         "options": {
             "main": {
                 "db_path": os.path.join(DATABASE_BASE_PATH, "opcion_data.db"),
-                "table": "opcion_data"
+                "table": "opcion_data",
+                # Сборщик опционов записывает биржу как OKEx
+                "exchange": "OKEx"
             }
         }
     }
@@ -97,16 +140,19 @@ UNIFIED_COLUMNS = [
 COLUMN_CONFIG = {
     "spot": [
         "symbol", "exchange", "market_type", "last_price", "volume_24h",
-        "price_usdt", "high_price_24h", "low_price_24h", "trades_24h", "timestamp"
+        "price_usdt", "high_price_24h", "low_price_24h", "trades_24h", "timestamp",
+        "base_asset", "quote_asset", "kind", "canonical_symbol"
     ],
     "futures": [
         "symbol", "exchange", "market_type", "last_price", "volume_24h",
-        "price_usdt", "high_price_24h", "low_price_24h", "trades_24h", "timestamp"
-    ],
+        "price_usdt", "high_price_24h", "low_price_24h", "trades_24h", "timestamp",
+        "base_asset", "quote_asset", "kind", "canonical_symbol"
+    ] + DERIVATIVES_COLUMNS,
     "options": [
         "symbol", "exchange", "market_type", "last_price", "volume_24h", "price_usdt",
         "high_price_24h", "low_price_24h", "trades_24h", "timestamp",
-        "strike_price", "option_type", "expiry_date", "exercise_price"
+        "strike_price", "option_type", "expiry_date", "exercise_price",
+        "underlying_price", "iv", "delta", "gamma", "vega", "theta"
     ]
 }
 
@@ -123,8 +169,59 @@ def standardize_columns(df, exchange, market_type):
 
     return df[required_columns]
 
+# Реестр символов по каталогам из кэша (без сетевых запросов); каталоги перечитываются только после их изменения
+def load_symbol_registry():
+    try:
+        mtime = os.stat(INSTRUMENT_CACHE_PATH).st_mtime_ns
+    except OSError:
+        return None
+    with _symbol_registry_lock:
+        if _symbol_registry["mtime"] != mtime:
+            # Новый InstrumentCache: у прежнего в памяти остались старые каталоги
+            _symbol_registry["registry"] = registry_from_cache(InstrumentCache(INSTRUMENT_CACHE_PATH))
+            _symbol_registry["mtime"] = mtime
+        return _symbol_registry["registry"]
+
+# Функция для добавления базовой/котируемой валюты, вида и единого имени инструмента
+def add_registry_columns(df, exchange, market_type, registry=None):
+    registry = registry or load_symbol_registry()
+    if registry is None or df.empty:
+        for col in REGISTRY_COLUMNS:
+            df[col] = None
+        return df
+
+    # Один проход по символам: для каждого одно обращение к словарю реестра
+    assets = [registry.resolve(exchange, market_type, symbol) or (None, None, None) for symbol in df["symbol"]]
+    df["base_asset"], df["quote_asset"], df["kind"] = zip(*assets) if assets else ((), (), ())
+    df["canonical_symbol"] = [canonical_symbol(*asset) for asset in assets]
+    return df
+
+# Функция для извлечения метрик деривативов (открытый интерес, фандинг, марк-цена, базис) одной или всех бирж
+def fetch_derivatives_data(exchange=None):
+    if not os.path.exists(DERIVATIVES_DB_PATH):
+        return pd.DataFrame(columns=["symbol", "exchange"] + DERIVATIVES_COLUMNS)
+
+    conn = sqlite3.connect(DERIVATIVES_DB_PATH)
+    try:
+        query = "SELECT * FROM derivatives_data" + (" WHERE exchange = ?" if exchange else "")
+        return pd.read_sql_query(query, conn, params=(exchange,) if exchange else None)
+    except (sqlite3.OperationalError, pd.errors.DatabaseError):
+        print(f"Таблица derivatives_data не найдена в базе данных {DERIVATIVES_DB_PATH}.")
+        return pd.DataFrame(columns=["symbol", "exchange"] + DERIVATIVES_COLUMNS)
+    finally:
+        conn.close()
+
+# Функция для добавления метрик деривативов к фьючерсам биржи
+def add_derivatives_columns(df, exchange):
+    derivatives = fetch_derivatives_data(exchange).set_index("symbol")
+    for col in DERIVATIVES_COLUMNS:
+        values = df["symbol"].map(derivatives[col]) if col in derivatives else pd.Series(None, index=df.index)
+        # Собственные колонки таблицы биржи (например, futures_data OKX) остаются, если метрик нет
+        df[col] = values.combine_first(df[col]) if col in df.columns else values
+    return df
+
 # Функция для извлечения данных из базы данных
-def fetch_data_from_db(exchange=None, market_type=None):
+def fetch_data_from_db(exchange=None, market_type=None, registry=None):
     if not exchange or not market_type:
         return pd.DataFrame(columns=UNIFIED_COLUMNS)
 
@@ -142,8 +239,9 @@ def fetch_data_from_db(exchange=None, market_type=None):
 
     conn_main = sqlite3.connect(db_path_main)
     try:
-        query = f"SELECT * FROM {table_main} WHERE market_type = '{market_type}'"
-        main_df = pd.read_sql_query(query, conn_main)
+        # Таблицы общие для всех бирж: строки отбираются и по рынку, и по бирже
+        query = f"SELECT * FROM {table_main} WHERE market_type = ? AND exchange = ?"
+        main_df = pd.read_sql_query(query, conn_main, params=(market_type, config["main"].get("exchange", exchange)))
     except sqlite3.OperationalError:
         print(f"Таблица {table_main} не найдена в базе данных {db_path_main}.")
         return pd.DataFrame(columns=COLUMN_CONFIG.get(market_type, UNIFIED_COLUMNS))
@@ -162,9 +260,26 @@ def fetch_data_from_db(exchange=None, market_type=None):
     elif exchange == "OKX":
         main_df = fetch_okx_trades_data(main_df, exchange)
 
+    if market_type in ("spot", "futures"):
+        main_df = add_registry_columns(main_df, exchange, market_type, registry)
+    if market_type == "futures":
+        main_df = add_derivatives_columns(main_df, exchange)
+
     main_df = standardize_columns(main_df, exchange, market_type)
     return main_df
 
+# Функция для объединения одного инструмента на всех биржах: строка на canonical_symbol, колонка на биржу
+def fetch_cross_exchange_data(market_type, value_column="price_usdt"):
+    registry = load_symbol_registry()
+    frames = [fetch_data_from_db(exchange, market_type, registry) for exchange in DATABASE_CONFIG]
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=["canonical_symbol"])
+
+    df = pd.concat(frames, ignore_index=True).dropna(subset=["canonical_symbol"])
+    return df.pivot_table(index="canonical_symbol", columns="exchange", values=value_column,
+                          aggfunc="last").reset_index()
+
 # Функция для извлечения данных о трейдах с Bybit
 def fetch_bybit_trades_data(df, exchange):
     config_trades = DATABASE_CONFIG.get(exchange, {}).get("spot", {}).get("trades", None)
@@ -183,6 +298,8 @@ def fetch_bybit_trades_data(df, exchange):
     try:
         trades_df = pd.read_sql_query(
             f"SELECT symbol, total_trades FROM {table_trades} WHERE exchange = '{exchange}'", conn_trades)
+        # Количество сделок из базы трейдов заменяет значение сборщика, а не дублирует колонку
+        df = df.drop(columns=['trades_24h'], errors='ignore')
         df = df.merge(trades_df[['symbol', 'total_trades']], on='symbol', how='left')
         df.rename(columns={"total_trades": "trades_24h"}, inplace=True)
     except sqlite3.OperationalError:
@@ -210,6 +327,8 @@ def fetch_okx_trades_data(df, exchange):
     try:
         trades_df = pd.read_sql_query(
             f"SELECT symbol, total_trades FROM {table_trades} WHERE exchange = '{exchange}'", conn_trades)
+        # Количество сделок из базы трейдов заменяет значение сборщика, а не дублирует колонку
+        df = df.drop(columns=['trades_24h'], errors='ignore')
         df = df.merge(trades_df[['symbol', 'total_trades']], on='symbol', how='left')
         df.rename(columns={"total_trades": "trades_24h"}, inplace=True)
     except sqlite3.OperationalError:
@@ -218,3 +337,66 @@ def fetch_okx_trades_data(df, exchange):
         conn_trades.close()
 
     return df
+
+# Функция для выбора цепочки опционов: биржи, базовые активы биржи и даты истечения актива
+def fetch_option_chain_choices(exchange=None, underlying=None):
+    OPTION_CHAIN_INDEX.refresh()
+    if exchange is None:
+        return OPTION_CHAIN_INDEX.exchanges()
+    if underlying is None:
+        return OPTION_CHAIN_INDEX.underlyings(exchange)
+    return OPTION_CHAIN_INDEX.expiries(exchange, underlying)
+
+# Функция для извлечения лестницы страйков одной цепочки (count — число страйков вокруг страйка «у денег»)
+def fetch_option_chain(exchange, underlying, expiry, count=None):
+    OPTION_CHAIN_INDEX.refresh()
+    ladder = OPTION_CHAIN_INDEX.ladder(exchange, underlying, expiry, count=count)
+    if ladder is None:
+        return pd.DataFrame(columns=OPTION_CHAIN_COLUMNS)
+    return pd.DataFrame(ladder)
+
+# Функция для извлечения истёкших опционов из архива (распаковываются только подходящие цепочки)
+def fetch_archived_options(exchange=None, underlying=None, expiry_from=None, expiry_to=None):
+    if not os.path.exists(OPTIONS_DB_PATH):
+        print(f"База данных {OPTIONS_DB_PATH} не существует.")
+        return pd.DataFrame()
+    return load_archive(OPTIONS_DB_PATH, exchange, underlying, expiry_from, expiry_to)
+
+# Функция для выбора архивной цепочки: биржи, базовые активы биржи и даты истечения (новые первыми)
+def fetch_archived_option_chain_choices(exchange=None, underlying=None):
+    if not os.path.exists(OPTIONS_DB_PATH):
+        return []
+    summary = archive_summary(OPTIONS_DB_PATH)
+    if exchange is None:
+        return sorted(summary["exchange"].unique())
+    summary = summary[summary["exchange"] == exchange]
+    if underlying is None:
+        return sorted(summary["underlying"].unique())
+    return sorted(summary.loc[summary["underlying"] == underlying, "expiry_date"], reverse=True)
+
+# Функция для извлечения лестницы страйков истёкшей цепочки из архива (в том же виде, что и у текущих)
+def fetch_archived_option_chain(exchange, underlying, expiry, count=None):
+    df = fetch_archived_options(exchange, underlying, expiry, expiry)
+    if df.empty:
+        return pd.DataFrame(columns=OPTION_CHAIN_COLUMNS)
+
+    columns = tuple(column for column in CHAIN_COLUMNS if column in df.columns)
+    rows = {record["symbol"]: (record["strike_price"], record["option_type"], [record[column] for column in columns])
+            for record in df.to_dict("records") if record["strike_price"] is not None}
+    return pd.DataFrame(OptionChain(rows, columns).ladder(count=count)).reindex(columns=OPTION_CHAIN_COLUMNS)
+
+# Функция для извлечения истории инструмента (разрешение 1m/1h/1d выбирается по длине периода)
+def fetch_history_from_db(exchange, market_type, symbol, start, end=None):
+    if not os.path.exists(HISTORY_DB_PATH):
+        print(f"База данных {HISTORY_DB_PATH} не существует.")
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    history = MarketHistory(HISTORY_DB_PATH)
+    try:
+        _, rows = history.query(symbol, exchange, market_type, start, end or time.time())
+    finally:
+        history.close()
+
+    df = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+    df["ts"] = pd.to_datetime(df["ts"], unit="s")
+    return df
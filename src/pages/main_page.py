@@ -1,9 +1,52 @@
 # pages/main_page.py
-from dash import dash_table, dcc, html, Input, Output
+import time
+
+from dash import ctx, dash_table, dcc, html, no_update, Input, Output, State
 import dash_bootstrap_components as dbc
 # src/pages/main_page.py
 from src.app_instance import app
-from src.main_logic import fetch_data_from_db, COLUMN_CONFIG, UNIFIED_COLUMNS
+from src.main_logic import (fetch_data_from_db, fetch_cross_exchange_data, fetch_history_from_db, fetch_option_chain,
+                            fetch_option_chain_choices, fetch_archived_option_chain,
+                            fetch_archived_option_chain_choices, COLUMN_CONFIG, UNIFIED_COLUMNS, OPTION_CHAIN_COLUMNS)
+
+TABLE_CELL_STYLE = {
+    'textAlign': 'center',
+    'padding': '5px',
+    'whiteSpace': 'normal',
+    'height': 'auto',
+    'backgroundColor': '#1e1e1e',
+    'color': '#FFFFFF'
+}
+TABLE_HEADER_STYLE = {
+    'fontWeight': 'bold',
+    'backgroundColor': '#1e1e1e',
+    'color': '#FFFFFF'
+}
+
+# Периоды графика истории, сек (разрешение 1m/1h/1d подбирается в fetch_history_from_db)
+HISTORY_PERIODS = {'1h': 60 * 60, '24h': 24 * 60 * 60, '7d': 7 * 24 * 60 * 60, '30d': 30 * 24 * 60 * 60}
+
+# Значения, которые сравниваются между биржами в таблице Cross-Exchange
+CROSS_EXCHANGE_VALUES = {'last_price': 'Последняя цена', 'price_usdt': 'Оборот в USDT', 'volume_24h': 'Объём за 24 ч'}
+
+# Источники цепочек опционов: (выбор биржи/актива/даты, лестница страйков) для текущих и архивных контрактов
+OPTION_CHAIN_SOURCES = {
+    'live': (fetch_option_chain_choices, fetch_option_chain),
+    'archive': (fetch_archived_option_chain_choices, fetch_archived_option_chain),
+}
+
+
+def column_defs(columns):
+    return [{"name": col.capitalize().replace('_', ' '), "id": col} for col in columns]
+
+
+def history_figure(df=None):
+    figure = {'data': [], 'layout': {'template': 'plotly_dark', 'margin': {'t': 20, 'b': 40},
+                                     'xaxis': {'rangeslider': {'visible': False}}}}
+    if df is not None and not df.empty:
+        figure['data'].append({'type': 'candlestick', 'x': df['ts'], 'open': df['open'], 'high': df['high'],
+                               'low': df['low'], 'close': df['close'], 'name': 'OHLC'})
+    return figure
 
 
 def main_page_layout():
@@ -43,26 +86,133 @@ def main_page_layout():
             dbc.Col(
                 dash_table.DataTable(
                     id='market_data_table',
-                    columns=[{"name": col.capitalize().replace('_', ' '), "id": col} for col in COLUMN_CONFIG["spot"]],
+                    columns=column_defs(COLUMN_CONFIG["spot"]),
                     data=[],
                     sort_action="native",
                     sort_mode="multi",
                     filter_action="native",
                     page_size=20,
                     style_table={'overflowX': 'auto'},
-                    style_cell={
-                        'textAlign': 'center',
-                        'padding': '5px',
-                        'whiteSpace': 'normal',
-                        'height': 'auto',
-                        'backgroundColor': '#1e1e1e',
-                        'color': '#FFFFFF'
-                    },
-                    style_header={
-                        'fontWeight': 'bold',
-                        'backgroundColor': '#1e1e1e',
-                        'color': '#FFFFFF'
-                    }
+                    style_cell=TABLE_CELL_STYLE,
+                    style_header=TABLE_HEADER_STYLE
+                ),
+                width=12
+            )
+        ]),
+        dbc.Row([
+            dbc.Col(html.H3("Cross-Exchange", style={'textAlign': 'center', 'margin-top': '20px'}), width=12)
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(
+                    id='cross-exchange-value',
+                    options=[{'label': label, 'value': value} for value, label in CROSS_EXCHANGE_VALUES.items()],
+                    value='last_price',
+                    clearable=False,
+                    style={'width': '100%', 'margin-bottom': '10px'}
+                ),
+                width=4
+            ),
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dash_table.DataTable(
+                    id='cross_exchange_table',
+                    columns=column_defs(['canonical_symbol']),
+                    data=[],
+                    sort_action="native",
+                    filter_action="native",
+                    page_size=20,
+                    style_table={'overflowX': 'auto'},
+                    style_cell=TABLE_CELL_STYLE,
+                    style_header=TABLE_HEADER_STYLE
+                ),
+                width=12
+            )
+        ]),
+        dbc.Row([
+            dbc.Col(html.H3("Price History", style={'textAlign': 'center', 'margin-top': '20px'}), width=12)
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(id='history-symbol', options=[], placeholder='Инструмент',
+                             style={'width': '100%', 'margin-bottom': '10px'}),
+                width=8
+            ),
+            dbc.Col(
+                dcc.Dropdown(
+                    id='history-period',
+                    options=[{'label': period, 'value': period} for period in HISTORY_PERIODS],
+                    value='24h',
+                    clearable=False,
+                    style={'width': '100%', 'margin-bottom': '10px'}
+                ),
+                width=4
+            ),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='history-graph', figure=history_figure()), width=12)
+        ]),
+        dbc.Row([
+            dbc.Col(html.H3("Options Chain", style={'textAlign': 'center', 'margin-top': '20px'}), width=12)
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(
+                    id='option-chain-source',
+                    options=[
+                        {'label': 'Текущие', 'value': 'live'},
+                        {'label': 'Архив истёкших', 'value': 'archive'}
+                    ],
+                    value='live',
+                    clearable=False,
+                    style={'width': '100%', 'margin-bottom': '10px'}
+                ),
+                width=2
+            ),
+            dbc.Col(
+                dcc.Dropdown(id='option-chain-exchange', options=[], placeholder='Биржа',
+                             style={'width': '100%', 'margin-bottom': '10px'}),
+                width=2
+            ),
+            dbc.Col(
+                dcc.Dropdown(id='option-chain-underlying', options=[], placeholder='Базовый актив',
+                             style={'width': '100%', 'margin-bottom': '10px'}),
+                width=2
+            ),
+            dbc.Col(
+                dcc.Dropdown(id='option-chain-expiry', options=[], placeholder='Дата истечения',
+                             style={'width': '100%', 'margin-bottom': '10px'}),
+                width=3
+            ),
+            dbc.Col(
+                dcc.Dropdown(
+                    id='option-chain-strikes',
+                    options=[
+                        {'label': '10 страйков у денег', 'value': 10},
+                        {'label': '20 страйков у денег', 'value': 20},
+                        {'label': 'Все страйки', 'value': 0}
+                    ],
+                    value=10,
+                    clearable=False,
+                    style={'width': '100%', 'margin-bottom': '10px'}
+                ),
+                width=3
+            ),
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dash_table.DataTable(
+                    id='option_chain_table',
+                    columns=column_defs(OPTION_CHAIN_COLUMNS),
+                    data=[],
+                    page_size=50,
+                    style_table={'overflowX': 'auto'},
+                    style_cell=TABLE_CELL_STYLE,
+                    style_header=TABLE_HEADER_STYLE,
+                    style_data_conditional=[
+                        {'if': {'column_id': 'strike'}, 'fontWeight': 'bold', 'backgroundColor': '#2a2a2a'}
+                    ]
                 ),
                 width=12
             )
@@ -78,14 +228,116 @@ def main_page_layout():
 )
 def update_table(exchange, market_type):
     if not exchange or not market_type:
-        return [], [{"name": col.capitalize().replace('_', ' '), "id": col} for col in UNIFIED_COLUMNS]
+        return [], column_defs(UNIFIED_COLUMNS)
 
     df = fetch_data_from_db(exchange, market_type)
     if df.empty:
-        return [], [{"name": col.capitalize().replace('_', ' '), "id": col} for col in
-                    COLUMN_CONFIG.get(market_type, UNIFIED_COLUMNS)]
+        return [], column_defs(COLUMN_CONFIG.get(market_type, UNIFIED_COLUMNS))
 
     selected_columns = COLUMN_CONFIG.get(market_type, UNIFIED_COLUMNS)
-    columns = [{"name": col.capitalize().replace('_', ' '), "id": col} for col in selected_columns]
+    columns = column_defs(selected_columns)
 
     return df.to_dict('records'), columns
+
+
+# Колбек сравнения бирж: строка на инструмент (canonical_symbol из реестра символов), колонка на биржу
+@app.callback(
+    [Output('cross_exchange_table', 'data'),
+     Output('cross_exchange_table', 'columns')],
+    [Input('market-type-filter', 'value'),
+     Input('cross-exchange-value', 'value')]
+)
+def update_cross_exchange(market_type, value_column):
+    if market_type not in ('spot', 'futures'):
+        return [], column_defs(['canonical_symbol'])
+    df = fetch_cross_exchange_data(market_type, value_column)
+    return df.to_dict('records'), column_defs(df.columns)
+
+
+# Колбеки истории: инструменты берутся из текущей таблицы, по клику на строку выбирается её инструмент
+@app.callback(
+    [Output('history-symbol', 'options'),
+     Output('history-symbol', 'value')],
+    [Input('market_data_table', 'data'),
+     Input('market_data_table', 'active_cell')],
+    State('market_data_table', 'derived_viewport_data')
+)
+def update_history_symbols(data, active_cell, viewport):
+    options = [{'label': symbol, 'value': symbol}
+               for symbol in sorted({row['symbol'] for row in data or [] if row.get('symbol')})]
+    # Новая таблица сбрасывает выбор, клик по ячейке выбирает инструмент её строки
+    if ctx.triggered_id != 'market_data_table' or not ctx.triggered[0]['prop_id'].endswith('active_cell'):
+        return options, None
+    if not active_cell or not viewport or active_cell['row'] >= len(viewport):
+        return options, no_update
+    return options, viewport[active_cell['row']].get('symbol')
+
+
+@app.callback(
+    Output('history-graph', 'figure'),
+    [Input('exchange-filter', 'value'),
+     Input('market-type-filter', 'value'),
+     Input('history-symbol', 'value'),
+     Input('history-period', 'value')]
+)
+def update_history(exchange, market_type, symbol, period):
+    if not exchange or not market_type or not symbol:
+        return history_figure()
+    start = time.time() - HISTORY_PERIODS.get(period, HISTORY_PERIODS['24h'])
+    return history_figure(fetch_history_from_db(exchange, market_type, symbol, start))
+
+
+# Колбеки цепочки опционов: выбор источника -> биржи -> базового актива -> даты истечения -> лестница страйков
+@app.callback(
+    [Output('option-chain-exchange', 'options'),
+     Output('option-chain-exchange', 'value')],
+    Input('option-chain-source', 'value')
+)
+def update_option_exchanges(source):
+    choices, _ = OPTION_CHAIN_SOURCES.get(source, OPTION_CHAIN_SOURCES['live'])
+    return [{'label': exchange, 'value': exchange} for exchange in choices()], None
+
+
+@app.callback(
+    [Output('option-chain-underlying', 'options'),
+     Output('option-chain-underlying', 'value')],
+    Input('option-chain-exchange', 'value'),
+    State('option-chain-source', 'value')
+)
+def update_option_underlyings(exchange, source):
+    if not exchange:
+        return [], None
+    choices, _ = OPTION_CHAIN_SOURCES.get(source, OPTION_CHAIN_SOURCES['live'])
+    return [{'label': underlying, 'value': underlying} for underlying in choices(exchange)], None
+
+
+@app.callback(
+    [Output('option-chain-expiry', 'options'),
+     Output('option-chain-expiry', 'value')],
+    [Input('option-chain-exchange', 'value'),
+     Input('option-chain-underlying', 'value')],
+    State('option-chain-source', 'value')
+)
+def update_option_expiries(exchange, underlying, source):
+    if not exchange or not underlying:
+        return [], None
+    choices, _ = OPTION_CHAIN_SOURCES.get(source, OPTION_CHAIN_SOURCES['live'])
+    expiries = choices(exchange, underlying)
+    # По умолчанию — ближайшая дата истечения (в архиве — последняя истёкшая)
+    return [{'label': expiry, 'value': expiry} for expiry in expiries], (expiries[0] if expiries else None)
+
+
+@app.callback(
+    Output('option_chain_table', 'data'),
+    [Input('option-chain-exchange', 'value'),
+     Input('option-chain-underlying', 'value'),
+     Input('option-chain-expiry', 'value'),
+     Input('option-chain-strikes', 'value')],
+    State('option-chain-source', 'value')
+)
+def update_option_chain(exchange, underlying, expiry, strikes, source):
+    if not exchange or not underlying or not expiry:
+        return []
+    _, ladder = OPTION_CHAIN_SOURCES.get(source, OPTION_CHAIN_SOURCES['live'])
+    df = ladder(exchange, underlying, expiry, count=strikes or None)
+    return df[OPTION_CHAIN_COLUMNS].to_dict('records')
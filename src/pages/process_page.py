@@ -11,6 +11,10 @@ sys.stdout.reconfigure(encoding='utf-8')
 sys.stderr.reconfigure(encoding='utf-8')
 
 SCRIPTS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../scripts"))
+sys.path.append(SCRIPTS_PATH)
+
+from collector_service import collector_service
+
 logs = []  # Глобальная переменная для логов выполнения
 
 async def run_script_async(script_path):
@@ -52,12 +56,21 @@ def process_management_page():
         ]),
         dbc.Row([
             dbc.Col(dbc.Button("Update Main Data", id="update-main-btn", color="primary"), width="auto"),
+            dbc.Col(dbc.Button("Stream Main Data", id="stream-main-btn", color="primary", outline=True), width="auto"),
+            dbc.Col(dbc.Button("Stop Collector", id="stop-collector-btn", color="secondary"), width="auto"),
             dbc.Col(dbc.Button("Update Options", id="update-options-btn", color="info"), width="auto"),
             dbc.Col(dbc.Button("Update OKX Futures", id="update-futures-okx-btn", color="warning"), width="auto"),
+            dbc.Col(dbc.Button("Update Derivatives", id="update-derivatives-btn", color="warning", outline=True), width="auto"),
             dbc.Col(dbc.Button("Update OKX Trades", id="update-trades-okx-btn", color="danger"), width="auto"),
             dbc.Col(dbc.Button("Update Bybit Trades collect", id="update-trades-bybit-btn_1", color="success"), width="auto"),
             dbc.Col(dbc.Button("Update Bybit Trades full", id="update-trades-bybit-btn_2", color="success"), width="auto")
         ]),
+        dbc.Row([
+            dbc.Col(html.H3("Collector Service"), width=12)
+        ]),
+        dbc.Row([
+            dbc.Col(html.Div(id="collector-status"), width=12)
+        ]),
         dbc.Row([
             dbc.Col(html.H3("Execution Log Console"), width=12)
         ]),
@@ -80,21 +93,48 @@ def process_management_page():
     [Input("update-main-btn", "n_clicks"),
      Input("update-options-btn", "n_clicks"),
      Input("update-futures-okx-btn", "n_clicks"),
+     Input("update-derivatives-btn", "n_clicks"),
      Input("update-trades-okx-btn", "n_clicks"),
      Input("update-trades-bybit-btn_1", "n_clicks"),
      Input("update-trades-bybit-btn_2", "n_clicks"),
+     Input("stream-main-btn", "n_clicks"),
+     Input("stop-collector-btn", "n_clicks"),
      Input("console-update-interval", "n_intervals")],
     prevent_initial_call=True
 )
-def update_console_output(n_main, n_options, n_futures_okx, n_trades_okx, n_trades_bybit_1, n_trades_bybit_2, n_intervals):
+def update_console_output(n_main, n_options, n_futures_okx, n_derivatives, n_trades_okx, n_trades_bybit_1, n_trades_bybit_2,
+                          n_stream, n_stop, n_intervals):
     global logs
     triggered_id = callback_context.triggered[0]["prop_id"].split(".")[0]
 
+    # Основные данные собирает резидентная служба: первый запуск стартует её, следующие — внеочередное обновление
+    if triggered_id == "update-main-btn":
+        if collector_service.start():
+            logs.append("Collector service started.\n")
+        elif collector_service.refresh_now():
+            logs.append("Collector service: refresh requested.\n")
+        return "\n".join(logs)
+
+    # Потоковый режим: market_data поддерживается обновлениями WebSocket
+    if triggered_id == "stream-main-btn":
+        if collector_service.start(mode="stream"):
+            logs.append("Collector service started in streaming mode.\n")
+        else:
+            logs.append(f"Collector service is already running ({collector_service.mode} mode).\n")
+        return "\n".join(logs)
+
+    if triggered_id == "stop-collector-btn":
+        if collector_service.stop():
+            logs.append("Collector service stopped.\n")
+        else:
+            logs.append("Collector service is not running.\n")
+        return "\n".join(logs)
+
     # Словарь с путями к скриптам
     script_map = {
-        "update-main-btn": os.path.join(SCRIPTS_PATH, "main.py"),
         "update-options-btn": os.path.join(SCRIPTS_PATH, "opcion_modul.py"),
         "update-futures-okx-btn": os.path.join(SCRIPTS_PATH, "test_okx_futyres.py"),
+        "update-derivatives-btn": os.path.join(SCRIPTS_PATH, "derivatives.py"),
         "update-trades-okx-btn": os.path.join(SCRIPTS_PATH, "okx_dradews_v5.py"),
         "update-trades-bybit-btn_1": os.path.join(SCRIPTS_PATH, "bybit_trads.py"),
         "update-trades-bybit-btn_2": os.path.join(SCRIPTS_PATH, "bybit_trades_cheker_2.py")
@@ -113,3 +153,37 @@ def update_console_output(n_main, n_options, n_futures_okx, n_trades_okx, n_trad
 
     # Если колбэк вызван интервалом, просто возвращаем текущие логи
     return "\n".join(logs)
+
+
+# Состояние службы сборщика: расписание и результат последнего обновления по каждой бирже
+@app.callback(
+    Output("collector-status", "children"),
+    Input("console-update-interval", "n_intervals")
+)
+def update_collector_status(n_intervals):
+    status = collector_service.status()
+    header = f"Running since {status['started_at']} ({status['mode']} mode)" if status['running'] else "Stopped"
+    if status['last_error']:
+        header += f" (last error: {status['last_error']})"
+
+    rows = [
+        html.Tr([
+            html.Td(venue['exchange']),
+            html.Td(venue['market_type']),
+            html.Td(f"{venue['interval']} s"),
+            html.Td(venue['last_run'] or "-"),
+            html.Td(f"{venue['last_duration']} s" if venue['last_duration'] is not None else "-"),
+            html.Td(venue['written']),
+            html.Td(venue['skipped']),
+            html.Td(venue['errors']),
+            html.Td(venue['last_error'] or ""),
+        ])
+        for venue in status['venues']
+    ]
+    table = dbc.Table(
+        [html.Thead(html.Tr([html.Th(name) for name in (
+            "Exchange", "Market", "Interval", "Last run (UTC)", "Duration", "Written", "Skipped", "Errors", "Last error"
+        )])), html.Tbody(rows)],
+        bordered=True, size="sm"
+    )
+    return [html.P(header), table]
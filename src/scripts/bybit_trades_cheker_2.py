@@ -8,6 +8,8 @@ import schedule  # добавляем schedule для управления ра
 import time
 from datetime import datetime
 
+from http_client import get_sync
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -76,7 +78,7 @@ add_missing_columns(cursor_analysis)
 # Функция для получения всех торгуемых символов на указанном рынке (спот или фьючерсы) через Bybit API
 def get_all_symbols(category):
     url = f"https://api.bybit.com/v5/market/tickers?category={category}"
-    response = requests.get(url)
+    response = get_sync(url)
     if response.status_code == 200:
         data = response.json()
         symbols = [ticker['symbol'] for ticker in data['result']['list']]
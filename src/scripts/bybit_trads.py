@@ -7,6 +7,8 @@ import time
 import json
 from websocket import WebSocketApp
 
+from http_client import get_sync, resolve_url
+
 # Логирование
 logging.basicConfig(
     level=logging.INFO,
@@ -42,7 +44,7 @@ def create_connection():
 # Получение всех спотовых символов
 def get_all_spot_symbols():
     url = "https://api.bybit.com/v5/market/tickers?category=spot"
-    response = requests.get(url)
+    response = get_sync(url)
     if response.status_code == 200:
         data = response.json()
         symbols = [ticker['symbol'] for ticker in data['result']['list']]
@@ -54,7 +56,7 @@ def get_all_spot_symbols():
 # Получение всех фьючерсных символов
 def get_all_futures_symbols():
     url = "https://api.bybit.com/v5/market/tickers?category=linear"
-    response = requests.get(url)
+    response = get_sync(url)
     if response.status_code == 200:
         data = response.json()
         symbols = [ticker['symbol'] for ticker in data['result']['list']]
@@ -146,7 +148,7 @@ def run_websocket(duration_minutes=DURATION_MINUTES):
 
     if spot_symbols:
         ws_spot = WebSocketApp(
-            "wss://stream.bybit.com/v5/public/spot",
+            resolve_url("wss://stream.bybit.com/v5/public/spot"),
             on_message=lambda ws, msg: on_message(ws, msg, 'spot', start_time),
             on_error=on_error,
             on_close=on_close
@@ -156,7 +158,7 @@ def run_websocket(duration_minutes=DURATION_MINUTES):
 
     if futures_symbols:
         ws_futures = WebSocketApp(
-            "wss://stream.bybit.com/v5/public/linear",
+            resolve_url("wss://stream.bybit.com/v5/public/linear"),
             on_message=lambda ws, msg: on_message(ws, msg, 'futures', start_time),
             on_error=on_error,
             on_close=on_close
@@ -0,0 +1,51 @@
+import logging
+
+
+class ChangeTracker:
+    """
+    Отпечатки последних записанных значений по ключу строки.
+
+    Отпечатки хранятся в памяти, а при первом обращении загружаются из самой таблицы,
+    поэтому переживают перезапуск сборщика. Строки, значения которых не изменились
+    с прошлой записи, можно не записывать повторно.
+    """
+
+    def __init__(self, table, columns, key_columns, value_columns):
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.value_columns = tuple(value_columns)
+        self._key_idx = [columns.index(column) for column in key_columns]
+        self._value_idx = [columns.index(column) for column in value_columns]
+        self.fingerprints = {}
+        self._loaded = False
+
+    def load(self, conn):
+        """Загружает отпечатки из таблицы один раз за время жизни процесса."""
+        if self._loaded:
+            return
+
+        key_size = len(self.key_columns)
+        cursor = conn.execute(
+            f"SELECT {', '.join(self.key_columns + self.value_columns)} FROM {self.table}")
+        for row in cursor:
+            self.fingerprints[row[:key_size]] = row[key_size:]
+
+        self._loaded = True
+        logging.info(f"Загружено {len(self.fingerprints)} отпечатков строк из {self.table}.")
+
+    def _key(self, row):
+        return tuple(row[i] for i in self._key_idx)
+
+    def _values(self, row):
+        return tuple(row[i] for i in self._value_idx)
+
+    def split(self, rows):
+        """Возвращает строки, значения которых изменились, и количество пропущенных строк."""
+        fingerprints = self.fingerprints
+        changed = [row for row in rows if fingerprints.get(self._key(row)) != self._values(row)]
+        return changed, len(rows) - len(changed)
+
+    def remember(self, rows):
+        """Запоминает значения успешно записанных строк."""
+        for row in rows:
+            self.fingerprints[self._key(row)] = self._values(row)
@@ -0,0 +1,368 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from market_history import MarketHistory
+from db_writer import connect, snapshot_timestamp
+from http_client import create_session
+from price_index import PriceIndex
+from ticker_ws import STREAM_SOURCES, STREAM_FLUSH_MS, StreamState, run_stream
+
+# Расписание по умолчанию для каждой биржи/рынка (сек): начальный, минимальный и максимальный интервал
+DEFAULT_SCHEDULE = {'interval': 30, 'min_interval': 10, 'max_interval': 300}
+VENUE_SCHEDULES = {
+    ('Binance', 'spot'): {'interval': 20},
+    ('Binance', 'futures'): {'interval': 20},
+    ('Bybit', 'spot'): {'interval': 30},
+    ('Bybit', 'futures'): {'interval': 30},
+    ('OKX', 'spot'): {'interval': 30},
+}
+
+# Доля изменившихся инструментов, при которой интервал сокращается или увеличивается
+FAST_CHANGE_RATIO = 0.5
+SLOW_CHANGE_RATIO = 0.05
+SPEED_UP = 0.75
+SLOW_DOWN = 1.5
+
+# Как часто пересчитываются агрегаты истории (сек)
+ROLLUP_INTERVAL = 60
+
+# Потоковый режим: как часто полный снимок потоков дописывается в историю и пауза перед переподключением (сек)
+STREAM_HISTORY_INTERVAL = 60
+STREAM_RECONNECT_DELAY = 5
+
+# Режимы работы службы: опрос REST по расписанию или потоки WebSocket
+MODES = ('poll', 'stream')
+
+
+class LatestIndexes:
+    """Последний индекс цен каждой биржи: фьючерсы ждут только самую первую публикацию спотового рынка."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._ready = {}
+
+    def _event(self, exchange):
+        if exchange not in self._ready:
+            self._ready[exchange] = asyncio.Event()
+        return self._ready[exchange]
+
+    def publish(self, exchange, price_index):
+        # Пустой индекс (спотовый рынок не загрузился) не заменяет уже полученный
+        if price_index.prices or exchange not in self._indexes:
+            self._indexes[exchange] = price_index
+        self._event(exchange).set()
+
+    async def get(self, exchange):
+        await self._event(exchange).wait()
+        return self._indexes[exchange]
+
+
+class VenueState:
+    """Адаптивное расписание и статистика одной биржи/рынка."""
+
+    def __init__(self, exchange, market_type, fetcher=None):
+        schedule = {**DEFAULT_SCHEDULE, **VENUE_SCHEDULES.get((exchange, market_type), {})}
+        self.exchange = exchange
+        self.market_type = market_type
+        self.fetcher = fetcher
+        self.interval = schedule['interval']
+        self.min_interval = schedule['min_interval']
+        self.max_interval = schedule['max_interval']
+        self.last_run = None
+        self.last_duration = None
+        self.written = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.wake = None
+
+    def adapt(self, written, skipped):
+        # Рынок быстро меняется — опрашиваем чаще, почти не меняется — реже
+        total = written + skipped
+        ratio = written / total if total else 0.0
+        if ratio >= FAST_CHANGE_RATIO:
+            self.interval = max(self.min_interval, self.interval * SPEED_UP)
+        elif ratio <= SLOW_CHANGE_RATIO:
+            self.interval = min(self.max_interval, self.interval * SLOW_DOWN)
+
+    def back_off(self):
+        self.interval = min(self.max_interval, self.interval * 2)
+
+    def status(self):
+        return {
+            'exchange': self.exchange,
+            'market_type': self.market_type,
+            'interval': round(self.interval, 1),
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'written': self.written,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
+
+
+class CollectorService:
+    """
+    Резидентная служба сборщика market_data.
+
+    Работает в отдельном потоке со своим циклом событий: держит одну HTTP-сессию,
+    соединения с базами открыты на всё время работы, а каждая биржа/рынок обновляется
+    по собственному адаптивному расписанию. Вся запись в SQLite идёт через один поток.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._loop = None
+        self._stop = None
+        self._db_executor = None
+        self._conn = None
+        self._history = None
+        self._venues = []
+        self._streams = {}
+        self.mode = None
+        self.started_at = None
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, mode='poll'):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим службы сборщика: {mode}")
+        if self.running:
+            return False
+        self.mode = mode
+        self.last_error = None
+        self._thread = threading.Thread(target=self._thread_main, name='collector-service', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=30):
+        if not self.running:
+            return False
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout)
+        return True
+
+    def refresh_now(self):
+        """Запускает внеочередное обновление всех бирж."""
+        if not self.running or self._loop is None:
+            return False
+        for venue in self._venues:
+            if venue.wake is not None:
+                self._loop.call_soon_threadsafe(venue.wake.set)
+        return True
+
+    def status(self):
+        return {
+            'running': self.running,
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'last_error': self.last_error,
+            'venues': [venue.status() for venue in self._venues],
+        }
+
+    def _thread_main(self):
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"Служба сборщика остановлена с ошибкой: {e}", exc_info=True)
+
+    # Операции с базой выполняются только в потоке записи
+    def _open_db(self, main):
+        main.create_db()
+        main.add_updated_time_column()
+        self._conn = connect('market_data.db')
+        self._history = MarketHistory()
+
+    def _close_db(self):
+        if self._conn is not None:
+            self._conn.close()
+        if self._history is not None:
+            self._history.close()
+        self._conn = self._history = None
+
+    def _save(self, main, tickers, exchange, market_type, timestamp, record_history=True):
+        return main.save_to_db(tickers, exchange, market_type, timestamp, conn=self._conn, history=self._history,
+                               record_history=record_history)
+
+    def _append_history(self, rows, timestamp):
+        self._history.append(rows, timestamp)
+
+    async def _run(self):
+        # Сборщик импортируется при запуске службы, чтобы его настройки (локаль, логирование)
+        # не применялись к приложению, пока служба не используется
+        import main
+
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='collector-db')
+        if self.mode == 'stream':
+            # Bybit (фьючерсы) получает два потока, linear и inverse, но в статусе это одна строка
+            venues = {}
+            for exchange, market_type, _, _ in main.STREAM_VENUES:
+                venues.setdefault((exchange, market_type), VenueState(exchange, market_type))
+            self._venues = list(venues.values())
+            for venue in self._venues:
+                venue.interval = STREAM_FLUSH_MS / 1000
+        else:
+            self._venues = [VenueState(exchange, market_type, fetcher)
+                            for exchange, market_type, fetcher in main.VENUES]
+        self._streams = {}
+        for venue in self._venues:
+            venue.wake = asyncio.Event()
+
+        await self._loop.run_in_executor(self._db_executor, self._open_db, main)
+        self.started_at = snapshot_timestamp()
+        logging.info(f"Служба сборщика запущена (режим {self.mode}).")
+
+        indexes = LatestIndexes()
+        try:
+            async with create_session() as session:
+                if self.mode == 'stream':
+                    venues = {(venue.exchange, venue.market_type): venue for venue in self._venues}
+                    tasks = [asyncio.create_task(self._stream_loop(
+                                 main, session, indexes, venues[(exchange, market_type)], stream_key, seed))
+                             for exchange, market_type, stream_key, seed in main.STREAM_VENUES]
+                    tasks.append(asyncio.create_task(self._stream_history_loop(main)))
+                else:
+                    tasks = [asyncio.create_task(self._venue_loop(main, session, indexes, venue))
+                             for venue in self._venues]
+                tasks.append(asyncio.create_task(self._rollup_loop()))
+                await self._stop.wait()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await self._loop.run_in_executor(self._db_executor, self._close_db)
+            self._db_executor.shutdown(wait=True)
+            logging.info("Служба сборщика остановлена.")
+
+    async def _venue_loop(self, main, session, indexes, venue):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                tickers = await venue.fetcher(session, indexes)
+                timestamp = snapshot_timestamp()
+                written, skipped = await self._loop.run_in_executor(
+                    self._db_executor, self._save, main, tickers, venue.exchange, venue.market_type, timestamp)
+                venue.written, venue.skipped, venue.last_error = written, skipped, None
+                venue.adapt(written, skipped)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                venue.errors += 1
+                venue.last_error = str(e)
+                venue.back_off()
+                logging.error(f"Ошибка при обновлении {venue.exchange} ({venue.market_type}): {e}")
+            finally:
+                # Фьючерсы той же биржи не должны ждать индекс, если спотовый рынок не загрузился
+                if venue.market_type == 'spot':
+                    indexes.publish(venue.exchange, PriceIndex())
+
+            venue.last_run = snapshot_timestamp()
+            venue.last_duration = round(time.monotonic() - started, 2)
+
+            # Ждём следующего запуска по расписанию или внеочередного обновления
+            venue.wake.clear()
+            try:
+                await asyncio.wait_for(venue.wake.wait(), timeout=venue.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _stream_loop(self, main, session, indexes, venue, stream_key, seed):
+        """Начальный снимок через REST, затем обновления из WebSocket; при обрыве — переподключение со свежим снимком."""
+        source = STREAM_SOURCES[stream_key]
+        delay = STREAM_RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                tickers = await seed(session, indexes)
+                await self._loop.run_in_executor(
+                    self._db_executor, self._save, main, tickers, venue.exchange, venue.market_type,
+                    snapshot_timestamp())
+
+                state = StreamState(tickers, source.get('valuation', ('volume', 'quote_volume')))
+                self._streams[stream_key] = (venue, state)
+                logging.info(f"Поток {stream_key[0]} ({stream_key[1]}): подписка на {len(tickers)} инструментов.")
+
+                flusher = asyncio.create_task(self._flush_loop(main, indexes, venue, state))
+                try:
+                    await run_stream(session, source, state)
+                finally:
+                    flusher.cancel()
+                delay = STREAM_RECONNECT_DELAY
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                venue.errors += 1
+                venue.last_error = str(e)
+                logging.error(f"Ошибка потока {stream_key[0]} ({stream_key[1]}): {e}")
+                delay = min(venue.max_interval, delay * 2)
+            finally:
+                if venue.market_type == 'spot':
+                    indexes.publish(venue.exchange, PriceIndex())
+
+            await asyncio.sleep(delay)
+
+    async def _flush_loop(self, main, indexes, venue, state):
+        while True:
+            await asyncio.sleep(STREAM_FLUSH_MS / 1000)
+            if not state.has_changes():
+                continue
+            try:
+                await self._flush(main, indexes, venue, state)
+            except Exception as e:
+                venue.errors += 1
+                venue.last_error = str(e)
+                logging.error(f"Ошибка при записи потока {venue.exchange} ({venue.market_type}): {e}")
+
+    async def _flush(self, main, indexes, venue, state):
+        """Записывает инструменты, изменившиеся с прошлого сброса, одной пачкой."""
+        started = time.monotonic()
+        tickers = state.tickers
+        if venue.market_type == 'spot':
+            # Индекс цен строится по актуальным ценам потока, фьючерсы той же биржи берут его отсюда
+            price_index = main.build_price_index(tickers)
+            indexes.publish(venue.exchange, price_index)
+        else:
+            price_index = await indexes.get(venue.exchange)
+
+        rows = state.take_changed()
+        main.fill_price_usdt(tickers, price_index, state.base_volume, state.quote_volume, rows=rows)
+        written, skipped = await self._loop.run_in_executor(
+            self._db_executor, self._save, main, tickers.subset(rows), venue.exchange, venue.market_type,
+            snapshot_timestamp(), False)
+
+        venue.written, venue.skipped = written, skipped
+        venue.last_run = snapshot_timestamp()
+        venue.last_duration = round(time.monotonic() - started, 2)
+
+    async def _stream_history_loop(self, main):
+        # Потоки обновляют market_data чаще раза в секунду; в историю же идёт полный снимок по расписанию
+        while not self._stop.is_set():
+            await asyncio.sleep(STREAM_HISTORY_INTERVAL)
+            timestamp = snapshot_timestamp()
+            for venue, state in list(self._streams.values()):
+                rows = main.build_market_rows(state.tickers, venue.exchange, venue.market_type, timestamp)
+                try:
+                    await self._loop.run_in_executor(self._db_executor, self._append_history, rows, timestamp)
+                except Exception as e:
+                    logging.error(f"Ошибка при записи истории потока {venue.exchange} ({venue.market_type}): {e}")
+
+    async def _rollup_loop(self):
+        while not self._stop.is_set():
+            await asyncio.sleep(ROLLUP_INTERVAL)
+            try:
+                await self._loop.run_in_executor(self._db_executor, self._history.rollup)
+            except Exception as e:
+                logging.error(f"Ошибка при пересчёте агрегатов истории: {e}")
+
+
+# Единственный экземпляр службы на процесс приложения
+collector_service = CollectorService()
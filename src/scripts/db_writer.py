@@ -0,0 +1,86 @@
+import sqlite3
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+
+def connect(db_path, **kwargs):
+    """Открывает соединение с базой в режиме WAL: читатели не блокируются во время записи снимка."""
+    conn = sqlite3.connect(db_path, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def snapshot_timestamp():
+    """Одна временная метка на весь снимок."""
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+@lru_cache(maxsize=None)
+def build_upsert_sql(table, columns, conflict_columns, update_columns):
+    placeholders = ', '.join('?' for _ in columns)
+    updates = ',\n    '.join(f"{column} = excluded.{column}" for column in update_columns)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})\n"
+        f"VALUES ({placeholders})\n"
+        f"ON CONFLICT({', '.join(conflict_columns)}) DO UPDATE SET\n"
+        f"    {updates}"
+    )
+
+
+def bulk_upsert(conn, table, columns, conflict_columns, update_columns, rows):
+    """
+    Вставляет или обновляет пачку строк одной транзакцией через executemany.
+
+    :param rows: список кортежей в порядке columns.
+    :return: количество записанных строк.
+    """
+    if not rows:
+        return 0
+
+    sql = build_upsert_sql(table, tuple(columns), tuple(conflict_columns), tuple(update_columns))
+    try:
+        with conn:
+            conn.executemany(sql, rows)
+    except sqlite3.Error as e:
+        logging.error(f"Ошибка при пакетной записи в {table}: {e}", exc_info=True)
+        raise
+
+    return len(rows)
+
+
+def replace_table(conn, table, schema, columns, rows):
+    """
+    Заменяет содержимое таблицы новым снимком без простоя для читателей.
+
+    Снимок пишется в теневую таблицу <table>_staging (schema — CREATE TABLE с плейсхолдером {table}),
+    затем одной транзакцией старая таблица удаляется, а теневая переименовывается на её место.
+    До коммита читатели видят предыдущий полный снимок, после — новый; пустой или недописанной
+    таблицы они не видят. Индексы из UNIQUE-ограничений схемы переименовываются вместе с таблицей.
+    Строки с повторяющимся уникальным ключом схлопываются в последнюю (INSERT OR REPLACE).
+
+    :return: количество записанных строк.
+    """
+    staging = f"{table}_staging"
+    sql = f"INSERT OR REPLACE INTO {staging} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    try:
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+            conn.execute(schema.format(table=staging))
+            conn.executemany(sql, rows)
+
+        # DDL в модуле sqlite3 не открывает транзакцию сам, поэтому BEGIN явно
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+    except sqlite3.Error as e:
+        logging.error(f"Ошибка при замене снимка таблицы {table}: {e}", exc_info=True)
+        raise
+
+    return len(rows)
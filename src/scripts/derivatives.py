@@ -0,0 +1,320 @@
+import sqlite3
+import logging
+import time
+import asyncio
+
+import aiohttp
+
+from db_writer import connect, bulk_upsert, snapshot_timestamp
+from http_client import create_session, get_json
+from instrument_cache import load_instruments
+from symbol_registry import REGISTRY_SOURCES, default_registry
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+
+DB_PATH = 'derivatives_data.db'
+
+# Котируемые валюты, цена в которых считается ценой в USD
+USD_QUOTES = {'USD', 'USDT', 'USDC', 'BUSD', 'FDUSD'}
+
+
+def create_db():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # Одна таблица метрик деривативов для всех бирж
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS derivatives_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            market_type TEXT NOT NULL,
+            contract_type TEXT,                 -- perpetual или future
+            base_asset TEXT,
+            quote_asset TEXT,
+            contract_size REAL,
+            contract_ccy TEXT,                  -- валюта размера контракта
+            mark_price REAL,
+            index_price REAL,
+            basis REAL,                         -- mark_price - index_price
+            basis_rate REAL,                    -- basis / index_price
+            funding_rate REAL,                  -- NULL у срочных контрактов
+            next_funding_time DATETIME,
+            open_interest_contracts REAL,
+            open_interest_base REAL,            -- в базовой валюте
+            open_interest_usd REAL,
+            timestamp DATETIME,
+            updated_time DATETIME,
+            UNIQUE(symbol, exchange, market_type)
+        );
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _funding_time(value):
+    # Время следующего фандинга приходит в миллисекундах
+    milliseconds = _to_float(value)
+    if not milliseconds:
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(milliseconds / 1000))
+
+
+def _payload_data(exchange, payload):
+    """Список записей из ответа биржи или пустой список, если биржа вернула ошибку."""
+    if exchange == 'Binance':
+        return payload if isinstance(payload, list) else [payload] if isinstance(payload, dict) else []
+    if exchange == 'Bybit':
+        if payload.get('retCode') != 0:
+            logging.error(f"Ошибка API Bybit: {payload.get('retMsg')}")
+            return []
+        return payload.get('result', {}).get('list', [])
+    if payload.get('code') != '0':
+        logging.error(f"Ошибка API OKX: {payload.get('msg')}")
+        return []
+    return payload.get('data', [])
+
+
+async def fetch_list(session, exchange, url, params=None):
+    payload = await get_json(session, url, params=params)
+    return _payload_data(exchange, payload)
+
+
+# Открытый интерес в той единице, в которой его отдаёт биржа, приводится к контрактам, базовой валюте и USD.
+# Размер контракта задан в contract_ccy: в базовой валюте (линейные) или в USD (инверсные)
+def notional(open_interest, unit, contract_size, contract_ccy, base, quote, mark_price):
+    if open_interest is None:
+        return None, None, None
+    contract_size = contract_size or 1.0
+    usd_price = mark_price if quote in USD_QUOTES and mark_price else None
+    usd_contracts = contract_ccy in USD_QUOTES and contract_ccy != base
+
+    if unit == 'contracts':
+        contracts = open_interest
+        if usd_contracts:
+            usd = contracts * contract_size
+            return contracts, usd / mark_price if mark_price else None, usd
+        base_amount = contracts * contract_size
+    elif unit == 'usd':
+        usd = open_interest
+        contracts = usd / contract_size if usd_contracts else None
+        return contracts, usd / mark_price if mark_price else None, usd
+    else:
+        base_amount = open_interest
+        contracts = base_amount / contract_size
+
+    return contracts, base_amount, base_amount * usd_price if usd_price else None
+
+
+def build_rows(registry, exchange, inst_type, instruments, metrics, timestamp):
+    """
+    Строки derivatives_data для контрактов каталога, по которым есть метрики.
+    Базовая, котируемая валюты и вид контракта берутся из реестра символов, как у остальных сборщиков.
+
+    :param metrics: {символ: {'mark_price', 'index_price', 'funding_rate', 'next_funding_time',
+                     'open_interest', 'oi_unit'}} — oi_unit: 'contracts', 'base' или 'usd'.
+    """
+    registry.register(exchange, inst_type, instruments)
+    market_type = REGISTRY_SOURCES[(exchange, inst_type)][0]
+    rows = []
+    for instrument in instruments:
+        symbol = instrument['symbol']
+        item = metrics.get(symbol)
+        if item is None:
+            continue
+
+        base, quote, kind = registry.resolve(exchange, market_type, symbol) or (None, None, instrument.get('kind'))
+        contract_size = item.get('contract_size') or instrument.get('contract_size') or 1.0
+        contract_ccy = item.get('contract_ccy') or instrument.get('contract_ccy') or base
+        mark_price, index_price = item.get('mark_price'), item.get('index_price')
+        basis = mark_price - index_price if mark_price and index_price else None
+        contracts, base_amount, usd = notional(item.get('open_interest'), item.get('oi_unit'), contract_size,
+                                               contract_ccy, base, quote, mark_price)
+        is_perpetual = kind == 'perpetual'
+
+        rows.append((
+            symbol, exchange, market_type, kind, base, quote, contract_size, contract_ccy,
+            mark_price, index_price, basis, basis / index_price if basis is not None else None,
+            item.get('funding_rate') if is_perpetual else None,
+            item.get('next_funding_time') if is_perpetual else None,
+            contracts, base_amount, usd, timestamp, timestamp,
+        ))
+    return rows
+
+
+# Binance (USDT-M): премиальный индекс (марк-цена, индекс, фандинг) одним запросом; отдельного массового
+# эндпоинта открытого интереса нет, поэтому он запрашивается по символу (вес 1, общий лимит fapi)
+async def get_binance_metrics(session):
+    instruments = await load_instruments(session, 'Binance', 'futures')
+    premium = await fetch_list(session, 'Binance', "https://fapi.binance.com/fapi/v1/premiumIndex")
+    metrics = {item['symbol']: {
+        'mark_price': _to_float(item.get('markPrice')),
+        'index_price': _to_float(item.get('indexPrice')),
+        'funding_rate': _to_float(item.get('lastFundingRate')),
+        'next_funding_time': _funding_time(item.get('nextFundingTime')),
+        'oi_unit': 'base',
+    } for item in premium if item.get('symbol')}
+
+    symbols = [instrument['symbol'] for instrument in instruments if instrument['symbol'] in metrics]
+    results = await asyncio.gather(
+        *(fetch_list(session, 'Binance', "https://fapi.binance.com/fapi/v1/openInterest", {'symbol': symbol})
+          for symbol in symbols),
+        return_exceptions=True
+    )
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка при запросе открытого интереса {symbol} с Binance: {result}")
+            continue
+        if result:
+            metrics[symbol]['open_interest'] = _to_float(result[0].get('openInterest'))
+    return [('futures', instruments, metrics)]
+
+
+# Bybit: тикеры linear и inverse содержат все метрики. Линейные контракты — 1 базовая монета,
+# открытый интерес в базовой валюте; инверсные — 1 USD, открытый интерес в USD
+BYBIT_CATEGORIES = {'linear': 'base', 'inverse': 'usd'}
+
+
+async def get_bybit_category(session, category, oi_unit):
+    instruments, tickers = await asyncio.gather(
+        load_instruments(session, 'Bybit', category),
+        fetch_list(session, 'Bybit', "https://api.bybit.com/v5/market/tickers", {'category': category}))
+    metrics = {item['symbol']: {
+        'mark_price': _to_float(item.get('markPrice')),
+        'index_price': _to_float(item.get('indexPrice')),
+        'funding_rate': _to_float(item.get('fundingRate')),
+        'next_funding_time': _funding_time(item.get('nextFundingTime')),
+        'open_interest': _to_float(item.get('openInterest')),
+        'oi_unit': oi_unit,
+        'contract_size': 1.0,
+        'contract_ccy': 'USD' if oi_unit == 'usd' else None,
+    } for item in tickers if item.get('symbol')}
+    return category, instruments, metrics
+
+
+async def get_bybit_metrics(session):
+    return list(await asyncio.gather(
+        *(get_bybit_category(session, category, unit) for category, unit in BYBIT_CATEGORIES.items())))
+
+
+# OKX: марк-цены и открытый интерес — по типу инструмента, индексы — по котируемой валюте,
+# фандинг всех бессрочных контрактов — одним запросом (instId=ANY)
+OKX_CATEGORIES = ('SWAP', 'FUTURES')
+OKX_INDEX_QUOTES = ('USDT', 'USD', 'USDC')
+
+
+async def get_okx_category(session, inst_type, indexes, funding):
+    instruments, marks, open_interest = await asyncio.gather(
+        load_instruments(session, 'OKX', inst_type),
+        fetch_list(session, 'OKX', "https://www.okx.com/api/v5/public/mark-price", {'instType': inst_type}),
+        fetch_list(session, 'OKX', "https://www.okx.com/api/v5/public/open-interest", {'instType': inst_type}))
+    oi = {item['instId']: _to_float(item.get('oi')) for item in open_interest if item.get('instId')}
+    # Индекс контракта (например, BTC-USDT) — по его базовой и котируемой валютам из реестра символов
+    registry = default_registry()
+    registry.register('OKX', inst_type, instruments)
+
+    metrics = {}
+    for item in marks:
+        inst_id = item.get('instId')
+        if not inst_id:
+            continue
+        rate = funding.get(inst_id, {})
+        assets = registry.resolve('OKX', 'futures', inst_id)
+        metrics[inst_id] = {
+            'mark_price': _to_float(item.get('markPx')),
+            'index_price': indexes.get(f"{assets[0]}-{assets[1]}") if assets else None,
+            'funding_rate': _to_float(rate.get('fundingRate')),
+            'next_funding_time': _funding_time(rate.get('fundingTime')),
+            'open_interest': oi.get(inst_id),
+            'oi_unit': 'contracts',
+        }
+    return inst_type, instruments, metrics
+
+
+async def get_okx_metrics(session):
+    index_lists = await asyncio.gather(
+        *(fetch_list(session, 'OKX', "https://www.okx.com/api/v5/market/index-tickers", {'quoteCcy': quote})
+          for quote in OKX_INDEX_QUOTES))
+    indexes = {item['instId']: _to_float(item.get('idxPx')) for items in index_lists for item in items
+               if item.get('instId')}
+    funding = {item['instId']: item for item in await fetch_list(
+        session, 'OKX', "https://www.okx.com/api/v5/public/funding-rate", {'instId': 'ANY'}) if item.get('instId')}
+    return list(await asyncio.gather(
+        *(get_okx_category(session, inst_type, indexes, funding) for inst_type in OKX_CATEGORIES)))
+
+
+DERIVATIVES_SOURCES = {
+    'Binance': get_binance_metrics,
+    'Bybit': get_bybit_metrics,
+    'OKX': get_okx_metrics,
+}
+
+DERIVATIVES_COLUMNS = ('symbol', 'exchange', 'market_type', 'contract_type', 'base_asset', 'quote_asset',
+                       'contract_size', 'contract_ccy', 'mark_price', 'index_price', 'basis', 'basis_rate',
+                       'funding_rate', 'next_funding_time', 'open_interest_contracts', 'open_interest_base',
+                       'open_interest_usd', 'timestamp', 'updated_time')
+DERIVATIVES_KEY = ('symbol', 'exchange', 'market_type')
+DERIVATIVES_UPDATE_COLUMNS = DERIVATIVES_COLUMNS[3:]
+
+
+def save_to_db(rows):
+    conn = connect(DB_PATH)
+    try:
+        bulk_upsert(conn, 'derivatives_data', DERIVATIVES_COLUMNS, DERIVATIVES_KEY, DERIVATIVES_UPDATE_COLUMNS, rows)
+    finally:
+        conn.close()
+
+
+async def collect_exchange(session, db_lock, timestamp, exchange, fetcher):
+    """Загружает метрики деривативов одной биржи и сразу записывает их в базу."""
+    started = time.monotonic()
+    try:
+        categories = await fetcher(session)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.error(f"Ошибка при запросе деривативов с {exchange}: {e}")
+        return 0
+
+    registry = default_registry()
+    rows = []
+    for inst_type, instruments, metrics in categories:
+        rows.extend(build_rows(registry, exchange, inst_type, instruments, metrics, timestamp))
+
+    # Запись в SQLite выполняется по очереди и вне цикла событий
+    async with db_lock:
+        await asyncio.to_thread(save_to_db, rows)
+    logging.info(f"{exchange}: метрики {len(rows)} контрактов за {time.monotonic() - started:.2f} с.")
+    return len(rows)
+
+
+async def collect_derivatives():
+    """Параллельно собирает открытый интерес, фандинг, марк-цены и базис со всех бирж."""
+    started = time.monotonic()
+    db_lock = asyncio.Lock()
+    timestamp = snapshot_timestamp()
+
+    async with create_session() as session:
+        results = await asyncio.gather(
+            *(collect_exchange(session, db_lock, timestamp, exchange, fetcher)
+              for exchange, fetcher in DERIVATIVES_SOURCES.items()),
+            return_exceptions=True
+        )
+
+    for exchange, result in zip(DERIVATIVES_SOURCES, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка при обработке деривативов с {exchange}: {result}", exc_info=result)
+
+    total = sum(result for result in results if not isinstance(result, Exception))
+    logging.info(f"Собраны метрики {total} контрактов за {time.monotonic() - started:.2f} с.")
+
+
+if __name__ == "__main__":
+    create_db()
+    asyncio.run(collect_derivatives())
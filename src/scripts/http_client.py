@@ -0,0 +1,285 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit, parse_qsl
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+# Таймаут одного HTTP-запроса к бирже (сек)
+REQUEST_TIMEOUT = 30
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; OKXDataCollector/1.0)"
+}
+
+# Базовый URL тестового сервера (random_data_for_tests/mock_exchange.py): если задан, запросы ко всем биржам
+# уходят на него в виде <base>/<хост биржи>/<путь>, а лимиты по-прежнему считаются по исходному хосту
+BASE_URL = os.environ.get('EXCHANGE_BASE_URL', '').rstrip('/') or None
+
+# Пул соединений: всего и на один хост (keep-alive переиспользуется между запросами)
+POOL_SIZE = 100
+POOL_PER_HOST = 20
+
+# Повторы: статусы, после которых запрос повторяется, число попыток и границы задержки (сек)
+RETRY_STATUSES = {418, 429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+# Доля опубликованного лимита, которую разрешено использовать
+SAFETY_FACTOR = 0.8
+
+# Лимиты бирж по хостам:
+#   capacity/period — опубликованный лимит (вес или число запросов за период, сек);
+#   scope — общий бюджет на хост ('host') или отдельный на каждый путь ('path', у OKX лимиты на эндпоинт);
+#   weights — вес эндпоинта (с символом, без символа); по умолчанию 1;
+#   used_header — заголовок с использованным весом, remaining_header — с остатком лимита.
+EXCHANGE_LIMITS = {
+    'api.binance.com': {
+        'exchange': 'Binance', 'capacity': 6000, 'period': 60, 'scope': 'host',
+        'used_header': 'X-MBX-USED-WEIGHT-1M',
+        'weights': {'/api/v3/ticker/24hr': (2, 80), '/api/v3/exchangeInfo': (20, 20)},
+    },
+    'fapi.binance.com': {
+        'exchange': 'Binance', 'capacity': 2400, 'period': 60, 'scope': 'host',
+        'used_header': 'X-MBX-USED-WEIGHT-1M',
+        'weights': {'/fapi/v1/ticker/24hr': (1, 40), '/fapi/v1/exchangeInfo': (1, 1),
+                    '/fapi/v1/premiumIndex': (1, 10)},
+    },
+    'eapi.binance.com': {
+        'exchange': 'Binance', 'capacity': 400, 'period': 60, 'scope': 'host',
+        'used_header': 'X-MBX-USED-WEIGHT-1M',
+        'weights': {'/eapi/v1/ticker': (1, 5), '/eapi/v1/mark': (1, 5), '/eapi/v1/exchangeInfo': (1, 1)},
+    },
+    'api.bybit.com': {
+        'exchange': 'Bybit', 'capacity': 600, 'period': 5, 'scope': 'host',
+        'remaining_header': 'X-Bapi-Limit-Status',
+    },
+    'www.okx.com': {
+        'exchange': 'OKX', 'capacity': 20, 'period': 2, 'scope': 'path',
+    },
+}
+
+# Для хостов без описания лимита
+DEFAULT_LIMIT = {'exchange': None, 'capacity': 10, 'period': 1, 'scope': 'host'}
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate = capacity / period токенов в секунду, не больше burst (по умолчанию capacity).
+
+    Запрос резервирует свою стоимость сразу (баланс может уйти в минус), а вызывающий
+    ждёт, пока баланс восстановится, — так очередь запросов обслуживается по порядку.
+    Состояние защищено блокировкой потока, поэтому корзину разделяют и асинхронные,
+    и синхронные сборщики одного процесса.
+    """
+
+    def __init__(self, capacity, period, burst=None):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.burst = burst or capacity
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost=1):
+        """Резервирует cost токенов и возвращает, сколько секунд нужно подождать."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= min(cost, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def limit_remaining(self, remaining):
+        """Сверяет баланс с остатком, который сообщила биржа (другие процессы тоже расходуют лимит)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            # Даже при перерасходе ждём не дольше одного периода лимита
+            self._tokens = max(-self.capacity, min(self._tokens, remaining))
+
+    async def acquire(self, cost=1):
+        delay = self.reserve(cost)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, cost=1):
+        delay = self.reserve(cost)
+        if delay:
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """Корзины токенов всех бирж процесса и учёт заголовков с использованным весом."""
+
+    def __init__(self, limits=EXCHANGE_LIMITS):
+        self.limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, spec):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # Пачка после простоя ограничена неиспользуемой долей лимита: иначе она вместе
+                # с пополнением за период превысит лимит в скользящем окне биржи
+                bucket = TokenBucket(spec['capacity'] * SAFETY_FACTOR, spec['period'],
+                                     burst=spec['capacity'] * (1 - SAFETY_FACTOR))
+                self._buckets[key] = bucket
+            return bucket
+
+    def bucket_for(self, url, params=None):
+        """(корзина, стоимость запроса, описание лимита) для URL."""
+        parts = urlsplit(str(url))
+        spec = self.limits.get(parts.hostname, DEFAULT_LIMIT)
+        key = (parts.hostname, parts.path) if spec['scope'] == 'path' else parts.hostname
+
+        query = dict(parse_qsl(parts.query))
+        query.update(params or {})
+        single, full = spec.get('weights', {}).get(parts.path, (1, 1))
+        cost = single if 'symbol' in query else full
+        return self._bucket(key, spec), cost, spec
+
+    def observe(self, bucket, spec, headers):
+        """Учитывает заголовки ответа: использованный вес (Binance) или остаток лимита (Bybit)."""
+        try:
+            if spec.get('used_header') and headers.get(spec['used_header']):
+                used = float(headers[spec['used_header']])
+                bucket.limit_remaining(spec['capacity'] * SAFETY_FACTOR - used)
+            elif spec.get('remaining_header') and headers.get(spec['remaining_header']):
+                bucket.limit_remaining(float(headers[spec['remaining_header']]) * SAFETY_FACTOR)
+        except ValueError:
+            pass
+
+
+_limiter = RateLimiter()
+
+
+def resolve_url(url):
+    """URL запроса с учётом BASE_URL; для wss:// возвращается ws:// адрес тестового сервера."""
+    if BASE_URL is None:
+        return url
+    parts = urlsplit(str(url))
+    base = BASE_URL
+    if parts.scheme in ('ws', 'wss'):
+        base = 'ws' + base[len('http'):] if base.startswith('http') else base
+    tail = parts.path + (f"?{parts.query}" if parts.query else "")
+    return f"{base}/{parts.hostname}{tail}"
+
+
+def backoff_delay(attempt):
+    """Экспоненциальная задержка с полным джиттером, чтобы повторы разных сборщиков не совпадали."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_delay(headers, attempt):
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    return backoff_delay(attempt)
+
+
+# Асинхронный клиент (aiohttp)
+def create_session(**kwargs):
+    """Сессия aiohttp с пулом соединений, общим таймаутом и заголовками сборщиков."""
+    connector = aiohttp.TCPConnector(limit=POOL_SIZE, limit_per_host=POOL_PER_HOST, ttl_dns_cache=300)
+    kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    kwargs.setdefault('headers', HEADERS)
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+
+@asynccontextmanager
+async def get(session, url, params=None, headers=None, limiter=None):
+    """
+    GET с учётом лимита биржи и повторами: ответы 429/418/5xx и сетевые ошибки повторяются
+    с задержкой (Retry-After, если биржа его прислала). Возвращает ответ aiohttp для чтения.
+    """
+    limiter = limiter or _limiter
+    bucket, cost, spec = limiter.bucket_for(url, params)
+    for attempt in range(MAX_RETRIES + 1):
+        await bucket.acquire(cost)
+        try:
+            response = await session.get(resolve_url(url), params=params, headers=headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"Ошибка соединения с {url}: {e!r}. Повтор через {delay:.1f} с.")
+            await asyncio.sleep(delay)
+            continue
+
+        limiter.observe(bucket, spec, response.headers)
+        if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+            delay = retry_delay(response.headers, attempt)
+            response.release()
+            logging.warning(f"{url}: статус {response.status}, повтор через {delay:.1f} с.")
+            await asyncio.sleep(delay)
+            continue
+
+        try:
+            yield response
+        finally:
+            response.release()
+        return
+
+
+async def get_json(session, url, params=None, headers=None):
+    async with get(session, url, params, headers) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+# Синхронный клиент (requests)
+_sync_session = None
+_sync_session_lock = threading.Lock()
+
+
+def sync_session():
+    """Общая для процесса сессия requests с пулом keep-alive соединений."""
+    global _sync_session
+    with _sync_session_lock:
+        if _sync_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_PER_HOST)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(HEADERS)
+            _sync_session = session
+        return _sync_session
+
+
+def get_sync(url, params=None, headers=None, session=None, limiter=None):
+    """То же, что get, для синхронных сборщиков: возвращает requests.Response."""
+    session = session or sync_session()
+    limiter = limiter or _limiter
+    bucket, cost, spec = limiter.bucket_for(url, params)
+    for attempt in range(MAX_RETRIES + 1):
+        bucket.acquire_sync(cost)
+        try:
+            response = session.get(resolve_url(url), params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"Ошибка соединения с {url}: {e!r}. Повтор через {delay:.1f} с.")
+            time.sleep(delay)
+            continue
+
+        limiter.observe(bucket, spec, response.headers)
+        if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            delay = retry_delay(response.headers, attempt)
+            logging.warning(f"{url}: статус {response.status_code}, повтор через {delay:.1f} с.")
+            time.sleep(delay)
+            continue
+        return response
@@ -0,0 +1,322 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from http_client import get, get_sync
+
+CACHE_DB = 'instrument_cache.db'
+# Каталоги инструментов меняются редко: по умолчанию перепроверяем раз в 6 часов
+DEFAULT_TTL = 6 * 60 * 60
+
+
+# Разбор каталогов в единый формат записи
+def _record(symbol, base, quote, settle=None, contract_size=1.0, contract_ccy=None, underlying=None, status=None,
+            kind=None):
+    return {
+        'symbol': symbol,
+        'base': base,
+        'quote': quote,
+        'kind': kind,  # spot, perpetual, future или option
+        'settle': settle,
+        'contract_size': contract_size,
+        'contract_ccy': contract_ccy,
+        'underlying': underlying,
+        'status': status,
+    }
+
+
+def _to_float(value, default=1.0):
+    try:
+        return float(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_binance_spot(payload):
+    return [_record(s['symbol'], s['baseAsset'], s['quoteAsset'], status=s.get('status'), kind='spot')
+            for s in payload.get('symbols', [])]
+
+
+def parse_binance_futures(payload):
+    return [_record(s['symbol'], s['baseAsset'], s['quoteAsset'], settle=s.get('marginAsset'),
+                    underlying=s.get('pair'), status=s.get('status') or s.get('contractStatus'),
+                    kind='perpetual' if s.get('contractType', 'PERPETUAL') == 'PERPETUAL' else 'future')
+            for s in payload.get('symbols', [])]
+
+
+def parse_binance_options(payload):
+    records = []
+    for s in payload.get('optionSymbols', []):
+        underlying = s.get('underlying', '')
+        quote = s.get('quoteAsset')
+        base = underlying[:-len(quote)] if quote and underlying.endswith(quote) else underlying
+        records.append(_record(s['symbol'], base, quote, settle=quote, contract_size=_to_float(s.get('unit')),
+                               underlying=underlying, status=s.get('status'), kind='option'))
+    return records
+
+
+def _bybit_kind(instrument):
+    # У спота нет contractType, у опционов есть optionsType (Call/Put)
+    if instrument.get('optionsType'):
+        return 'option'
+    contract_type = instrument.get('contractType') or ''
+    if contract_type.endswith('Perpetual'):
+        return 'perpetual'
+    return 'future' if contract_type else 'spot'
+
+
+def parse_bybit(payload):
+    return [_record(s['symbol'], s.get('baseCoin'), s.get('quoteCoin'), settle=s.get('settleCoin'),
+                    underlying=s.get('baseCoin'), status=s.get('status'), kind=_bybit_kind(s))
+            for s in payload.get('result', {}).get('list', [])]
+
+
+OKX_KINDS = {'SPOT': 'spot', 'MARGIN': 'spot', 'SWAP': 'perpetual', 'FUTURES': 'future', 'OPTION': 'option'}
+
+
+def parse_okx(payload):
+    records = []
+    for s in payload.get('data', []):
+        # У деривативов baseCcy/quoteCcy пустые, валюты берутся из базового актива (uly), например BTC-USDT
+        uly_parts = (s.get('uly') or '').split('-')
+        base = s.get('baseCcy') or uly_parts[0] or None
+        quote = s.get('quoteCcy') or (uly_parts[1] if len(uly_parts) > 1 else None)
+        records.append(_record(s['instId'], base, quote, settle=s.get('settleCcy') or None,
+                               contract_size=_to_float(s.get('ctVal')), contract_ccy=s.get('ctValCcy') or None,
+                               underlying=s.get('uly') or None, status=s.get('state'),
+                               kind=OKX_KINDS.get(s.get('instType'))))
+    return records
+
+
+def parse_okx_underlyings(payload):
+    # public/underlying отдаёт data = [["BTC-USD", "ETH-USD", ...]]: одна запись на базовый актив
+    records = []
+    for underlying in (payload.get('data') or [[]])[0]:
+        base, _, quote = underlying.partition('-')
+        records.append(_record(underlying, base, quote or None, underlying=underlying, kind='option'))
+    return records
+
+
+# Источники каталогов: (биржа, тип инструмента) -> (URL, функция разбора)
+CATALOGUE_SOURCES = {
+    ('Binance', 'spot'): ("https://api.binance.com/api/v3/exchangeInfo", parse_binance_spot),
+    ('Binance', 'futures'): ("https://fapi.binance.com/fapi/v1/exchangeInfo", parse_binance_futures),
+    ('Binance', 'option'): ("https://eapi.binance.com/eapi/v1/exchangeInfo", parse_binance_options),
+    ('Bybit', 'spot'): ("https://api.bybit.com/v5/market/instruments-info?category=spot&limit=1000", parse_bybit),
+    ('Bybit', 'linear'): ("https://api.bybit.com/v5/market/instruments-info?category=linear&limit=1000", parse_bybit),
+    ('Bybit', 'inverse'): ("https://api.bybit.com/v5/market/instruments-info?category=inverse&limit=1000", parse_bybit),
+    ('Bybit', 'option'): ("https://api.bybit.com/v5/market/instruments-info?category=option&limit=1000", parse_bybit),
+    ('OKX', 'SPOT'): ("https://www.okx.com/api/v5/public/instruments?instType=SPOT", parse_okx),
+    ('OKX', 'SWAP'): ("https://www.okx.com/api/v5/public/instruments?instType=SWAP", parse_okx),
+    ('OKX', 'FUTURES'): ("https://www.okx.com/api/v5/public/instruments?instType=FUTURES", parse_okx),
+    # Инструменты опционов OKX отдаёт только по uly/instFamily, поэтому в каталоге — список базовых активов
+    ('OKX', 'OPTION_UNDERLYING'): ("https://www.okx.com/api/v5/public/underlying?instType=OPTION",
+                                   parse_okx_underlyings),
+}
+
+
+def _next_page_cursor(exchange, payload):
+    # Bybit отдаёт каталог страницами по 1000 инструментов
+    if exchange == 'Bybit':
+        return payload.get('result', {}).get('nextPageCursor') or None
+    return None
+
+
+class InstrumentCache:
+    """
+    Дисковый кэш каталогов инструментов с TTL.
+
+    Каждая пара (биржа, тип инструмента) хранится одной строкой: нормализованные записи
+    (base/quote, размер контракта, валюта расчётов, статус) и валидаторы HTTP (ETag/Last-Modified)
+    для условной перепроверки после истечения TTL.
+    """
+
+    def __init__(self, db_path=CACHE_DB, ttl=DEFAULT_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._create_table()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _create_table(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS instrument_catalogue (
+                    exchange TEXT NOT NULL,
+                    inst_type TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,     -- Время последней загрузки или перепроверки (epoch)
+                    etag TEXT,
+                    last_modified TEXT,
+                    records TEXT NOT NULL,        -- JSON со списком нормализованных записей
+                    PRIMARY KEY (exchange, inst_type)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, exchange, inst_type):
+        """Возвращает (records, fetched_at, etag, last_modified) или None, если каталога нет."""
+        key = (exchange, inst_type)
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT records, fetched_at, etag, last_modified FROM instrument_catalogue '
+                'WHERE exchange = ? AND inst_type = ?', key).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        entry = (json.loads(row[0]), row[1], row[2], row[3])
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry[1] < self.ttl
+
+    def store(self, exchange, inst_type, records, etag=None, last_modified=None):
+        entry = (records, time.time(), etag, last_modified)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT INTO instrument_catalogue (exchange, inst_type, fetched_at, etag, last_modified, records)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(exchange, inst_type) DO UPDATE SET
+                        fetched_at = excluded.fetched_at,
+                        etag = excluded.etag,
+                        last_modified = excluded.last_modified,
+                        records = excluded.records
+                ''', (exchange, inst_type, entry[1], etag, last_modified, json.dumps(records, separators=(',', ':'))))
+        finally:
+            conn.close()
+        with self._lock:
+            self._memory[(exchange, inst_type)] = entry
+        return records
+
+    def touch(self, exchange, inst_type, entry):
+        """Продлевает срок жизни каталога после ответа 304 Not Modified."""
+        refreshed = (entry[0], time.time(), entry[2], entry[3])
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('UPDATE instrument_catalogue SET fetched_at = ? WHERE exchange = ? AND inst_type = ?',
+                             (refreshed[1], exchange, inst_type))
+        finally:
+            conn.close()
+        with self._lock:
+            self._memory[(exchange, inst_type)] = refreshed
+        return refreshed[0]
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = InstrumentCache()
+    return _default_cache
+
+
+class _CatalogueLoad:
+    """
+    Загрузка каталога без ввода-вывода, общая для асинхронного и синхронного клиента: свежий ли кэш,
+    какую страницу запрашивать (с условными заголовками на первой), курсор следующей страницы,
+    разбор ответа и запись в кэш. Клиенты только выполняют запросы, поэтому не могут разойтись.
+    """
+
+    def __init__(self, cache, exchange, inst_type):
+        self.cache = cache
+        self.exchange = exchange
+        self.inst_type = inst_type
+        self.entry = cache.get(exchange, inst_type)
+        self.url, self.parse = CATALOGUE_SOURCES[(exchange, inst_type)]
+        self.records = []
+        self.cursor = None
+        self.validators = (None, None)
+
+    def cached(self):
+        """Записи из кэша, если он свежий, иначе None."""
+        return self.entry[0] if self.cache.is_fresh(self.entry) else None
+
+    def request(self):
+        """
+        (URL, параметры, заголовки) очередной страницы: ETag/If-Modified-Since отправляются только с первой.
+        Курсор передаётся параметром, чтобы HTTP-клиент экранировал его (у Bybit в нём есть '%' и '=').
+        """
+        if self.cursor:
+            return self.url, {'cursor': self.cursor}, {}
+        headers = {}
+        if self.entry is not None:
+            if self.entry[2]:
+                headers['If-None-Match'] = self.entry[2]
+            if self.entry[3]:
+                headers['If-Modified-Since'] = self.entry[3]
+        return self.url, None, headers
+
+    def not_modified(self):
+        logging.info(f"Каталог {self.exchange} ({self.inst_type}) не изменился.")
+        return self.cache.touch(self.exchange, self.inst_type, self.entry)
+
+    def add_page(self, payload, headers):
+        """Разбирает страницу; возвращает True, если есть следующая."""
+        if self.cursor is None:
+            self.validators = (headers.get('ETag'), headers.get('Last-Modified'))
+        self.records.extend(self.parse(payload))
+        self.cursor = _next_page_cursor(self.exchange, payload)
+        return bool(self.cursor)
+
+    def finish(self):
+        logging.info(f"Каталог {self.exchange} ({self.inst_type}): {len(self.records)} инструментов сохранено в кэш.")
+        return self.cache.store(self.exchange, self.inst_type, self.records, *self.validators)
+
+
+async def load_instruments(session, exchange, inst_type, cache=None):
+    """Каталог инструментов через aiohttp: из кэша, если он свежий, иначе с условной перепроверкой."""
+    load = _CatalogueLoad(cache or default_cache(), exchange, inst_type)
+    records = load.cached()
+    if records is not None:
+        return records
+
+    logging.info(f"Загрузка каталога инструментов {exchange} ({inst_type})...")
+    while True:
+        url, params, headers = load.request()
+        async with get(session, url, params=params, headers=headers) as response:
+            if response.status == 304:
+                return load.not_modified()
+            response.raise_for_status()
+            payload = await response.json(content_type=None)
+            more = load.add_page(payload, response.headers)
+        if not more:
+            return load.finish()
+
+
+def load_instruments_sync(session, exchange, inst_type, cache=None):
+    """То же, что load_instruments, для синхронных сборщиков на requests (session=None — общая сессия)."""
+    load = _CatalogueLoad(cache or default_cache(), exchange, inst_type)
+    records = load.cached()
+    if records is not None:
+        return records
+
+    logging.info(f"Загрузка каталога инструментов {exchange} ({inst_type})...")
+    while True:
+        url, params, headers = load.request()
+        response = get_sync(url, params=params, headers=headers, session=session)
+        if response.status_code == 304:
+            return load.not_modified()
+        response.raise_for_status()
+        if not load.add_page(response.json(), response.headers):
+            return load.finish()
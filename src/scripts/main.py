@@ -7,21 +7,45 @@ import requests
 import logging
 from datetime import datetime, timedelta
 import os
-import threading
+import asyncio
+import aiohttp
+import numpy as np
+from functools import partial
+from itertools import repeat
 
 import sys
 import locale
 
+from change_tracker import ChangeTracker
+from db_writer import connect, bulk_upsert, snapshot_timestamp
+from http_client import REQUEST_TIMEOUT, HEADERS, create_session, get, get_json, get_sync
+from market_history import MarketHistory
+from price_index import PriceIndex
+from symbol_registry import load_registry
+from ticker_stream import (TickerColumns, read_tickers, BINANCE_TICKER_FIELDS, BYBIT_TICKER_FIELDS,
+                           OKX_TICKER_FIELDS)
+
+
+def setup_process():
+    """
+    Логирование и локаль процесса. Вызывается только при запуске main.py как скрипта:
+    служба сборщика импортирует модуль внутри процесса дашборда и не должна их менять.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+
+    # Устанавливаем локаль для корректной обработки русского языка
+    try:
+        locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
+    except locale.Error:
+        logging.warning("Локаль ru_RU.UTF-8 недоступна, используется локаль по умолчанию.")
 
-# Устанавливаем локаль для корректной обработки русского языка
-locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
-
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Принудительно установить SelectorEventLoop на Windows
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
 def create_db():
@@ -56,45 +80,62 @@ def create_db():
 
 
 
-def save_to_db(data, exchange, market_type):
-    conn = sqlite3.connect('market_data.db')
-    cursor = conn.cursor()
+# Колонки market_data, которые записываются при каждом снимке
+MARKET_DATA_COLUMNS = ('symbol', 'exchange', 'market_type', 'last_price', 'volume_24h', 'price_usdt',
+                       'high_price_24h', 'low_price_24h', 'trades_24h', 'timestamp', 'updated_time')
+MARKET_DATA_KEY = ('symbol', 'exchange', 'market_type')
+
+# Значения, по которым определяется, изменилась ли строка (временные метки не учитываются)
+CHANGE_TRACKER = ChangeTracker('market_data', MARKET_DATA_COLUMNS, MARKET_DATA_KEY, MARKET_DATA_COLUMNS[3:9])
+
+
+def build_market_rows(tickers, exchange, market_type, timestamp):
+    """Собирает кортежи для записи прямо из колонок снимка (массивы NumPy переводятся в числа Python разом)."""
+    count = len(tickers)
+    return list(zip(
+        tickers.symbols, repeat(exchange, count), repeat(market_type, count),
+        *(tickers.numpy(name).tolist() for name in ('last', 'volume', 'price_usdt', 'high', 'low')),
+        tickers.numpy('count').astype(np.int64).tolist(),
+        repeat(timestamp, count),
+        repeat(timestamp, count),  # Время обновления
+    ))
+
+
+def save_to_db(tickers, exchange, market_type, timestamp=None, conn=None, history=None, record_history=True):
+    """
+    Записывает только изменившиеся инструменты; возвращает (записано, пропущено).
+    Переданные соединения (conn, history) остаются открытыми — так их переиспользует служба сборщика.
+    record_history=False не дописывает снимок в историю: потоковый режим пишет её по своему расписанию.
+    """
+    timestamp = timestamp or snapshot_timestamp()
+    rows = build_market_rows(tickers, exchange, market_type, timestamp)
+
+    own_conn = conn is None
+    conn = conn or connect('market_data.db')
+    try:
+        CHANGE_TRACKER.load(conn)
+        changed, skipped = CHANGE_TRACKER.split(rows)
+
+        # Вся пачка биржи записывается одной транзакцией
+        written = bulk_upsert(conn, 'market_data', MARKET_DATA_COLUMNS, MARKET_DATA_KEY,
+                              MARKET_DATA_COLUMNS[3:], changed)
+        CHANGE_TRACKER.remember(changed)
+    finally:
+        if own_conn:
+            conn.close()
 
-    for item in data:
+    # Полный снимок дописывается в историю (market_history.db)
+    if record_history:
+        own_history = history is None
+        history = history or MarketHistory()
         try:
-            symbol = item.get('symbol') if exchange != 'OKX' else item.get('instId')
-            last_price = float(item.get('lastPrice') or item.get('last') or 0)
-            volume_24h = float(item.get('volume24h') or item.get('turnover24h') or item.get('vol24h') or 0)
-            price_usdt = float(item.get('price_usdt') or 0)
-            high_price_24h = float(item.get('highPrice24h') or item.get('high24h') or 0)
-            low_price_24h = float(item.get('lowPrice24h') or item.get('low24h') or 0)
-            trades_24h = int(item.get('count') or 0)
-            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-            updated_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")  # Время обновления
-
-            # Выполняем вставку или обновление записи
-            cursor.execute('''
-                INSERT INTO market_data (symbol, exchange, market_type, last_price, volume_24h,
-                                         price_usdt, high_price_24h, low_price_24h, trades_24h, timestamp, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, exchange, market_type) DO UPDATE SET
-                    last_price = excluded.last_price,
-                    volume_24h = excluded.volume_24h,
-                    price_usdt = excluded.price_usdt,
-                    high_price_24h = excluded.high_price_24h,
-                    low_price_24h = excluded.low_price_24h,
-                    trades_24h = excluded.trades_24h,
-                    timestamp = excluded.timestamp,
-                    updated_time = excluded.updated_time
-            ''', (symbol, exchange, market_type, last_price, volume_24h,
-                  price_usdt, high_price_24h, low_price_24h, trades_24h, timestamp, updated_time))
-
-        except Exception as e:
-            logging.error(f"Error processing data for {symbol}: {e}", exc_info=True)
-            continue
+            history.append(rows, timestamp)
+        finally:
+            if own_history:
+                history.close()
 
-    conn.commit()
-    conn.close()
+    logging.info(f"{exchange} ({market_type}): записано {written}, без изменений пропущено {skipped}.")
+    return written, skipped
 
 
 
@@ -137,361 +178,232 @@ def remove_duplicates():
 
 
 
-def get_binance_spot_data():
-    # Получаем информацию о символах для маппинга базовых и котируемых валют
-    exchange_info_url = "https://api.binance.com/api/v3/exchangeInfo"
-    logging.info("Получение информации о символах с Binance...")
-    response = requests.get(exchange_info_url)
-    response.raise_for_status()
-    exchange_info = response.json()
-    symbol_info = {}
-    for s in exchange_info['symbols']:
-        symbol_info[s['symbol']] = {'baseAsset': s['baseAsset'], 'quoteAsset': s['quoteAsset']}
+async def fetch_json(session, url):
+    return await get_json(session, url)
+
+
+class SnapshotIndexes:
+    """Индексы цен текущего снимка: спотовый рынок биржи публикует индекс, фьючерсный рынок его ожидает."""
+
+    def __init__(self):
+        self._futures = {}
+
+    def _future(self, exchange):
+        if exchange not in self._futures:
+            self._futures[exchange] = asyncio.get_running_loop().create_future()
+        return self._futures[exchange]
+
+    def publish(self, exchange, price_index):
+        future = self._future(exchange)
+        if not future.done():
+            future.set_result(price_index)
 
-    # Получаем данные 24-часового тикера
+    async def get(self, exchange):
+        return await self._future(exchange)
+
+
+def build_price_index(tickers):
+    """Строит индекс цен один раз на снимок по колонкам тикеров."""
+    price_index = PriceIndex()
+    last = tickers.column('last')
+    for row, symbol in enumerate(tickers.symbols):
+        price_index.add(symbol, tickers.base[row], tickers.quote[row], last[row])
+    return price_index
+
+
+def fill_price_usdt(tickers, price_index, base_volume='volume', quote_volume='quote_volume', rows=None):
+    """
+    Пересчитывает оборот каждой пары в USDT через индекс цен (в том числе через несколько переходов).
+    Пересчёт идёт над колонками как массивами NumPy; rows ограничивает его указанными строками
+    (потоковый режим обновляет только изменившиеся).
+    """
+    rows = np.array([row for row in (range(len(tickers)) if rows is None else rows)
+                     if tickers.base[row] is not None], dtype=np.intp)
+    if not len(rows):
+        return
+    base_volumes = tickers.numpy(base_volume)[rows]
+    quote_volumes = tickers.numpy(quote_volume)[rows] if quote_volume else np.zeros(len(rows))
+    tickers.numpy('price_usdt')[rows] = price_index.volume_usdt(
+        [tickers.base[row] for row in rows], [tickers.quote[row] for row in rows], base_volumes, quote_volumes)
+
+
+# Символы без базовой и котируемой валют, о которых уже предупреждали (предупреждение — один раз на символ)
+_UNRESOLVED_SYMBOLS = set()
+
+
+def assign_assets(tickers, registry, exchange, market_type):
+    """
+    Заполняет базовую и котируемую валюты по реестру символов (одно обращение к словарю на символ).
+    Возвращает снимок без символов, валюты которых определить не удалось: они не записываются.
+    """
+    keep = []
+    for row, symbol in enumerate(tickers.symbols):
+        assets = registry.resolve(exchange, market_type, symbol)
+        if assets is None:
+            if (exchange, market_type, symbol) not in _UNRESOLVED_SYMBOLS:
+                _UNRESOLVED_SYMBOLS.add((exchange, market_type, symbol))
+                logging.warning(f"Не удалось определить базовую и котируемую валюты для символа {symbol}, пропускаем его.")
+            continue
+        tickers.base[row], tickers.quote[row] = assets[0], assets[1]
+        keep.append(row)
+    return tickers if len(keep) == len(tickers) else tickers.subset(keep)
+
+
+async def fetch_tickers(session, url, symbol_key, fields, array_key=None):
+    """Загружает тикеры потоково, разбирая JSON по мере получения прямо в колонки."""
+    async with get(session, url) as response:
+        response.raise_for_status()
+        return await read_tickers(response, symbol_key, fields, array_key)
+
+
+async def get_binance_spot_data(session, indexes):
+    # Каталог символов (из кэша, если он свежий) и 24-часовой тикер запрашиваются параллельно
     url = "https://api.binance.com/api/v3/ticker/24hr"
-    logging.info("Запрос данных с Binance (спотовый рынок)...")
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-
-    logging.info(f"Получено {len(data)} инструментов с Binance (спотовый рынок).")
-
-    # Функция для извлечения базовой и котируемой валют из символа
-    def extract_assets(symbol):
-        known_quote_assets = ['USDT', 'BTC', 'ETH', 'BNB', 'BUSD', 'EUR', 'TRY', 'BIDR', 'RUB', 'AUD', 'BRL', 'GBP',
-                              'TUSD', 'DAI', 'IDRT']
-        for quote_asset in known_quote_assets:
-            if symbol.endswith(quote_asset):
-                base_asset = symbol[:-len(quote_asset)]
-                return base_asset, quote_asset
-        return None, None
-
-    # Функция для расчета цены в USDT для кросс-курсов с учетом объемов
-    def calculate_cross_pair_price(baseAsset, quoteAsset, item, data):
-        # Найдем цену для базовой и котируемой валюты в USDT
-        base_to_usdt = next((float(i['lastPrice']) for i in data if i['symbol'] == f"{baseAsset}USDT"), None)
-        quote_to_usdt = next((float(i['lastPrice']) for i in data if i['symbol'] == f"{quoteAsset}USDT"), None)
-
-        if base_to_usdt and quote_to_usdt:
-            # Рассчитываем цену кросс-курса в USDT через промежуточные пары
-            cross_price_in_usdt = base_to_usdt / quote_to_usdt  # Это цена 1 базовой валюты в USDT
-            return cross_price_in_usdt * item['volume24h']  # Умножаем на объем, чтобы получить сумму в USDT
-        return 0.0  # Если не удалось найти цену, возвращаем 0
-
-    # Обрабатываем данные
-    for item in data:
-        symbol = item['symbol']
-        if symbol in symbol_info:
-            baseAsset = symbol_info[symbol]['baseAsset']
-            quoteAsset = symbol_info[symbol]['quoteAsset']
-        else:
-            logging.warning(
-                f"Символ {symbol} не найден в exchangeInfo, пытаемся извлечь базовую и котируемую валюты из символа.")
-            baseAsset, quoteAsset = extract_assets(symbol)
-            if baseAsset is None or quoteAsset is None:
-                logging.warning(
-                    f"Не удалось определить базовую и котируемую валюты для символа {symbol}, пропускаем его.")
-                continue  # Пропускаем символ, если не удалось определить валюты
-        item['baseAsset'] = baseAsset
-        item['quoteAsset'] = quoteAsset
-
-        # Извлекаем остальные поля
-        item['highPrice24h'] = float(item.get('highPrice', 0) or 0)
-        item['lowPrice24h'] = float(item.get('lowPrice', 0) or 0)
-        item['volume24h'] = float(item.get('volume', 0) or 0)  # Объем в базовой валюте
-        item['quoteVolume24h'] = float(item.get('quoteVolume', 0) or 0)  # Объем в котируемой валюте
-        item['lastPrice'] = float(item.get('lastPrice', 0) or 0)
-        item['count'] = int(float(item.get('count', 0)) or 0)  # Количество сделок за 24 часа
-
-        # Логика расчета цены в USDT
-        if item['quoteAsset'] == 'USDT':
-            # Котируемая валюта — USDT, объем в USDT уже известен
-            item['price_usdt'] = item['quoteVolume24h']
-        elif item['baseAsset'] == 'USDT':
-            # Базовая валюта — USDT, объем в базовой валюте
-            item['price_usdt'] = item['volume24h']
-        else:
-            # Если это кросс-курс (например, ETHBTC), рассчитываем через промежуточные пары
-            item['price_usdt'] = calculate_cross_pair_price(baseAsset, quoteAsset, item, data)
+    logging.info("Запрос информации о символах и данных с Binance (спотовый рынок)...")
+    registry, tickers = await asyncio.gather(
+        load_registry(session, [('Binance', 'spot')]),
+        fetch_tickers(session, url, 'symbol', BINANCE_TICKER_FIELDS))
+    tickers, price_index = await asyncio.to_thread(process_binance_spot_data, registry, tickers)
+    indexes.publish('Binance', price_index)
+    return tickers
 
-    logging.info(f"Данные с Binance (спотовый рынок) успешно получены: {data[:5]}...")
-    return data
+
+def process_binance_spot_data(registry, tickers):
+    logging.info(f"Получено {len(tickers)} инструментов с Binance (спотовый рынок).")
+    tickers = assign_assets(tickers, registry, 'Binance', 'spot')
+
+    # Оборот в USDT: для USDT-пар напрямую, для кросс-курсов (например, ETHBTC) через индекс цен
+    price_index = build_price_index(tickers)
+    fill_price_usdt(tickers, price_index)
+
+    logging.info(f"Данные с Binance (спотовый рынок) успешно получены: {tickers.symbols[:5]}...")
+    return tickers, price_index
 
 
 # Получение данных с Binance для фьючерсного рынка
-def get_binance_futures_data():
-    # Получаем информацию о символах для маппинга базовых и котируемых валют
-    exchange_info_url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-    logging.info("Получение информации о символах с Binance (фьючерсный рынок)...")
-    response = requests.get(exchange_info_url)
-    response.raise_for_status()
-    exchange_info = response.json()
-    symbol_info = {}
-    for s in exchange_info['symbols']:
-        symbol_info[s['symbol']] = {'baseAsset': s['baseAsset'], 'quoteAsset': s['quoteAsset']}
-
-    # Получаем данные 24-часового тикера
+async def get_binance_futures_data(session, indexes):
+    # Каталог символов (из кэша, если он свежий) и 24-часовой тикер запрашиваются параллельно
     url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-    logging.info("Запрос данных с Binance (фьючерсный рынок)...")
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    logging.info(f"Получено {len(data)} инструментов с Binance (фьючерсный рынок).")
-
-    for item in data:
-        symbol = item['symbol']
-        if symbol in symbol_info:
-            baseAsset = symbol_info[symbol]['baseAsset']
-            quoteAsset = symbol_info[symbol]['quoteAsset']
-        else:
-            logging.warning(f"Символ {symbol} не найден в exchangeInfo, пропускаем его.")
-            continue  # Пропускаем символ, если нет информации
-
-        item['baseAsset'] = baseAsset
-        item['quoteAsset'] = quoteAsset
-
-        item['highPrice24h'] = float(item.get('highPrice', 0) or 0)
-        item['lowPrice24h'] = float(item.get('lowPrice', 0) or 0)
-        item['volume24h'] = float(item.get('volume', 0) or 0)  # Объем в базовой валюте
-        item['quoteVolume24h'] = float(item.get('quoteVolume', 0) or 0)  # Объем в котируемой валюте
-        item['lastPrice'] = float(item.get('lastPrice', 0) or 0)
-        item['count'] = int(float(item.get('count', 0)) or 0)
-
-        # Определяем price_usdt
-        if item['quoteAsset'] == 'USDT':
-            item['price_usdt'] = item['quoteVolume24h']
-        elif item['baseAsset'] == 'USDT':
-            item['price_usdt'] = item['volume24h']
-        else:
-            item['price_usdt'] = 0.0
-
-    logging.info(f"Данные с Binance (фьючерсный рынок) успешно получены: {data[:5]}...")
-    return data
+    logging.info("Запрос информации о символах и данных с Binance (фьючерсный рынок)...")
+    registry, tickers = await asyncio.gather(
+        load_registry(session, [('Binance', 'futures')]),
+        fetch_tickers(session, url, 'symbol', BINANCE_TICKER_FIELDS))
 
+    # Курсы котируемых валют (например, USDC) берутся из индекса спотового рынка того же снимка
+    price_index = await indexes.get('Binance')
+    return await asyncio.to_thread(process_binance_futures_data, registry, tickers, price_index)
 
 
+def process_binance_futures_data(registry, tickers, price_index):
+    logging.info(f"Получено {len(tickers)} инструментов с Binance (фьючерсный рынок).")
 
+    tickers = assign_assets(tickers, registry, 'Binance', 'futures')
+    fill_price_usdt(tickers, price_index)
 
+    logging.info(f"Данные с Binance (фьючерсный рынок) успешно получены: {tickers.symbols[:5]}...")
+    return tickers
 
 
-def get_bybit_spot_data(binance_data=None):
+async def get_bybit_spot_data(session, indexes):
     url = "https://api.bybit.com/v5/market/tickers?category=spot"
     logging.info(f"Запрос данных с Bybit (спотовый рынок) ({url})...")
-    response = requests.get(url)
-    response.raise_for_status()
-    result = response.json().get('result', {}).get('list', [])
-    data = []
-
-    known_quote_currencies = ['USDT', 'BTC', 'ETH', 'USDC', 'DAI', 'BNB', 'BUSD']
-
-    for item in result:
-        symbol = item.get('symbol')
-        base_currency, quote_currency = None, None
-
-        # Извлекаем базовую и котируемую валюты
-        for qc in known_quote_currencies:
-            if symbol.endswith(qc):
-                base_currency = symbol[:-len(qc)]
-                quote_currency = qc
-                break
-
-        if base_currency is None or quote_currency is None:
-            logging.warning(f"Не удалось определить базовую и котируемую валюты для символа {symbol}, пропускаем его.")
-            continue
+    registry, tickers = await asyncio.gather(
+        load_registry(session, [('Bybit', 'spot')]),
+        fetch_tickers(session, url, 'symbol', BYBIT_TICKER_FIELDS, array_key='list'))
+    tickers, price_index = await asyncio.to_thread(process_bybit_spot_data, registry, tickers)
+    indexes.publish('Bybit', price_index)
+    return tickers
 
-        item['baseAsset'] = base_currency
-        item['quoteAsset'] = quote_currency
-        item['lastPrice'] = float(item.get('lastPrice') or 0)
-        item['volume24h'] = float(item.get('volume24h') or 0)
-        item['quoteVolume24h'] = float(item.get('turnover24h') or 0)
-        item['highPrice24h'] = float(item.get('highPrice24h') or 0)
-        item['lowPrice24h'] = float(item.get('lowPrice24h') or 0)
-
-        # Устанавливаем количество сделок в 0, так как запросы о трейдах исключены
-        item['count'] = 0
-
-        # Определяем цену в USDT
-        if quote_currency == 'USDT':
-            item['price_usdt'] = item['quoteVolume24h']
-        elif base_currency == 'USDT':
-            item['price_usdt'] = item['volume24h']
-        else:
-            item['price_usdt'] = 0.0
 
-        data.append(item)
+def process_bybit_spot_data(registry, tickers):
+    tickers = assign_assets(tickers, registry, 'Bybit', 'spot')
 
-    logging.info(f"Получено {len(data)} инструментов с Bybit (спотовый рынок).")
-    return data
+    # Количество сделок остаётся 0, так как запросы о трейдах исключены
+    price_index = build_price_index(tickers)
+    fill_price_usdt(tickers, price_index)
 
+    logging.info(f"Получено {len(tickers)} инструментов с Bybit (спотовый рынок).")
+    return tickers, price_index
 
-def get_bybit_futures_data(binance_data=None):
-    categories = ['linear', 'inverse']
-    data = []
 
-    for category in categories:
-        url = f"https://api.bybit.com/v5/market/tickers?category={category}"
-        logging.info(f"Запрос данных с Bybit (фьючерсный рынок) ({category}) ({url})...")
+# Категории фьючерсного рынка Bybit: USDT/USDC-маржинальные и коин-маржинальные контракты
+BYBIT_FUTURES_CATEGORIES = ('linear', 'inverse')
 
-        # Запрос данных
-        response = requests.get(url)
-        response.raise_for_status()
-        result = response.json().get('result', {}).get('list', [])
-
-        known_quote_currencies = ['USDT', 'BTC', 'ETH', 'USDC', 'DAI', 'BNB', 'BUSD']
-
-        for item in result:
-            symbol = item.get('symbol')
-
-            # Извлекаем базовую и котируемую валюты из символа
-            base_currency, quote_currency = None, None
-            for qc in known_quote_currencies:
-                if symbol.endswith(qc):
-                    base_currency = symbol[:-len(qc)]
-                    quote_currency = qc
-                    break
-
-            if base_currency is None or quote_currency is None:
-                logging.warning(
-                    f"Не удалось определить базовую и котируемую валюты для символа {symbol}, пропускаем его.")
-                continue
-
-            item['baseAsset'] = base_currency
-            item['quoteAsset'] = quote_currency
-
-            # Извлекаем необходимые поля
-            item['lastPrice'] = float(item.get('lastPrice') or 0)
-            item['volume24h'] = float(item.get('volume24h') or 0)
-            item['quoteVolume24h'] = float(item.get('turnover24h') or 0)
-            item['highPrice24h'] = float(item.get('highPrice24h') or 0)
-            item['lowPrice24h'] = float(item.get('lowPrice24h') or 0)
-
-            # Оценка количества сделок на основе объема Bybit и данных Binance
-            item['count'] = 0
-
-            # Определяем price_usdt
-            if category == 'linear' and quote_currency == 'USDT':
-                # Для USDT-маржинальных контрактов котируемая валюта — USDT
-                item['price_usdt'] = item['quoteVolume24h']
-            elif category == 'inverse' and base_currency == 'USDT':
-                # Для коин-маржинальных контрактов базовая валюта — USDT
-                item['price_usdt'] = item['volume24h']
-            else:
-                # Ни базовая, ни котируемая валюта не являются USDT
-                item['price_usdt'] = 0.0
-
-            data.append(item)
-
-        logging.info(f"Получено {len(result)} инструментов с Bybit по категории {category}.")
 
+async def get_bybit_category_data(session, indexes, category):
+    url = f"https://api.bybit.com/v5/market/tickers?category={category}"
+    registry, tickers = await asyncio.gather(
+        load_registry(session, [('Bybit', category)]),
+        fetch_tickers(session, url, 'symbol', BYBIT_TICKER_FIELDS, array_key='list'))
+
+    # Курсы валют берутся из индекса спотового рынка Bybit того же снимка
+    price_index = await indexes.get('Bybit')
+    return await asyncio.to_thread(process_bybit_futures_data, registry, {category: tickers}, price_index)
+
+
+async def get_bybit_futures_data(session, indexes):
+    logging.info(f"Запрос данных с Bybit (фьючерсный рынок) ({', '.join(BYBIT_FUTURES_CATEGORIES)})...")
+
+    # Категории linear и inverse запрашиваются параллельно
+    results = await asyncio.gather(
+        *(get_bybit_category_data(session, indexes, category) for category in BYBIT_FUTURES_CATEGORIES))
+
+    data = TickerColumns()
+    for tickers in results:
+        data.extend(tickers)
     logging.info(f"Всего получено {len(data)} инструментов с Bybit (фьючерсный рынок).")
     return data
 
 
-# Функция для сопоставления символов между Bybit и Binance
-def map_symbol_bybit_to_binance(symbol):
-    # Убираем слеши или другие символы, если они отличаются
-    symbol = symbol.replace('/', '')
-    # Добавьте логику для изменения символов, если они отличаются между биржами
-    return symbol
-
-
-def get_okx_spot_data():
-    # Получаем информацию о символах для маппинга базовых и котируемых валют
-    exchange_info_url = "https://www.okx.com/api/v5/public/instruments?instType=SPOT"
-    logging.info("Получение информации о символах с OKX...")
-
-    response = requests.get(exchange_info_url)
-    response.raise_for_status()  # Проверяем, что запрос прошел успешно
-    exchange_info = response.json().get('data', [])
-
-    symbol_info = {}
-    for s in exchange_info:
-        symbol_info[s['instId']] = {'baseAsset': s['baseCcy'], 'quoteAsset': s['quoteCcy']}
-
-    # Функция для извлечения базовой и котируемой валют из символа
-    def extract_assets(symbol):
-        known_quote_assets = ['USDT', 'BTC', 'ETH', 'BNB', 'BUSD', 'EUR', 'TRY', 'BIDR', 'RUB', 'AUD', 'BRL', 'GBP',
-                              'TUSD', 'DAI', 'IDRT']
-        for quote_asset in known_quote_assets:
-            if symbol.endswith(quote_asset):
-                base_asset = symbol[:-len(quote_asset)]
-                return base_asset, quote_asset
-        return None, None
-
-    # Функция для расчета цены в USDT для кросс-курсов с учетом объемов
-    def calculate_cross_pair_price(baseAsset, quoteAsset, item, data):
-        # Найдем цену для базовой и котируемой валюты в USDT
-        base_to_usdt = next((float(i['last']) for i in data if i['instId'] == f"{baseAsset}-USDT"), None)
-        quote_to_usdt = next((float(i['last']) for i in data if i['instId'] == f"{quoteAsset}-USDT"), None)
-
-        if base_to_usdt and quote_to_usdt:
-            # Рассчитываем цену кросс-курса в USDT через промежуточные пары
-            cross_price_in_usdt = base_to_usdt / quote_to_usdt  # Это цена 1 базовой валюты в USDT
-            return cross_price_in_usdt * item['volume24h']  # Умножаем на объем, чтобы получить сумму в USDT
-        return 0.0  # Если не удалось найти цену, возвращаем 0
-
-    # Получаем данные 24-часового тикера
-    url = "https://www.okx.com/api/v5/market/tickers?instType=SPOT"
-    logging.info("Запрос данных с OKX (спотовый рынок)...")
-
-    response = requests.get(url)
-    if response.status_code != 200:
-        logging.error(f"Ошибка при запросе данных: {response.status_code}")
-        return []
+def process_bybit_futures_data(registry, results, price_index):
+    data = TickerColumns()
 
-    data = response.json().get('data', [])
-    logging.info(f"Получено {len(data)} инструментов с OKX (спотовый рынок).")
+    for category, tickers in results.items():
+        tickers = assign_assets(tickers, registry, 'Bybit', 'futures')
 
-    # Обрабатываем данные
-    for item in data:
-        symbol = item['instId']
-        if symbol in symbol_info:
-            baseAsset = symbol_info[symbol]['baseAsset']
-            quoteAsset = symbol_info[symbol]['quoteAsset']
+        # Определяем price_usdt через индекс цен спотового рынка
+        if category == 'inverse':
+            # Для коин-маржинальных контрактов оборот (turnover24h) указан в базовой валюте
+            fill_price_usdt(tickers, price_index, base_volume='quote_volume', quote_volume=None)
         else:
-            logging.warning(
-                f"Символ {symbol} не найден в exchangeInfo, пытаемся извлечь базовую и котируемую валюты из символа.")
-            baseAsset, quoteAsset = extract_assets(symbol)
-            if baseAsset is None or quoteAsset is None:
-                logging.warning(
-                    f"Не удалось определить базовую и котируемую валюты для символа {symbol}, пропускаем его.")
-                continue  # Пропускаем символ, если не удалось определить валюты
-
-        item['baseAsset'] = baseAsset
-        item['quoteAsset'] = quoteAsset
-
-        # Извлекаем остальные поля
-        item['highPrice24h'] = float(item.get('high24h', 0) or 0)
-        item['lowPrice24h'] = float(item.get('low24h', 0) or 0)
-        item['volume24h'] = float(item.get('vol24h', 0) or 0)  # Объем в базовой валюте
-        item['quoteVolume24h'] = float(item.get('volCcy24h', 0) or 0)  # Объем в котируемой валюте
-        item['lastPrice'] = float(item.get('last', 0) or 0)
-
-        # Логика расчета объема в USDT
-        if item['quoteAsset'] == 'USDT':
-            # Котируемая валюта — USDT, объем в USDT уже известен
-            item['price_usdt'] = item['quoteVolume24h']
-        elif item['baseAsset'] == 'USDT':
-            # Базовая валюта — USDT, объем в базовой валюте
-            item['price_usdt'] = item['volume24h']
-        else:
-            # Если это кросс-курс (например, ETHBTC), рассчитываем через промежуточные пары
-            item['price_usdt'] = calculate_cross_pair_price(baseAsset, quoteAsset, item, data)
+            fill_price_usdt(tickers, price_index)
+
+        data.extend(tickers)
+        logging.info(f"Получено {len(tickers)} инструментов с Bybit по категории {category}.")
 
-    logging.info(f"Данные с OKX (спотовый рынок) успешно получены: {data[:5]}...")
     return data
 
 
+async def get_okx_spot_data(session, indexes):
+    # Каталог символов (из кэша, если он свежий) и 24-часовой тикер запрашиваются параллельно
+    url = "https://www.okx.com/api/v5/market/tickers?instType=SPOT"
+    logging.info("Запрос информации о символах и данных с OKX (спотовый рынок)...")
+    registry, tickers = await asyncio.gather(
+        load_registry(session, [('OKX', 'SPOT')]),
+        fetch_tickers(session, url, 'instId', OKX_TICKER_FIELDS, array_key='data'))
+    tickers, price_index = await asyncio.to_thread(process_okx_spot_data, registry, tickers)
+    indexes.publish('OKX', price_index)
+    return tickers
+
+
+def process_okx_spot_data(registry, tickers):
+    logging.info(f"Получено {len(tickers)} инструментов с OKX (спотовый рынок).")
+    tickers = assign_assets(tickers, registry, 'OKX', 'spot')
+
+    # Оборот в USDT: для USDT-пар напрямую, для кросс-курсов (например, ETH-BTC) через индекс цен
+    price_index = build_price_index(tickers)
+    fill_price_usdt(tickers, price_index)
+
+    logging.info(f"Данные с OKX (спотовый рынок) успешно получены: {tickers.symbols[:5]}...")
+    return tickers, price_index
+
+
 
 
 
 def fetch_data(url):
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (compatible; OKXDataCollector/1.0)"
-        }
-        response = requests.get(url, headers=headers)
+        response = get_sync(url)
         response.raise_for_status()
         return response.json().get('data', [])
     except requests.exceptions.RequestException as e:
@@ -507,34 +419,88 @@ def display_current_data():
         logging.info(f"Запись: {record}")
     conn.close()
 
-def background_update():
-    logging.info("Фоновое обновление данных началось.")
-
-    # Получение и сохранение данных с Binance (спотовый рынок)
-    binance_spot_data = get_binance_spot_data()
-    save_to_db(binance_spot_data, 'Binance', 'spot')
+# Биржи и рынки, которые собираются в одном снимке
+VENUES = [
+    ('Binance', 'spot', get_binance_spot_data),
+    ('Binance', 'futures', get_binance_futures_data),
+    ('Bybit', 'spot', get_bybit_spot_data),
+    ('Bybit', 'futures', get_bybit_futures_data),
+    ('OKX', 'spot', get_okx_spot_data),
+]
+
+# Потоковый режим: (биржа, рынок, поток WebSocket, начальный снимок через REST).
+# Ключ потока совпадает с ключом STREAM_SOURCES в ticker_ws
+STREAM_VENUES = [
+    ('Binance', 'spot', ('Binance', 'spot'), get_binance_spot_data),
+    ('Binance', 'futures', ('Binance', 'futures'), get_binance_futures_data),
+    ('Bybit', 'spot', ('Bybit', 'spot'), get_bybit_spot_data),
+    ('Bybit', 'futures', ('Bybit', 'linear'), partial(get_bybit_category_data, category='linear')),
+    ('Bybit', 'futures', ('Bybit', 'inverse'), partial(get_bybit_category_data, category='inverse')),
+    ('OKX', 'spot', ('OKX', 'spot'), get_okx_spot_data),
+]
+
+
+async def collect_venue(session, indexes, db_lock, timestamp, exchange, market_type, fetcher):
+    """Загружает данные одной биржи/рынка и сразу сохраняет их в базу."""
+    started = time.monotonic()
+    try:
+        data = await fetcher(session, indexes)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.error(f"Ошибка при запросе данных с {exchange} ({market_type}): {e}")
+        return 0, 0
+    finally:
+        # Если спотовый рынок не загрузился, фьючерсы той же биржи не должны ждать его индекс
+        if market_type == 'spot':
+            indexes.publish(exchange, PriceIndex())
+
+    # Запись в SQLite выполняется по очереди и вне цикла событий
+    async with db_lock:
+        written, skipped = await asyncio.to_thread(save_to_db, data, exchange, market_type, timestamp)
+
+    logging.info(f"{exchange} ({market_type}): обработано {len(data)} инструментов за {time.monotonic() - started:.2f} с.")
+    return written, skipped
+
+
+async def collect_snapshot():
+    """Параллельно собирает снимок тикеров со всех бирж и рынков."""
+    started = time.monotonic()
+    db_lock = asyncio.Lock()
+    indexes = SnapshotIndexes()
+    timestamp = snapshot_timestamp()
+
+    async with create_session() as session:
+        results = await asyncio.gather(
+            *(collect_venue(session, indexes, db_lock, timestamp, exchange, market_type, fetcher)
+              for exchange, market_type, fetcher in VENUES),
+            return_exceptions=True
+        )
+
+    for (exchange, market_type, _), result in zip(VENUES, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка при обработке данных с {exchange} ({market_type}): {result}", exc_info=result)
+        else:
+            written, skipped = result
+            logging.info(f"Итог {exchange} ({market_type}): записано {written}, пропущено {skipped}.")
 
-    # Получение и сохранение данных с Binance (фьючерсный рынок)
-    binance_futures_data = get_binance_futures_data()
-    save_to_db(binance_futures_data, 'Binance', 'futures')
+    logging.info(f"Снимок собран за {time.monotonic() - started:.2f} с.")
 
-    # Получение и сохранение данных с Bybit (спотовый рынок)
-    bybit_spot_data = get_bybit_spot_data()
-    save_to_db(bybit_spot_data, 'Bybit', 'spot')
 
-    # Получение и сохранение данных с Bybit (фьючерсный рынок)
-    bybit_futures_data = get_bybit_futures_data()
-    save_to_db(bybit_futures_data, 'Bybit', 'futures')
+def background_update():
+    logging.info("Фоновое обновление данных началось.")
 
-    # Получение и сохранение данных с OKX (спотовый рынок)
-    okx_spot_data = get_okx_spot_data()
-    save_to_db(okx_spot_data, 'OKX', 'spot')
+    asyncio.run(collect_snapshot())
 
     # Удаление дубликатов после обновления
     remove_duplicates()
 
-    logging.info("Фоновое обновление данных завершено.")
+    # Пересчёт агрегатов истории 1m/1h/1d и удаление устаревших строк
+    history = MarketHistory()
+    try:
+        history.rollup()
+    finally:
+        history.close()
 
+    logging.info("Фоновое обновление данных завершено.")
 
 
 # Основной процесс для объединения данных со спотового и фьючерсного рынков с Binance, Bybit и OKX
@@ -542,38 +508,12 @@ def main():
     create_db()
     add_updated_time_column()  # Добавляем колонку updated_time, если её нет
     display_current_data()  # Отображаем текущие данные перед началом обновления
-    update_thread = threading.Thread(target=background_update)
-    update_thread.start()
-    update_thread.join()  # Ожидаем завершения фонового обновления
-    logging.info("Фоновое обновление данных завершено.")
 
     try:
-        # Получение и сохранение данных с Binance (спотовый рынок)
-        binance_spot_data = get_binance_spot_data()
-        save_to_db(binance_spot_data, 'Binance', 'spot')
-
-        # Получение и сохранение данных с Binance (фьючерсный рынок)
-        binance_futures_data = get_binance_futures_data()
-        save_to_db(binance_futures_data, 'Binance', 'futures')
-
-        # Получение и сохранение данных с Bybit (спотовый рынок)
-        bybit_spot_data = get_bybit_spot_data()
-        save_to_db(bybit_spot_data, 'Bybit', 'spot')
-
-        # Получение и сохранение данных с Bybit (фьючерсный рынок)
-        bybit_futures_data = get_bybit_futures_data()
-        save_to_db(bybit_futures_data, 'Bybit', 'futures')
-
-        # Получение и сохранение данных с OKX (спотовый рынок)
-        okx_spot_data = get_okx_spot_data()
-        save_to_db(okx_spot_data, 'OKX', 'spot')
-
-
-        # Удаление дубликатов из базы данных
-        remove_duplicates()
-
+        background_update()
     except Exception as e:
         logging.error(f"Произошла ошибка во время выполнения основного процесса: {e}")
 
 if __name__ == "__main__":
+    setup_process()
     main()
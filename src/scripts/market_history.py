@@ -0,0 +1,181 @@
+import time
+import calendar
+import logging
+
+from db_writer import connect
+
+HISTORY_DB = 'market_history.db'
+
+DAY = 24 * 60 * 60
+
+# Хранение сырых снимков и агрегатов: (таблица, длина интервала в секундах, срок хранения в секундах)
+RAW_TABLE = 'market_history_raw'
+RAW_RETENTION = 2 * DAY
+ROLLUPS = (
+    ('market_history_1m', 60, 14 * DAY),
+    ('market_history_1h', 60 * 60, 180 * DAY),
+    ('market_history_1d', DAY, 5 * 365 * DAY),
+)
+
+# Максимум точек в ответе на запрос истории: по нему выбирается разрешение
+MAX_POINTS = 2000
+
+
+def create_history_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS history_symbols (
+            id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            market_type TEXT NOT NULL,
+            UNIQUE (symbol, exchange, market_type)
+        )
+    ''')
+    # Сырые снимки: целочисленное время (epoch, сек) + id символа + числовые колонки
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {RAW_TABLE} (
+            symbol_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            price REAL,
+            volume_24h REAL,
+            price_usdt REAL,
+            PRIMARY KEY (symbol_id, ts)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{RAW_TABLE}_ts ON {RAW_TABLE} (ts)')
+
+    for table, _, _ in ROLLUPS:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                symbol_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,          -- Начало интервала (epoch, сек)
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume_24h REAL,              -- Значение на конец интервала
+                price_usdt REAL,              -- Значение на конец интервала
+                samples INTEGER,
+                PRIMARY KEY (symbol_id, ts)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)')
+
+    # До какого момента агрегаты уже пересчитаны
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS history_rollup_state (
+            rollup TEXT PRIMARY KEY,
+            rolled_until INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+class MarketHistory:
+    """Хранилище истории снимков market_data рядом с основной таблицей."""
+
+    def __init__(self, db_path=HISTORY_DB):
+        self.conn = connect(db_path)
+        create_history_tables(self.conn)
+        self._symbol_ids = {
+            (symbol, exchange, market_type): symbol_id
+            for symbol_id, symbol, exchange, market_type
+            in self.conn.execute('SELECT id, symbol, exchange, market_type FROM history_symbols')
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def _symbol_id(self, key):
+        symbol_id = self._symbol_ids.get(key)
+        if symbol_id is None:
+            symbol_id = self.conn.execute(
+                'INSERT INTO history_symbols (symbol, exchange, market_type) VALUES (?, ?, ?)', key).lastrowid
+            self._symbol_ids[key] = symbol_id
+        return symbol_id
+
+    def append(self, rows, timestamp):
+        """
+        Добавляет снимок одной биржи/рынка.
+
+        :param rows: кортежи (symbol, exchange, market_type, price, volume_24h, price_usdt).
+        :param timestamp: время снимка в формате "%Y-%m-%d %H:%M:%S" (UTC).
+        """
+        ts = calendar.timegm(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+        with self.conn:
+            values = [(self._symbol_id(row[:3]), ts, row[3], row[4], row[5]) for row in rows]
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO {RAW_TABLE} (symbol_id, ts, price, volume_24h, price_usdt) '
+                f'VALUES (?, ?, ?, ?, ?)', values)
+        return len(values)
+
+    def rollup(self, now=None):
+        """Пересчитывает агрегаты 1m/1h/1d с последнего незавершённого интервала и удаляет устаревшие строки."""
+        now = int(now or time.time())
+        state = dict(self.conn.execute('SELECT rollup, rolled_until FROM history_rollup_state'))
+
+        source, open_col, high_expr, low_expr, close_col, samples_expr = (
+            RAW_TABLE, 'price', 'MAX(price)', 'MIN(price)', 'price', 'COUNT(*)')
+        with self.conn:
+            for table, bucket, retention in ROLLUPS:
+                since = state.get(table, now - retention)
+                since -= since % bucket  # незавершённый интервал пересчитывается целиком
+
+                self.conn.execute(f'''
+                    INSERT OR REPLACE INTO {table}
+                        (symbol_id, ts, open, high, low, close, volume_24h, price_usdt, samples)
+                    SELECT b.symbol_id, b.bucket,
+                           (SELECT {open_col} FROM {source} s WHERE s.symbol_id = b.symbol_id AND s.ts = b.first_ts),
+                           b.high, b.low,
+                           c.{close_col}, c.volume_24h, c.price_usdt,
+                           b.samples
+                    FROM (
+                        SELECT symbol_id, ts - ts % {bucket} AS bucket, MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                               {high_expr} AS high, {low_expr} AS low, {samples_expr} AS samples
+                        FROM {source}
+                        WHERE ts >= ?
+                        GROUP BY symbol_id, bucket
+                    ) b
+                    JOIN {source} c ON c.symbol_id = b.symbol_id AND c.ts = b.last_ts
+                ''', (since,))
+                self.conn.execute('''
+                    INSERT INTO history_rollup_state (rollup, rolled_until) VALUES (?, ?)
+                    ON CONFLICT(rollup) DO UPDATE SET rolled_until = excluded.rolled_until
+                ''', (table, now))
+                self.conn.execute(f'DELETE FROM {table} WHERE ts < ?', (now - retention,))
+
+                # Следующее разрешение агрегируется из только что обновлённого
+                source, open_col, high_expr, low_expr, close_col, samples_expr = (
+                    table, 'open', 'MAX(high)', 'MIN(low)', 'close', 'SUM(samples)')
+
+            self.conn.execute(f'DELETE FROM {RAW_TABLE} WHERE ts < ?', (now - RAW_RETENTION,))
+
+        logging.info("Агрегаты истории (1m/1h/1d) обновлены.")
+
+    def query(self, symbol, exchange, market_type, start, end=None, resolution=None):
+        """
+        История инструмента за [start, end] (epoch, сек).
+
+        Если разрешение не задано, выбирается самое подробное, которое покрывает начало
+        периода сроком хранения и даёт не больше MAX_POINTS точек.
+        Возвращает (разрешение, строки (ts, open, high, low, close, volume_24h, price_usdt)).
+        """
+        end = int(end or time.time())
+        symbol_id = self._symbol_ids.get((symbol, exchange, market_type))
+        if symbol_id is None:
+            return resolution, []
+
+        if resolution is None:
+            now = time.time()
+            resolution = ROLLUPS[-1][0]
+            for table, bucket, retention in ROLLUPS:
+                if start >= now - retention and (end - start) / bucket <= MAX_POINTS:
+                    resolution = table
+                    break
+
+        rows = self.conn.execute(f'''
+            SELECT ts, open, high, low, close, volume_24h, price_usdt FROM {resolution}
+            WHERE symbol_id = ? AND ts BETWEEN ? AND ?
+            ORDER BY ts
+        ''', (symbol_id, int(start), end)).fetchall()
+        return resolution, rows
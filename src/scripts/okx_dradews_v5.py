@@ -3,10 +3,14 @@ import asyncio
 import logging
 from datetime import datetime
 import time
-import os
-import json
 import sqlite3
-from more_itertools import chunked
+
+from db_writer import connect, build_upsert_sql, snapshot_timestamp
+from http_client import create_session, get
+from symbol_registry import load_registry
+from trade_aggregate import TradeAggregator, MinuteBuckets
+from trade_cache import TradeCache
+from trade_checkpoints import TradeCheckpoints
 
 # Конфигурация логирования
 logging.basicConfig(
@@ -26,168 +30,193 @@ if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-# Конфигурация кэша
-CACHE_DIR = "cache"
-
-# Ограничение на количество запросов
-SEMAPHORE_LIMIT = 10
-semaphore = asyncio.BoundedSemaphore(SEMAPHORE_LIMIT)
-
-
-# Функция для создания соединения с базой данных
-def create_db_connection():
-    # Проверка на существование файла базы данных и его создание
-    if not os.path.exists(DB_NAME):
-        open(DB_NAME, 'w').close()  # Создание пустого файла базы данных
-    conn = sqlite3.connect(DB_NAME)
-    return conn
-
-# Функция для создания таблицы, если она еще не существует
-def create_table():
-    conn = create_db_connection()  # Подключаемся к базе данных
-    cursor = conn.cursor()  # Создаем курсор для выполнения SQL-запросов
-
-    # SQL-запрос для создания таблицы trades_data с полем trade_type
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trades_data (
-            symbol TEXT,                   -- Символ торговой пары
-            trade_type TEXT,               -- Тип сделки (SPOT, FUTURES, SWAP)
-            total_trades INT,              -- Количество сделок за 24 часа
-            total_volume REAL,             -- Общий объем сделок
-            official_volume REAL,          -- Официальный объем
-            exchange TEXT DEFAULT 'OKX',   -- Биржа, по умолчанию 'OKX'
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP -- Временная метка создания записи
-        )
-    ''')
-
-    conn.commit()  # Подтверждаем изменения
-    conn.close()  # Закрываем соединение с базой данных
-
-# Функция для проверки наличия дубликата записи
-def is_duplicate_record(symbol, trade_type):
-    try:
-        conn = create_db_connection()
-        cursor = conn.cursor()
-        # Проверка на наличие записи с символом и типом сделки, упорядоченная по времени
-        cursor.execute(
-            'SELECT 1 FROM trades_data WHERE symbol = ? AND trade_type = ? ORDER BY timestamp DESC LIMIT 1',
-            (symbol, trade_type)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
-    except sqlite3.Error as e:
-        logging.error(f"Ошибка при проверке дубликата для {symbol} ({trade_type}): {e}")
-        return False
-
-# Функция для сохранения данных о сделках
-def save_trade_data(symbol, trade_type, total_trades, total_volume, official_volume):
-    if is_duplicate_record(symbol, trade_type):
-        logging.info(f"Запись для {symbol} ({trade_type}) уже существует, пропуск сохранения.")
-        return
-    try:
-        conn = create_db_connection()
-        cursor = conn.cursor()
-        # Вставка данных в таблицу с учетом trade_type
-        cursor.execute('''
-            INSERT INTO trades_data (symbol, trade_type, total_trades, total_volume, official_volume, exchange)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (symbol, trade_type, total_trades, total_volume, official_volume, 'OKX'))
-        conn.commit()
-        conn.close()
-        logging.info(f"Данные для {symbol} ({trade_type}) успешно сохранены в базу данных.")
-    except sqlite3.Error as e:
-        logging.error(f"Ошибка при записи данных для {symbol} ({trade_type}) в базу данных: {e}")
-
-
-def save_trade_data(symbol, trade_type, total_trades, total_volume, official_volume):
-    if is_duplicate_record(symbol):
-        logging.info(f"Запись для {symbol} ({trade_type}) уже существует, пропуск сохранения.")
-        return
-    try:
-        conn = create_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO trades_data (symbol, trade_type, total_trades, total_volume, official_volume, exchange) VALUES (?, ?, ?, ?, ?, ?)',
-                       (symbol, trade_type, total_trades, total_volume, official_volume, 'OKX'))
-        conn.commit()
-        conn.close()
-        logging.info(f"Данные для {symbol} ({trade_type}) успешно сохранены в базу данных.")
-    except sqlite3.Error as e:
-        logging.error(f"Ошибка при записи данных для {symbol} ({trade_type}) в базу данных: {e}")
-
-# Кэш
-def ensure_cache_dir_exists():
-    if not os.path.exists(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
-
+# Кэш сделок по диапазонам tradeId (trade_cache.db): из API догружается только недостающая часть окна
+TRADE_CACHE = TradeCache()
 
-def cache_filename(symbol, start_time, end_time):
-    start_time_str = datetime.utcfromtimestamp(start_time / 1000).strftime('%Y-%m-%d_%H-%M-%S')
-    end_time_str = datetime.utcfromtimestamp(end_time / 1000).strftime('%Y-%m-%d_%H-%M-%S')
-    return os.path.join(CACHE_DIR, f"{symbol}_{start_time_str}_to_{end_time_str}.json")
+# Контрольные точки по символам и минутные корзины скользящих агрегатов (в DB_NAME)
+CHECKPOINTS = TradeCheckpoints(DB_NAME)
 
+# Число воркеров, разбирающих общую очередь символов; темп запросов задаёт лимит OKX в http_client
+WORKER_COUNT = 10
 
-def is_cached(symbol, start_time, end_time):
-    filename = cache_filename(symbol, start_time, end_time)
-    return os.path.exists(filename)
+OKX_TICKERS_URL = "https://www.okx.com/api/v5/market/tickers"
 
-def load_from_cache(symbol, start_time, end_time):
-    filename = cache_filename(symbol, start_time, end_time)
-    with open(filename, 'r') as file:
-        return json.load(file)
 
+# Ключ строки trades_data: одна актуальная запись на символ, тип и биржу
+TRADES_DATA_COLUMNS = ('symbol', 'trade_type', 'total_trades', 'total_volume', 'official_volume', 'exchange',
+                       'timestamp')
+TRADES_DATA_KEY = ('symbol', 'trade_type', 'exchange')
+TRADES_DATA_UPDATE_COLUMNS = ('total_trades', 'total_volume', 'official_volume', 'timestamp')
 
-def save_to_cache(symbol, start_time, end_time, data):
-    ensure_cache_dir_exists()
-    filename = cache_filename(symbol, start_time, end_time)
-    with open(filename, 'w') as file:
-        json.dump(data, file)
+# Пачка записи: сколько результатов максимум уходит в одну транзакцию и сколько секунд
+# писатель добирает пачку после первого результата
+WRITE_BATCH_SIZE = 200
+WRITE_FLUSH_INTERVAL = 1.0
 
 
-async def get_trades_from_cache_or_api(symbol, start_time, end_time, fetch_function):
-    if is_cached(symbol, start_time, end_time):
-        logging.info(f"Загружены данные из кэша для {symbol} с {start_time} по {end_time}")
-        return load_from_cache(symbol, start_time, end_time)
-    else:
-        logging.info(f"Запрос данных из API для {symbol} с {start_time} по {end_time}")
-        data = await fetch_function(symbol, start_time, end_time)
-        save_to_cache(symbol, start_time, end_time, data)
-        return data
+# Функция для создания таблицы, если она еще не существует
+def create_table(conn=None):
+    own_conn = conn is None
+    conn = conn or connect(DB_NAME)
+    try:
+        with conn:
+            # Таблица trades_data с полем trade_type
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trades_data (
+                    symbol TEXT,                   -- Символ торговой пары
+                    trade_type TEXT,               -- Тип сделки (SPOT, FUTURES, SWAP)
+                    total_trades INT,              -- Количество сделок за 24 часа
+                    total_volume REAL,             -- Общий объем сделок
+                    official_volume REAL,          -- Официальный объем
+                    exchange TEXT DEFAULT 'OKX',   -- Биржа, по умолчанию 'OKX'
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP -- Временная метка создания записи
+                )
+            ''')
+
+            # Предыдущие значения строк trades_data, вытесненные обновлением
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trades_data_history (
+                    symbol TEXT,
+                    trade_type TEXT,
+                    total_trades INT,
+                    total_volume REAL,
+                    official_volume REAL,
+                    exchange TEXT,
+                    timestamp DATETIME,            -- Время, когда значения были записаны
+                    replaced_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_trades_data_history_key
+                ON trades_data_history (symbol, trade_type, exchange, timestamp)
+            ''')
+
+            # Старые базы могли накопить несколько строк на ключ: в таблице остаётся самая поздняя,
+            # остальные переносятся в историю, после чего ключ закрепляется уникальным индексом
+            duplicates = '''
+                rowid NOT IN (SELECT MAX(rowid) FROM trades_data GROUP BY symbol, trade_type, exchange)
+            '''
+            conn.execute(f'''
+                INSERT INTO trades_data_history ({', '.join(TRADES_DATA_COLUMNS)})
+                SELECT {', '.join(TRADES_DATA_COLUMNS)} FROM trades_data WHERE {duplicates}
+            ''')
+            conn.execute(f"DELETE FROM trades_data WHERE {duplicates}")
+            conn.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_data_unique
+                ON trades_data (symbol, trade_type, exchange)
+            ''')
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def write_trades_batch(conn, rows):
+    """
+    Записывает пачку результатов одной транзакцией: текущие значения обновляемых строк
+    копируются в trades_data_history, затем строки вставляются или обновляются по ключу.
+    """
+    key_positions = [TRADES_DATA_COLUMNS.index(column) for column in TRADES_DATA_KEY]
+    keys = [tuple(row[position] for position in key_positions) for row in rows]
+    upsert_sql = build_upsert_sql('trades_data', TRADES_DATA_COLUMNS, TRADES_DATA_KEY, TRADES_DATA_UPDATE_COLUMNS)
+    with conn:
+        conn.executemany(f'''
+            INSERT INTO trades_data_history ({', '.join(TRADES_DATA_COLUMNS)})
+            SELECT {', '.join(TRADES_DATA_COLUMNS)} FROM trades_data
+            WHERE {' AND '.join(f"{column} = ?" for column in TRADES_DATA_KEY)}
+        ''', keys)
+        conn.executemany(upsert_sql, rows)
+    return len(rows)
+
+
+class TradesDataWriter:
+    """
+    Единственный писатель trades_data за запуск.
 
+    Воркеры кладут результаты по символам в asyncio-очередь, писатель собирает их в пачку
+    (до WRITE_BATCH_SIZE строк или WRITE_FLUSH_INTERVAL секунд) и записывает одной транзакцией
+    в отдельном потоке, пока воркеры продолжают работу. Соединение одно на весь запуск.
+    """
 
+    def __init__(self, db_path=DB_NAME, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timestamp = snapshot_timestamp()
+        self.written = 0
+        self._queue = None
+        self._task = None
+        self._conn = None
+
+    async def start(self):
+        # Очередь и задача создаются внутри работающего цикла событий
+        self._conn = connect(self.db_path, check_same_thread=False)
+        await asyncio.to_thread(create_table, self._conn)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def put(self, symbol, trade_type, total_trades, total_volume, official_volume, exchange='OKX'):
+        await self._queue.put((symbol, trade_type, total_trades, total_volume, official_volume, exchange,
+                               self.timestamp))
+
+    async def close(self):
+        """Дожидается записи всего, что уже в очереди, и закрывает соединение."""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        logging.info(f"В trades_data записано {self.written} строк.")
+
+    async def _run(self):
+        finished = False
+        while not finished:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if batch[-1] is None:
+                finished = True
+                batch.pop()
+            if not batch:
+                continue
+            try:
+                self.written += await asyncio.to_thread(write_trades_batch, self._conn, batch)
+                logging.info(f"Записана пачка из {len(batch)} строк в trades_data.")
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка при записи пачки из {len(batch)} строк в trades_data: {e}", exc_info=True)
 
 # Функции для работы с API
 async def fetch_all_instruments(session, inst_type="SPOT"):
-    url = f"https://www.okx.com/api/v5/public/instruments?instType={inst_type}"
-
+    # Каталог берётся из общего кэша инструментов (загружается заново только после истечения TTL)
+    # и регистрируется в реестре символов, по которому определяются котируемая и расчётная валюты
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                instruments_data = await response.json()
-                instruments = instruments_data.get('data', [])
-                if instruments:
-                    logging.info(f"Успешно получено {len(instruments)} инструментов ({inst_type}).")
-                else:
-                    logging.warning(f"Список инструментов пуст ({inst_type}).")
-
-                return instruments
-            else:
-                logging.error(f"Ошибка при запросе списка инструментов ({inst_type}): {response.status}")
-                return []
+        registry = await load_registry(session, [('OKX', inst_type)])
+        count = len(registry.symbols('OKX', inst_type))
+        if count:
+            logging.info(f"Успешно получено {count} инструментов ({inst_type}).")
+        else:
+            logging.warning(f"Список инструментов пуст ({inst_type}).")
+        return registry
+    except aiohttp.ClientResponseError as e:
+        logging.error(f"Ошибка при запросе списка инструментов ({inst_type}): {e.status}")
+        return None
     except Exception as e:
         logging.error(f"Исключение при запросе инструментов ({inst_type}): {e}")
-        return []
-
-
-def filter_instruments(instruments, currency="USDT", field="settleCcy"):
-    filtered_symbols = []
+        return None
 
-    for instrument in instruments:
-        currency_value = instrument.get(field, "")
-        symbol = instrument.get('instId', "")
 
-        if currency_value == currency:
-            filtered_symbols.append(symbol)
+def filter_instruments(registry, inst_type, currency="USDT", field="settle"):
+    # field — 'quote' (котируемая валюта спота) или 'settle' (расчётная валюта деривативов)
+    filtered_symbols = registry.symbols('OKX', inst_type, **{field: currency}) if registry is not None else []
 
     if filtered_symbols:
         logging.info(f"Отфильтровано {len(filtered_symbols)} торговых пар.")
@@ -197,79 +226,127 @@ def filter_instruments(instruments, currency="USDT", field="settleCcy"):
     return filtered_symbols
 
 
-async def fetch_trades_from_api(session, symbol, start_time, end_time):
+async def fetch_history_page(session, symbol, after_trade_id=None):
+    """Одна страница истории сделок (до 100, новые первыми) старше after_trade_id; None — ошибка запроса."""
     url = f"https://www.okx.com/api/v5/market/history-trades?instId={symbol}&limit=100"
-    all_trades = []
-    after_trade_id = None
-    has_more_data = True
-    processed_trade_ids = set()
-    valid_trades_count = 0
-    invalid_trades_count = 0
-
-    while has_more_data:
-        paginated_url = url + (f"&after={after_trade_id}" if after_trade_id else "")
-        try:
-            async with session.get(paginated_url, timeout=4) as response:
-                logging.info(f"Запрос данных для {symbol}. URL: {paginated_url}")
-
-                if response.status == 200:
-                    trades_response = await response.json()
-                    trades_result = trades_response.get('data', [])
-
-                    if not trades_result:
-                        logging.info(f"Нет больше данных для {symbol}, завершаем.")
-                        has_more_data = False
-                        break
-
-                    valid_trades = [
-                        trade for trade in trades_result
-                        if int(trade['ts']) >= start_time and trade['tradeId'] not in processed_trade_ids
-                    ]
-                    invalid_trades_count += len(trades_result) - len(valid_trades)
-                    valid_trades_count += len(valid_trades)
-
-                    all_trades.extend(valid_trades)
-                    all_trades = sorted(all_trades, key=lambda x: int(x['ts']))
-                    processed_trade_ids.update(trade['tradeId'] for trade in valid_trades)
-
-                    if valid_trades:
-                        last_trade = valid_trades[-1]
-                        after_trade_id = last_trade['tradeId']
-                        last_trade_time = datetime.utcfromtimestamp(int(last_trade['ts']) / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                        logging.info(f"{symbol}: Получено {len(valid_trades)} валидных сделок. Последний tradeId: {after_trade_id}, Время: {last_trade_time}")
-
-                    invalid_ratio = invalid_trades_count / (valid_trades_count + invalid_trades_count)
-                    logging.info(f"{symbol}: Процент невалидных сделок: {invalid_ratio:.2%}")
-
-                    if not valid_trades:
-                        has_more_data = False
-                elif response.status == 429:
-                    # Ошибка превышения лимита запросов, динамическая задержка
-                    retry_after = int(response.headers.get('Retry-After', 1))  # По умолчанию задержка 1 секунда
-                    logging.error(f"Превышен лимит запросов для {symbol}. Ожидание {retry_after} секунд.")
-                    await asyncio.sleep(retry_after)
-                else:
-                    logging.error(f"Ошибка при запросе: {response.status}")
+    paginated_url = url + (f"&after={after_trade_id}" if after_trade_id else "")
+    try:
+        # Лимит OKX (20 запросов за 2 с на эндпоинт), повторы после 429, тайм-аутов и сетевых ошибок — в http_client
+        async with get(session, paginated_url) as response:
+            if response.status == 200:
+                return (await response.json()).get('data', [])
+
+            logging.error(f"Ошибка при запросе: {response.status}")
+            # Добавляем логирование ответа от API
+            try:
+                error_data = await response.json()
+                logging.error(f"Данные ошибки от API: {error_data}")
+            except Exception as e:
+                logging.error(f"Не удалось получить данные ошибки от API: {e}")
+            # Повторы уже исчерпаны в http_client, дальше по этому символу не идём
+            return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # http_client сдался после MAX_RETRIES попыток: страница считается незагруженной
+        logging.error(f"Не удалось получить страницу истории для {symbol}: {e!r}")
+        return None
+
+
+def _cover(covered, lo_id, hi_id, lo_ts, hi_ts):
+    # Расширение непрерывного диапазона [lo_id, hi_id, lo_ts, hi_ts]
+    if covered is None:
+        return [lo_id, hi_id, lo_ts, hi_ts]
+    return [min(covered[0], lo_id), max(covered[1], hi_id), min(covered[2], lo_ts), max(covered[3], hi_ts)]
+
+
+async def fetch_trades_from_api(session, symbol, start_time, end_time, cache=None, aggregator=None):
+    """
+    Сделки символа за окно [start_time, end_time], свёрнутые в TradeAggregator (или в переданный
+    aggregator; если у него задан floor_trade_id, листание останавливается на этой сделке).
 
-                    # Добавляем логирование ответа от API
-                    try:
-                        error_data = await response.json()
-                        logging.error(f"Данные ошибки от API: {error_data}")
-                    except Exception as e:
-                        logging.error(f"Не удалось получить данные ошибки от API: {e}")
+    История листается от новых сделок к старым. Как только страница доходит до диапазона,
+    который уже есть в кэше (trade_cache), этот диапазон читается с диска, а листание API
+    продолжается сразу под ним, если окно уходит глубже. Новые страницы сохраняются в кэш,
+    а пройденные диапазоны склеиваются в один. Листание прекращается на первой сделке
+    старше start_time; сделки в памяти не накапливаются.
 
-            await asyncio.sleep(0.9)  # Задержка между запросами
-        except asyncio.TimeoutError:
-            logging.error(f"Тайм-аут при запросе данных для {symbol}, повтор запроса.")
+    Пройденный диапазон записывается в кэш после каждой страницы: если запуск прервётся,
+    следующий прочитает уже загруженные страницы с диска и продолжит API с места остановки.
 
-    return all_trades
+    :return: (aggregator, complete); complete — листание дошло до start_time, floor_trade_id или
+             конца истории. Если страница не загрузилась, complete=False: в агрегате только
+             часть окна, и сдвигать по нему контрольную точку нельзя.
+    """
+    cache = cache or TRADE_CACHE
+    aggregator = aggregator if aggregator is not None else TradeAggregator()
+    floor_trade_id = aggregator.floor_trade_id
+    # Обращения к кэшу (сжатие и запись на диск) идут в потоке, чтобы не останавливать цикл событий
+    ranges = await asyncio.to_thread(cache.ranges, symbol)
+    covered, absorbed = None, []
+    after_trade_id = None
+    pages = cached_trades = 0
+    complete = True
+
+    while True:
+        trades_result = await fetch_history_page(session, symbol, after_trade_id)
+        if trades_result is None:
+            logging.warning(f"{symbol}: страница истории не загружена, окно собрано не полностью.")
+            complete = False
+            break
+        if not trades_result:
+            logging.info(f"Нет больше данных для {symbol}, завершаем.")
+            break
+        pages += 1
+
+        # Страница обрезается на первой сделке, которая уже есть в кэше
+        hit, fresh = None, trades_result
+        for position, trade in enumerate(trades_result):
+            trade_id = int(trade['tradeId'])
+            hit = next((item for item in ranges if item[0] <= trade_id <= item[1]), None)
+            if hit is not None:
+                fresh = trades_result[:position]
+                break
+
+        if fresh:
+            covered = _cover(covered, int(fresh[-1]['tradeId']), int(fresh[0]['tradeId']),
+                             min(int(trade['ts']) for trade in fresh), max(int(trade['ts']) for trade in fresh))
+            # Блок и расширенный диапазон записываются одной транзакцией
+            await asyncio.to_thread(cache.store, symbol, fresh, covered, absorbed)
+        if aggregator.add_page(fresh, start_time, end_time):
+            break
+
+        if hit is None:
+            next_trade_id = trades_result[-1]['tradeId']
+            if next_trade_id == after_trade_id:
+                break
+            after_trade_id = next_trade_id
+            continue
+
+        # Дальше идёт диапазон из кэша: читаем его с диска и продолжаем API под ним
+        columns = await asyncio.to_thread(cache.read, symbol, hit[0], hit[1], start_time)
+        cached_trades += len(columns['ts'])
+        covered = _cover(covered, *hit)
+        absorbed.append(hit)
+        ranges.remove(hit)
+        await asyncio.to_thread(cache.save_range, symbol, covered, absorbed)
+        reached = aggregator.add_arrays(columns['trade_id'], columns['ts'], columns['px'], columns['sz'],
+                                        columns['is_buy'], start_time, end_time)
+        if reached or hit[2] < start_time or (floor_trade_id is not None and hit[0] <= floor_trade_id):
+            break
+        after_trade_id = str(hit[0])
+
+    if aggregator.first_ts is not None:
+        oldest = datetime.utcfromtimestamp(aggregator.first_ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        logging.info(f"{symbol}: {pages} страниц API, {cached_trades} сделок из кэша, {aggregator.count} сделок "
+                     f"до {oldest}, объём {aggregator.volume}, VWAP {aggregator.vwap:.8g}, "
+                     f"покупки/продажи {aggregator.buy_volume}/{aggregator.sell_volume}")
+    return aggregator, complete
 
 
 
 
 async def get_official_volume(session, symbol):
     url = f"https://www.okx.com/api/v5/market/ticker?instId={symbol}"
-    async with session.get(url) as response:
+    async with get(session, url) as response:
         if response.status == 200:
             ticker_data = await response.json()
             if 'data' in ticker_data and ticker_data['data']:
@@ -285,16 +362,76 @@ async def get_official_volume(session, symbol):
 
 
 
-async def fetch_data_for_symbol(session, symbol, start_time, end_time):
-    trades = await get_trades_from_cache_or_api(symbol, start_time, end_time,
-                                                lambda s, st, et: fetch_trades_from_api(session, s, st, et))
+def inst_type_of(symbol):
+    # BTC-USDT-SWAP — своп, BTC-USDT-250328 — фьючерс, BTC-USDT — спот
+    if symbol.endswith('-SWAP'):
+        return 'SWAP'
+    return 'FUTURES' if symbol.count('-') == 2 else 'SPOT'
 
-    total_volume = sum(float(trade['sz']) for trade in trades)
-    trades_24h = len(trades)
 
-    official_volume = await get_official_volume(session, symbol)
+async def fetch_tickers(session, inst_types):
+    """Тикеры всех инструментов указанных типов: один запрос market/tickers на тип."""
+    tickers = {}
+    for inst_type in inst_types:
+        try:
+            async with get(session, OKX_TICKERS_URL, params={'instType': inst_type}) as response:
+                if response.status != 200:
+                    logging.error(f"Ошибка при получении тикеров {inst_type}: {response.status}")
+                    continue
+                data = (await response.json()).get('data', [])
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Исключение при получении тикеров {inst_type}: {e!r}")
+            continue
+        tickers.update({item['instId']: item for item in data})
+    logging.info(f"Получено {len(tickers)} тикеров ({', '.join(inst_types)}).")
+    return tickers
+
+
+def expected_work(symbol, ticker, start_time, end_time):
+    """
+    Оценка объёма работы по символу: оборот за 24 часа в валюте котировки, умноженный
+    на долю суток [start_time, end_time], которую предстоит догрузить от контрольной точки.
+    """
+    if not ticker:
+        return 0.0
+    try:
+        turnover = float(ticker.get('volCcy24h') or 0)
+        if inst_type_of(symbol) != 'SPOT':
+            # У фьючерсов и свопов volCcy24h — в базовой валюте
+            turnover *= float(ticker.get('last') or 0)
+    except ValueError:
+        return 0.0
+    return turnover * (end_time - start_time) / (24 * 60 * 60 * 1000)
 
-    return trades_24h, total_volume, official_volume
+
+async def fetch_data_for_symbol(session, symbol, end_time, official_volume=None):
+    """
+    Догружает сделки символа новее контрольной точки и возвращает скользящие агрегаты.
+
+    Новые сделки раскладываются по минутным корзинам и вместе с новой контрольной точкой
+    сохраняются в trade_checkpoints; агрегаты за 1 и 24 часа складываются из корзин.
+    """
+    start_time, floor_trade_id, since_ts = await asyncio.to_thread(CHECKPOINTS.window, symbol, end_time)
+    aggregator = MinuteBuckets()
+    aggregator.floor_trade_id = floor_trade_id
+    _, complete = await fetch_trades_from_api(session, symbol, start_time, end_time, aggregator=aggregator)
+    if complete:
+        await asyncio.to_thread(CHECKPOINTS.commit, symbol, aggregator, since_ts, end_time)
+    else:
+        # Контрольная точка остаётся прежней: загруженные страницы уже в кэше сделок,
+        # следующий запуск прочитает их с диска и догрузит пропуск под ними
+        logging.warning(f"{symbol}: контрольная точка не сдвинута, {aggregator.count} сделок будут учтены "
+                        f"в следующем запуске.")
+    rolling = await asyncio.to_thread(CHECKPOINTS.rolling, symbol, end_time)
+    logging.info(f"{symbol}: новых сделок {aggregator.count}, за 1 ч {rolling['1h']['count']} "
+                 f"(объём {rolling['1h']['volume']}), за 24 ч {rolling['24h']['count']} "
+                 f"(объём {rolling['24h']['volume']}, покрыто {rolling['24h']['hours']:.2f} ч)")
+
+    # Официальный объём обычно уже есть в общем запросе тикеров
+    if official_volume is None:
+        official_volume = await get_official_volume(session, symbol)
+
+    return rolling['24h'], official_volume
 
 def scale_to_24h(trades_count, volume, hours_collected):
     """
@@ -317,95 +454,105 @@ def scale_to_24h(trades_count, volume, hours_collected):
 
     return scaled_trades_count, scaled_volume
 
-async def fetch_with_semaphore(symbol, session, start_time, end_time):
-    async with semaphore:
-        # Вычисляем количество часов между start_time и end_time
-        hours_collected = (end_time - start_time) / (60 * 60 * 1000)  # Преобразуем миллисекунды в часы
-
-        # Проверяем кэш перед выполнением запроса
-        if is_cached(symbol, start_time, end_time):
-            logging.info(f"Загружены данные из кэша для {symbol} с {start_time} по {end_time}")
-            data = load_from_cache(symbol, start_time, end_time)
-            total_trades = len(data)
-            total_volume = sum(float(trade['sz']) for trade in data)
-            official_volume = await get_official_volume(session, symbol)
+async def process_symbol(session, symbol, end_time, writer, official_volume=None):
+    # Из API догружаются только сделки новее контрольной точки символа
+    logging.info(f"Запрос данных для {symbol} по {end_time}")
+    rolling_24h, official_volume = await fetch_data_for_symbol(session, symbol, end_time, official_volume)
 
-            # Масштабируем данные
-            total_trades, total_volume = scale_to_24h(total_trades, total_volume, hours_collected)
-            logging.info(
-                f"{symbol}: Масштабированное количество сделок: {total_trades}, Объем: {total_volume}, Официальный объем: {official_volume}")
+    # Пока покрытие короче суток, агрегат масштабируется до 24 часов
+    total_trades, total_volume = rolling_24h['count'], rolling_24h['volume']
+    if 0 < rolling_24h['hours'] < 24:
+        total_trades, total_volume = scale_to_24h(total_trades, total_volume, rolling_24h['hours'])
+    logging.info(
+        f"{symbol}: Масштабированное количество сделок: {total_trades}, Объем: {total_volume}, Официальный объем: {official_volume}")
 
-            # Сохраняем данные
-            save_trade_data(symbol, total_trades, total_volume, official_volume)
-            return  # Прерываем выполнение функции, если данные были загружены из кэша
+    # Результат уходит писателю trades_data, запись идёт пачками параллельно со сбором
+    await writer.put(symbol, inst_type_of(symbol), total_trades, total_volume, official_volume)
 
-        # Если данных в кэше нет, продолжаем с запросом из API
-        logging.info(f"Запрос данных для {symbol} с {start_time} по {end_time}")
-        total_trades, total_volume, official_volume = await fetch_data_for_symbol(session, symbol, start_time, end_time)
 
-        # Масштабируем данные
-        total_trades, total_volume = scale_to_24h(total_trades, total_volume, hours_collected)
-        logging.info(
-            f"{symbol}: Масштабированное количество сделок: {total_trades}, Объем: {total_volume}, Официальный объем: {official_volume}")
-
-        # Сохраняем данные
-        save_trade_data(symbol, total_trades, total_volume, official_volume)
+async def symbol_worker(name, queue, session, end_time, tickers, writer):
+    """Берёт символы из общей очереди, пока она не опустеет; возвращает число обработанных."""
+    processed = 0
+    while True:
+        try:
+            _, symbol = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return processed
+        ticker = tickers.get(symbol)
+        official_volume = float(ticker['vol24h']) if ticker and ticker.get('vol24h') else None
+        try:
+            await process_symbol(session, symbol, end_time, writer, official_volume)
+        except Exception as e:
+            logging.error(f"Воркер {name}: ошибка при обработке {symbol}: {e!r}")
+        processed += 1
+        queue.task_done()
 
 
 async def get_data_for_multiple_symbols(symbols):
-    # Вычисляем время начала и конца один раз
+    """
+    Сбор по символам через общую очередь: WORKER_COUNT воркеров берут следующий символ, как только
+    освобождаются, поэтому долгий символ занимает один воркер, а не держит целую пачку. Очередь
+    упорядочена по ожидаемой работе (оборот и срок от контрольной точки): самые долгие символы
+    стартуют первыми и не остаются хвостом в конце запуска. Темп запросов всех воркеров задаёт
+    общий лимит OKX в http_client.
+    """
+    # Конец окна вычисляется один раз; начало у каждого символа своё (его контрольная точка)
     end_time = int(time.time() * 1000)
-    start_time = end_time - 1 * 60 * 60 * 1000
-
-    async with aiohttp.ClientSession() as session:
-        for symbol_chunk in chunked(symbols, SEMAPHORE_LIMIT):
-            tasks = []
-            for symbol in symbol_chunk:
-                # Проверяем кэш перед выполнением запроса
-                if is_cached(symbol, start_time, end_time):
-                    logging.info(f"Загружены данные из кэша для {symbol} с {start_time} по {end_time}")
-                    data = load_from_cache(symbol, start_time, end_time)
-                    trades_24h = len(data)
-                    total_volume = sum(float(trade['sz']) for trade in data)
-                    official_volume = await get_official_volume(session, symbol)
-                    logging.info(f"{symbol}: Количество сделок: {trades_24h}, Объем: {total_volume}, Официальный объем: {official_volume}")
-                    save_trade_data(symbol, trades_24h, total_volume, official_volume)
-                else:
-                    # Если кэша нет, добавляем задачу для получения данных
-                    tasks.append(fetch_with_semaphore(symbol, session, start_time, end_time))
-
-            # Выполняем все задачи, если они есть
-            if tasks:
-                await asyncio.gather(*tasks)
+    await asyncio.to_thread(CHECKPOINTS.summary)
+    started = time.monotonic()
+
+    writer = await TradesDataWriter().start()
+    async with create_session() as session:
+        tickers = await fetch_tickers(session, sorted({inst_type_of(symbol) for symbol in symbols}))
+
+        # Начала окон всех символов читаются из контрольных точек одним запросом
+        windows = await asyncio.to_thread(CHECKPOINTS.windows, list(dict.fromkeys(symbols)), end_time)
+
+        # Очередь создаётся внутри работающего цикла событий
+        queue = asyncio.PriorityQueue()
+        for symbol, (start_time, _, _) in windows.items():
+            queue.put_nowait((-expected_work(symbol, tickers.get(symbol), start_time, end_time), symbol))
+
+        workers = [symbol_worker(number, queue, session, end_time, tickers, writer)
+                   for number in range(min(WORKER_COUNT, queue.qsize()))]
+        try:
+            processed = await asyncio.gather(*workers)
+        finally:
+            await writer.close()
+
+    logging.info(f"Обработано {sum(processed)} символов за {time.monotonic() - started:.1f} с "
+                 f"({len(processed)} воркеров, по символам: {processed}).")
 
+    # Сделки старше срока хранения удаляются из кэша
+    await asyncio.to_thread(TRADE_CACHE.prune, end_time)
 
 
 # Основная функция для получения символов и запуска программы
 async def main(fetch_spot=True, fetch_futures=True, fetch_swap=True):
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         symbols = []
 
         # Если флаг fetch_spot установлен в True, собираем данные для спота
         if fetch_spot:
             logging.info("Начало сбора данных для спотовых инструментов (SPOT)")
-            spot_instruments = await fetch_all_instruments(session, "SPOT")
-            spot_symbols = filter_instruments(spot_instruments, currency="USDT", field="quoteCcy")
+            registry = await fetch_all_instruments(session, "SPOT")
+            spot_symbols = filter_instruments(registry, "SPOT", currency="USDT", field="quote")
             logging.info(f"Найдено {len(spot_symbols)} спотовых символов.")
             symbols += spot_symbols
 
         # Если флаг fetch_futures установлен в True, собираем данные для фьючерсов
         if fetch_futures:
             logging.info("Начало сбора данных для фьючерсных инструментов (FUTURES)")
-            futures_instruments = await fetch_all_instruments(session, "FUTURES")
-            futures_symbols = filter_instruments(futures_instruments, currency="USDT", field="settleCcy")
+            registry = await fetch_all_instruments(session, "FUTURES")
+            futures_symbols = filter_instruments(registry, "FUTURES", currency="USDT", field="settle")
             logging.info(f"Найдено {len(futures_symbols)} фьючерсных символов.")
             symbols += futures_symbols
 
         # Если флаг fetch_swap установлен в True, собираем данные для свопов
         if fetch_swap:
             logging.info("Начало сбора данных для свопов (SWAP)")
-            swap_instruments = await fetch_all_instruments(session, "SWAP")
-            swap_symbols = filter_instruments(swap_instruments, currency="USDT", field="settleCcy")
+            registry = await fetch_all_instruments(session, "SWAP")
+            swap_symbols = filter_instruments(registry, "SWAP", currency="USDT", field="settle")
             logging.info(f"Найдено {len(swap_symbols)} свопов.")
             symbols += swap_symbols
 
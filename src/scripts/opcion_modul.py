@@ -1,10 +1,17 @@
 import sqlite3
 import logging
-import requests
-from decimal import Decimal, InvalidOperation
-from datetime import datetime
 import threading
-import os
+import time
+import asyncio
+
+import aiohttp
+
+from db_writer import connect, bulk_upsert, snapshot_timestamp
+from http_client import create_session, get_json
+from symbol_registry import load_registry, default_registry
+from options_frame import OPTION_FIELDS, GREEK_COLUMNS, normalize_options, frame_rows
+from option_greeks import add_greeks
+from options_archive import archive_expired, expired_before
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +41,12 @@ def create_db():
             trades_24h INTEGER,
             timestamp DATETIME,
             updated_time DATETIME,
+            underlying_price REAL,
+            iv REAL,
+            delta REAL,
+            gamma REAL,
+            vega REAL,
+            theta REAL,
             UNIQUE(symbol, exchange, market_type)
         );
     ''')
@@ -43,253 +56,159 @@ def create_db():
 
 
 
-# Получение данных с Binance об опционах
-def get_binance_options_data():
-    # URL для получения всех опционных тикеров на Binance
-    url = "https://eapi.binance.com/eapi/v1/ticker"
-
-    logging.info(f"Запрос данных обо всех опционах с Binance по адресу {url}...")
-
-    try:
-        response = requests.get(url)
-
-        # Проверяем успешность запроса
-        if response.status_code != 200:
-            logging.error(f"Ошибка запроса данных: Статус {response.status_code}")
-            return []
-
-        # Получаем данные из ответа
-        result = response.json()
-
-        # Обработка информации о сроке действия из символа
-        for item in result:
-            symbol = item.get('symbol')
-            # Попробуем извлечь срок действия из символа, если он закодирован в символе
-            expiry_info = symbol.split('-')
-            if len(expiry_info) > 1:
-                expiry_date = expiry_info[1]
-                # Предположим, что дата истечения в формате ГГММДД (YYMMDD)
-                item['expiryDate'] = f"20{expiry_date[:2]}-{expiry_date[2:4]}-{expiry_date[4:]}"
-            else:
-                item['expiryDate'] = 'N/A'
-
-        logging.info(f"Всего получено {len(result)} опционных контрактов с Binance.")
-        return result
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Ошибка при выполнении запроса: {e}")
+# Источники цепочек опционов: URL тикеров, общие параметры, параметр базового актива (None — все опционы
+# биржи одним запросом) и каталог инструментов, по которому определяются базовые активы
+OPTION_SOURCES = {
+    'Binance': {'url': "https://eapi.binance.com/eapi/v1/ticker", 'params': {}, 'underlying_param': None,
+                'catalogue': ('Binance', 'option')},
+    'Bybit': {'url': "https://api.bybit.com/v5/market/tickers", 'params': {'category': 'option'},
+              'underlying_param': 'baseCoin', 'catalogue': ('Bybit', 'option')},
+    'OKEx': {'url': "https://www.okx.com/api/v5/market/tickers", 'params': {'instType': 'OPTION'},
+             'underlying_param': 'uly', 'catalogue': ('OKX', 'OPTION_UNDERLYING')},
+}
+
+# Базовые активы на случай, если каталоги недоступны
+FALLBACK_UNDERLYINGS = {'Bybit': ['BTC', 'ETH'], 'OKEx': ['BTC-USD', 'ETH-USD']}
+
+
+def _payload_list(exchange, payload):
+    """Список тикеров из ответа биржи или None, если биржа вернула ошибку."""
+    if exchange == 'Binance':
+        return payload if isinstance(payload, list) else None
+    if exchange == 'Bybit':
+        if payload.get('retCode') != 0:
+            logging.error(f"Ошибка API Bybit: {payload.get('retMsg')}")
+            return None
+        return payload.get('result', {}).get('list', [])
+    if payload.get('code') != '0':
+        logging.error(f"Ошибка API OKEx: {payload.get('msg')}")
+        return None
+    return payload.get('data', [])
+
+
+async def discover_underlyings(session, cache=None):
+    """
+    Базовые активы опционов по каталогам инструментов всех бирж: {биржа: [параметр запроса цепочки]}.
+
+    Каталог опционов Bybit без baseCoin содержит только BTC, поэтому для Bybit запрашиваются
+    все базовые активы, у которых есть опционы хотя бы на одной бирже (пустая цепочка стоит один запрос).
+    """
+    # Каталоги регистрируются в реестре символов по одному: недоступный каталог не мешает остальным
+    registry = default_registry()
+    keys = [source['catalogue'] for source in OPTION_SOURCES.values()]
+    results = await asyncio.gather(*(load_registry(session, [key], cache, registry) for key in keys),
+                                   return_exceptions=True)
+    for (exchange, inst_type), result in zip(keys, results):
+        if isinstance(result, Exception):
+            logging.error(f"Не удалось загрузить каталог опционов {exchange}: {result}")
+
+    return {
+        'Binance': [None],
+        'Bybit': sorted(registry.bases('options')) or FALLBACK_UNDERLYINGS['Bybit'],
+        'OKEx': sorted(registry.symbols('OKX', 'OPTION_UNDERLYING')) or FALLBACK_UNDERLYINGS['OKEx'],
+    }
+
+
+async def get_options_chain(session, exchange, underlying=None):
+    """Тикеры одной цепочки опционов (для Binance — всех опционов биржи)."""
+    source = OPTION_SOURCES[exchange]
+    params = dict(source['params'])
+    if underlying is not None:
+        params[source['underlying_param']] = underlying
+
+    label = underlying or 'всех активов'
+    logging.info(f"Запрос данных об опционах {label} с {exchange}...")
+    payload = await get_json(session, source['url'], params=params)
+    result = _payload_list(exchange, payload)
+    if result is None:
         return []
+    logging.info(f"Получено {len(result)} опционных контрактов ({label}) с {exchange}.")
+    return result
 
 
-# Получение данных с Bybit об опционах
-def get_bybit_options_data():
-    # URL для получения опционных тикеров на Bybit
-    url = "https://api.bybit.com/v5/market/tickers"
-    base_coins = ['BTC', 'ETH']  # Список базовых активов, для которых есть опционы
-    all_results = []
-
-    for base_coin in base_coins:
-        params = {
-            'category': 'option',
-            'baseCoin': base_coin
-        }
-
-        logging.info(f"Запрос данных об опционах {base_coin} с Bybit по адресу {url} с параметрами {params}...")
-
-        try:
-            response = requests.get(url, params=params)
-
-            # Проверяем успешность запроса
-            if response.status_code != 200:
-                logging.error(f"Ошибка запроса данных: Статус {response.status_code}")
-                continue
-
-            data = response.json()
-
-            if data.get('retCode') != 0:
-                logging.error(f"Ошибка API: {data.get('retMsg')}")
-                continue
-
-            result = data.get('result', {}).get('list', [])
-            all_results.extend(result)
-
-            logging.info(f"Получено {len(result)} опционных контрактов {base_coin} с Bybit.")
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Ошибка при выполнении запроса: {e}")
-            continue
-
-    logging.info(f"Всего получено {len(all_results)} опционных контрактов с Bybit.")
-    return all_results
-
-
-# Получение данных с OKEx об опционах
-def get_okex_options_data():
-    import time  # Для добавления задержки между запросами, если необходимо
-    # URL для получения опционных тикеров на OKEx
-    url = "https://www.okx.com/api/v5/market/tickers"
-    underlyings = ['BTC-USD', 'ETH-USD']  # Список базовых активов
-    all_results = []
-
-    for uly in underlyings:
-        params = {
-            'instType': 'OPTION',
-            'uly': uly
-        }
-
-        logging.info(f"Запрос данных об опционах {uly} с OKEx по адресу {url} с параметрами {params}...")
-
-        try:
-            response = requests.get(url, params=params)
-
-            # Проверяем успешность запроса
-            if response.status_code != 200:
-                logging.error(f"Ошибка запроса данных: Статус {response.status_code}")
-                continue
-
-            data = response.json()
-
-            if data.get('code') != '0':
-                logging.error(f"Ошибка API: {data.get('msg')}")
-                continue
-
-            result = data.get('data', [])
-            all_results.extend(result)
-
-            logging.info(f"Получено {len(result)} опционных контрактов {uly} с OKEx.")
-
-            # Если необходимо, можно добавить задержку между запросами
-            # time.sleep(0.1)
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Ошибка при выполнении запроса: {e}")
-            continue
-
-    logging.info(f"Всего получено {len(all_results)} опционных контрактов с OKEx.")
-    return all_results
+OPCION_DATA_COLUMNS = ('symbol', 'exchange', 'market_type', 'last_price', 'volume_24h', 'options', 'price_usdt',
+                       'high_price_24h', 'low_price_24h', 'trades_24h', 'strike_price', 'option_type', 'expiry_date',
+                       'exercise_price', 'timestamp', 'updated_time') + GREEK_COLUMNS
+OPCION_DATA_KEY = ('symbol', 'exchange', 'market_type')
+OPCION_DATA_UPDATE_COLUMNS = ('last_price', 'volume_24h', 'price_usdt', 'high_price_24h', 'low_price_24h',
+                              'trades_24h', 'updated_time') + GREEK_COLUMNS
 
 
 # Сохранение данных в базу данных
-def save_to_db(data, exchange, market_type):
-    conn = sqlite3.connect('opcion_data.db')
-    cursor = conn.cursor()
+def save_to_db(data, exchange, market_type, timestamp=None):
+    timestamp = timestamp or snapshot_timestamp()
 
     logging.info(f"Сохранение данных для {exchange} ({market_type}): {data[:5]}...")  # Логируем первые 5 записей
 
-    for item in data:
-        try:
-            if exchange == 'Binance':
-                symbol = item.get('symbol')
-                strike_price = item.get('strikePrice')
-                option_type = 'Call' if symbol.endswith('-C') else 'Put'
-                expiry_date = item.get('expiryDate')
-                exercise_price = item.get('exercisePrice', '0')
-
-                last_price = Decimal(str(item.get('lastPrice') or '0'))
-                volume_24h = Decimal(str(item.get('volume') or '0'))
-                high_price_24h = Decimal(str(item.get('high') or '0'))
-                low_price_24h = Decimal(str(item.get('low') or '0'))
-                trades_24h = item.get('tradeCount', '0')
-
-            elif exchange == 'Bybit':
-                symbol = item.get('symbol')
-                symbol_parts = symbol.split('-')
-                if len(symbol_parts) != 4:
-                    logging.error(f"Неизвестный формат символа: {symbol}")
-                    continue
-                underlying_asset, expiry_str, strike_price, option_code = symbol_parts
-                option_type = 'Call' if option_code == 'C' else 'Put'
-
-                try:
-                    expiry_date = datetime.strptime(expiry_str, '%d%b%y').strftime('%Y-%m-%d')
-                except ValueError as ve:
-                    logging.error(f"Ошибка при разборе даты истечения для {symbol}: {ve}")
-                    continue
-                exercise_price = strike_price
-
-                last_price = Decimal(str(item.get('lastPrice') or '0'))
-                volume_24h = Decimal(str(item.get('turnover24h') or '0'))
-                high_price_24h = Decimal(str(item.get('highPrice24h') or '0'))
-                low_price_24h = Decimal(str(item.get('lowPrice24h') or '0'))
-                trades_24h = '0'
-
-            elif exchange == 'OKEx':
-                symbol = item.get('instId')
-                symbol_parts = symbol.split('-')
-                if len(symbol_parts) != 5:
-                    logging.error(f"Неизвестный формат символа: {symbol}")
-                    continue
-                underlying_asset, currency, expiry_str, strike_price, option_code = symbol_parts
-                option_type = 'Call' if option_code == 'C' else 'Put'
-
-                try:
-                    expiry_date = datetime.strptime(expiry_str, '%y%m%d').strftime('%Y-%m-%d')
-                except ValueError as ve:
-                    logging.error(f"Ошибка при разборе даты истечения для {symbol}: {ve}")
-                    continue
-
-                exercise_price = strike_price
-
-                last_price = Decimal(str(item.get('last') or '0'))
-                volume_24h = Decimal(str(item.get('volCcy24h') or '0'))
-                high_price_24h = Decimal(str(item.get('high24h') or '0'))
-                low_price_24h = Decimal(str(item.get('low24h') or '0'))
-                trades_24h = '0'
-
-            else:
-                logging.error(f"Неизвестная биржа: {exchange}")
-                continue
-
-            price_usdt = volume_24h * last_price
-            last_price_str = format(last_price, 'f')
-            volume_24h_str = format(volume_24h, 'f')
-            price_usdt_str = format(price_usdt, 'f')
-            high_price_24h_str = format(high_price_24h, 'f')
-            low_price_24h_str = format(low_price_24h, 'f')
-            trades_24h_str = str(trades_24h)
-            updated_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")  # Время обновления
-            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-            cursor.execute('''
-                INSERT INTO opcion_data (symbol, exchange, market_type, last_price, volume_24h, options, price_usdt,
-                                         high_price_24h, low_price_24h, trades_24h, strike_price, option_type, expiry_date,
-                                         exercise_price, timestamp, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, exchange, market_type) DO UPDATE SET
-                    last_price = excluded.last_price,
-                    volume_24h = excluded.volume_24h,
-                    price_usdt = excluded.price_usdt,
-                    high_price_24h = excluded.high_price_24h,
-                    low_price_24h = excluded.low_price_24h,
-                    trades_24h = excluded.trades_24h,
-                    updated_time = excluded.updated_time
-            ''', (symbol, exchange, market_type, last_price_str, volume_24h_str, symbol, price_usdt_str,
-                  high_price_24h_str, low_price_24h_str, trades_24h_str, strike_price, option_type, expiry_date,
-                  exercise_price, timestamp, updated_time))
-
-
-        except (InvalidOperation, TypeError, ValueError, KeyError) as e:
-            logging.error(f"Ошибка при обработке данных: {e}")
-            continue
-
-    conn.commit()
-    conn.close()
-    logging.info(f"Данные успешно сохранены для {market_type} с биржи {exchange}.")
+    if exchange not in OPTION_FIELDS:
+        logging.error(f"Неизвестная биржа: {exchange}")
+        return
 
+    # Весь ответ биржи разбирается колонками (pandas/NumPy), а не построчно
+    frame = normalize_options(data, exchange)
+    # Контракты, истекшие, но ещё отдаваемые биржей, не возвращаются в горячую таблицу после архивирования
+    frame = frame[frame['expiry_date'] > expired_before()].reset_index(drop=True)
+    # Подразумеваемая волатильность и греки — одним векторным проходом по всем контрактам
+    frame = add_greeks(frame, exchange)
+    rows = frame_rows(frame, exchange, market_type, timestamp)
 
-def background_update():
-    logging.info("Фоновое обновление данных началось.")
+    # Все контракты биржи записываются одной транзакцией
+    conn = connect('opcion_data.db')
+    try:
+        bulk_upsert(conn, 'opcion_data', OPCION_DATA_COLUMNS, OPCION_DATA_KEY, OPCION_DATA_UPDATE_COLUMNS, rows)
+    finally:
+        conn.close()
+    logging.info(f"Данные успешно сохранены для {market_type} с биржи {exchange}.")
 
-    # Получаем и сохраняем данные для каждого обмена
-    binance_options_data = get_binance_options_data()
-    save_to_db(binance_options_data, exchange='Binance', market_type='options')
 
-    bybit_options_data = get_bybit_options_data()
-    save_to_db(bybit_options_data, exchange='Bybit', market_type='options')
+async def collect_chain(session, db_lock, timestamp, exchange, underlying):
+    """Загружает одну цепочку и сразу записывает её в базу."""
+    started = time.monotonic()
+    try:
+        data = await get_options_chain(session, exchange, underlying)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.error(f"Ошибка при запросе опционов ({underlying or 'все активы'}) с {exchange}: {e}")
+        return 0
+    if not data:
+        return 0
+
+    # Запись в SQLite выполняется по очереди и вне цикла событий
+    async with db_lock:
+        await asyncio.to_thread(save_to_db, data, exchange, 'options', timestamp)
+    logging.info(f"{exchange} ({underlying or 'все активы'}): {len(data)} контрактов за {time.monotonic() - started:.2f} с.")
+    return len(data)
+
+
+async def collect_options():
+    """Параллельно собирает все цепочки опционов всех бирж."""
+    started = time.monotonic()
+    db_lock = asyncio.Lock()
+    timestamp = snapshot_timestamp()  # Одна временная метка на весь снимок
+
+    async with create_session() as session:
+        underlyings = await discover_underlyings(session)
+        chains = [(exchange, underlying) for exchange, items in underlyings.items() for underlying in items]
+        results = await asyncio.gather(
+            *(collect_chain(session, db_lock, timestamp, exchange, underlying) for exchange, underlying in chains),
+            return_exceptions=True
+        )
+
+    for (exchange, underlying), result in zip(chains, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка при обработке опционов ({underlying or 'все активы'}) с {exchange}: {result}",
+                          exc_info=result)
+
+    total = sum(result for result in results if not isinstance(result, Exception))
+    logging.info(f"Собрано {total} опционных контрактов из {len(chains)} цепочек за {time.monotonic() - started:.2f} с.")
+
+    # После снимка истёкшие контракты переносятся в архив, в opcion_data остаются только торгуемые
+    async with db_lock:
+        await asyncio.to_thread(archive_expired)
 
-    okex_options_data = get_okex_options_data()
-    save_to_db(okex_options_data, exchange='OKEx', market_type='options')
 
+def background_update():
+    logging.info("Фоновое обновление данных началось.")
+    asyncio.run(collect_options())
     logging.info("Фоновое обновление данных завершено.")
 
 
@@ -308,28 +227,28 @@ def add_updated_time_column():
     conn.close()
 
 
+def add_greeks_columns():
+    conn = sqlite3.connect('opcion_data.db')
+    cursor = conn.cursor()
+
+    # Добавляем колонки цены базового актива, волатильности и греков, если их нет
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(opcion_data)")}
+    for column in GREEK_COLUMNS:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE opcion_data ADD COLUMN {column} REAL")
+            logging.info(f"Колонка '{column}' успешно добавлена.")
+
+    conn.commit()
+    conn.close()
+
+
 # Основной процесс: получение и сохранение данных
 if __name__ == "__main__":
     create_db()  # Создаём базу данных, если её нет
     add_updated_time_column()  # Добавляем колонку updated_time, если её нет
+    add_greeks_columns()  # Добавляем колонки волатильности и греков, если их нет
 
     # Запускаем фоновое обновление данных
     update_thread = threading.Thread(target=background_update)
     update_thread.start()
     update_thread.join()  # Ожидаем завершения фонового обновления
-    logging.info("Фоновое обновление данных завершено.")
-
-    # Получаем данные об опционах с Binance
-    binance_options_data = get_binance_options_data()
-    # Сохраняем данные в базу данных
-    save_to_db(binance_options_data, exchange='Binance', market_type='options')
-
-    # Получаем данные об опционах с Bybit
-    bybit_options_data = get_bybit_options_data()
-    # Сохраняем данные в базу данных
-    save_to_db(bybit_options_data, exchange='Bybit', market_type='options')
-
-    # Получаем данные об опционах с OKEx
-    okex_options_data = get_okex_options_data()
-    # Сохраняем данные в базу данных
-    save_to_db(okex_options_data, exchange='OKEx', market_type='options')
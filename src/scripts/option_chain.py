@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import logging
+import threading
+
+import numpy as np
+
+# Колонки opcion_data, которые хранятся в цепочке для коллов и путов (отсутствующие в таблице пропускаются)
+CHAIN_COLUMNS = ('last_price', 'volume_24h', 'price_usdt', 'high_price_24h', 'low_price_24h', 'exercise_price',
+                 'underlying_price', 'iv', 'delta', 'gamma', 'vega', 'theta')
+
+
+class OptionChain:
+    """
+    Одна цепочка (биржа, базовый актив, дата истечения): отсортированный массив страйков
+    и колонки коллов и путов, выровненные по нему (NaN, если контракта на страйке нет).
+    """
+
+    def __init__(self, rows, columns):
+        # rows: {символ: (страйк, тип опциона, значения колонок)}
+        self.columns = columns
+        self.strikes = np.unique(np.array([row[0] for row in rows.values()], dtype=np.float64))
+        size = len(self.strikes)
+        self.calls = {'symbol': np.full(size, None, dtype=object)}
+        self.puts = {'symbol': np.full(size, None, dtype=object)}
+        for side in (self.calls, self.puts):
+            side.update({column: np.full(size, np.nan) for column in columns})
+
+        for symbol, (strike, option_type, values) in rows.items():
+            side = self.calls if option_type == 'Call' else self.puts
+            position = np.searchsorted(self.strikes, strike)
+            side['symbol'][position] = symbol
+            for column, value in zip(columns, values):
+                side[column][position] = np.nan if value is None else value
+
+    def __len__(self):
+        return len(self.strikes)
+
+    def atm_strike(self):
+        """
+        Страйк «у денег»: ближайший к цене базового актива (underlying_price), иначе страйк
+        с минимальной разницей цен колла и пута (паритет), иначе средний страйк.
+        """
+        if not len(self.strikes):
+            return None
+        underlying = np.concatenate([side.get('underlying_price', np.array([])) for side in (self.calls, self.puts)])
+        underlying = underlying[np.isfinite(underlying)]
+        if len(underlying):
+            return self.strikes[self.nearest_index(underlying[0], 1)[0]]
+
+        difference = np.abs(self.calls['last_price'] - self.puts['last_price']) if 'last_price' in self.calls else None
+        if difference is not None and np.isfinite(difference).any():
+            return self.strikes[np.nanargmin(difference)]
+        return self.strikes[len(self.strikes) // 2]
+
+    def nearest_index(self, price, count=10):
+        """Позиции count страйков, ближайших к price, по возрастанию страйка."""
+        position = np.searchsorted(self.strikes, price)
+        start = max(0, position - count)
+        window = self.strikes[start:position + count]
+        nearest = np.argsort(np.abs(window - price), kind='stable')[:count]
+        return np.sort(nearest) + start
+
+    def ladder(self, price=None, count=None):
+        """
+        Лестница страйков: {'strike': ..., 'call_<колонка>': ..., 'put_<колонка>': ...}.
+
+        Если задан count — только count страйков вокруг price (по умолчанию вокруг atm_strike).
+        """
+        if count is None:
+            positions = slice(None)
+        else:
+            price = self.atm_strike() if price is None else price
+            positions = self.nearest_index(price, count) if price is not None else slice(0, 0)
+
+        ladder = {'strike': self.strikes[positions]}
+        for prefix, side in (('call', self.calls), ('put', self.puts)):
+            for column, values in side.items():
+                ladder[f"{prefix}_{column}"] = values[positions]
+        return ladder
+
+
+class OptionChainIndex:
+    """
+    Индекс цепочек опционов в памяти по таблице opcion_data.
+
+    Цепочки хранятся по ключу (биржа, базовый актив, дата истечения), поэтому лестница страйков
+    или страйки «у денег» находятся обращением к словарю и двоичным поиском по страйкам.
+    refresh() перечитывает только строки, изменившиеся с прошлого раза (по updated_time),
+    и перестраивает только затронутые цепочки; признак изменений — PRAGMA data_version.
+    """
+
+    def __init__(self, db_path='opcion_data.db', columns=CHAIN_COLUMNS):
+        self.db_path = db_path
+        self.requested_columns = columns
+        self.columns = ()
+        self._conn = None
+        self._data_version = None
+        self._updated_time = None
+        self._rows = {}     # ключ цепочки -> {символ: (страйк, тип, значения)}
+        self._keys = {}     # (символ, биржа) -> ключ цепочки
+        self._chains = {}   # ключ цепочки -> OptionChain
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            # Индекс общий для колбэков Dash из разных потоков; доступ к соединению под блокировкой
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            available = {row[1] for row in self._conn.execute('PRAGMA table_info(opcion_data)')}
+            self.columns = tuple(column for column in self.requested_columns if column in available)
+        return self._conn
+
+    def refresh(self):
+        """Подтягивает изменения opcion_data; возвращает число перестроенных цепочек."""
+        if not os.path.exists(self.db_path):
+            return 0
+        with self._lock:
+            try:
+                return self._refresh()
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка при обновлении индекса цепочек опционов: {e}")
+                self._reset()
+                return 0
+
+    def _reset(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._data_version = None
+        self._updated_time = None
+
+    def _refresh(self):
+        conn = self._connect()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return 0
+
+        select = ', '.join(('symbol', 'exchange', 'strike_price', 'option_type', 'expiry_date', 'updated_time')
+                           + self.columns)
+        full = self._updated_time is None
+        if full:
+            rows = conn.execute(f"SELECT {select} FROM opcion_data").fetchall()
+        else:
+            # Строки последней секунды перечитываются ещё раз: запись могла прийти в ту же секунду
+            rows = conn.execute(f"SELECT {select} FROM opcion_data WHERE updated_time >= ?",
+                                (self._updated_time,)).fetchall()
+        self._data_version = data_version
+
+        touched = self._apply(rows, full)
+        total = conn.execute('SELECT COUNT(*) FROM opcion_data WHERE strike_price IS NOT NULL').fetchone()[0]
+        if not full and total != len(self._keys):
+            # Строки удалялись (например, архивирование истёкших контрактов): перечитываем таблицу целиком
+            self._reset()
+            return self._refresh()
+
+        for key in touched:
+            if self._rows.get(key):
+                self._chains[key] = OptionChain(self._rows[key], self.columns)
+            else:
+                self._rows.pop(key, None)
+                self._chains.pop(key, None)
+        return len(touched)
+
+    def _apply(self, rows, full):
+        touched = set(self._chains) if full else set()
+        if full:
+            self._rows, self._keys = {}, {}
+
+        for symbol, exchange, strike, option_type, expiry_date, updated_time, *values in rows:
+            if strike is None:
+                continue
+            if updated_time is not None and (self._updated_time is None or updated_time > self._updated_time):
+                self._updated_time = updated_time
+            key = (exchange, symbol.split('-')[0], expiry_date)
+            row = (strike, option_type, values)
+            previous = self._keys.get((symbol, exchange))
+            if previous == key and self._rows[key].get(symbol) == row:
+                continue  # перечитанная строка не изменилась
+            if previous is not None and previous != key:
+                self._rows[previous].pop(symbol, None)
+                touched.add(previous)
+            self._rows.setdefault(key, {})[symbol] = row
+            self._keys[(symbol, exchange)] = key
+            touched.add(key)
+
+        if full and self._updated_time is None:
+            self._updated_time = ''
+        return touched
+
+    def chain(self, exchange, underlying, expiry):
+        return self._chains.get((exchange, underlying, expiry))
+
+    def exchanges(self):
+        return sorted({key[0] for key in self._chains})
+
+    def underlyings(self, exchange):
+        return sorted({key[1] for key in self._chains if key[0] == exchange})
+
+    def expiries(self, exchange, underlying):
+        return sorted(key[2] for key in self._chains if key[:2] == (exchange, underlying))
+
+    def ladder(self, exchange, underlying, expiry, price=None, count=None):
+        """Лестница страйков цепочки (см. OptionChain.ladder) или None, если цепочки нет."""
+        chain = self.chain(exchange, underlying, expiry)
+        return chain.ladder(price, count) if chain is not None else None
@@ -0,0 +1,204 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from options_frame import GREEK_COLUMNS
+
+# Опционы всех трёх бирж исполняются в 08:00 UTC даты истечения
+EXPIRY_HOUR_UTC = 8
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+RISK_FREE_RATE = 0.0
+
+# Поиск подразумеваемой волатильности: границы, число итераций, точность (доля цены контракта)
+# и ширина интервала волатильности, при которой поиск останавливается
+IV_MIN = 1e-4
+IV_MAX = 5.0
+MAX_ITERATIONS = 60
+PRICE_TOLERANCE = 1e-6
+IV_TOLERANCE = 1e-7
+
+# Биржи, где премия котируется в базовой монете (коин-маржинальные опционы OKX): перед расчётом
+# премия переводится в USD умножением на форвардную цену
+INVERSE_EXCHANGES = {'OKEx'}
+
+_SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def norm_cdf(x):
+    """
+    Функция нормального распределения без SciPy: N(x) = erfc(-x/√2) / 2, erfc — чебышёвская аппроксимация
+    (Numerical Recipes, erfcc) с относительной погрешностью < 1.2e-7 и в хвостах, где лежат цены
+    глубоко вне денег.
+    """
+    z = np.abs(x) / np.sqrt(2)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = (-1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+        0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+    tail = 0.5 * t * np.exp(-z * z + poly)
+    return np.where(x >= 0, 1.0 - tail, tail)
+
+
+def black76(forward, strike, t, sigma, is_call, discount=1.0):
+    """Цена по Black-76 и d1 (все аргументы — массивы одной длины или скаляры)."""
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(forward / strike) + 0.5 * sigma * sigma * t) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    call = discount * (forward * norm_cdf(d1) - strike * norm_cdf(d2))
+    put = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+    return np.where(is_call, call, put), d1
+
+
+def implied_volatility(price, forward, strike, t, is_call, discount=1.0):
+    """
+    Подразумеваемая волатильность всех контрактов сразу: векторный метод Ньютона с защитной бисекцией.
+
+    Контракты в деньгах решаются через контракт вне денег того же страйка (паритет: у колла и пута
+    одна волатильность), иначе внутренняя стоимость съедает точность. Для каждого контракта хранится
+    интервал [lo, hi], содержащий решение (цена растёт с волатильностью). Шаг Ньютона принимается,
+    если он остаётся внутри интервала, иначе берётся середина интервала; сошедшиеся контракты дальше
+    не пересчитываются. Цены вне границ без арбитража дают NaN.
+    """
+    price, forward, strike, t = (np.asarray(a, dtype=np.float64) for a in (price, forward, strike, t))
+    is_call = np.asarray(is_call, dtype=bool)
+    discount = np.broadcast_to(np.asarray(discount, dtype=np.float64), price.shape)
+
+    with np.errstate(invalid='ignore'):
+        in_the_money = np.where(is_call, forward > strike, strike > forward)
+    # C - P = D(F - K): цена контракта вне денег = цена минус внутренняя стоимость
+    price = price - discount * np.abs(forward - strike) * in_the_money
+    is_call = is_call ^ in_the_money
+    upper = discount * np.where(is_call, forward, strike)
+    valid = (np.isfinite(price) & np.isfinite(forward) & (forward > 0) & (strike > 0) & (t > 0)
+             & (price > 0) & (price < upper))
+
+    iv = np.full(price.shape, np.nan)
+    active = np.flatnonzero(valid)
+    if not len(active):
+        return iv
+
+    p, f, k, tt, c, d = (a[active] for a in (price, forward, strike, t, is_call, discount))
+    lo = np.full(len(active), IV_MIN)
+    hi = np.full(len(active), IV_MAX)
+    # Начальное приближение Бреннера–Субрахманьяма
+    sigma = np.clip(np.sqrt(2 * np.pi / tt) * p / (d * f), 0.05, 3.0)
+    done = np.zeros(len(active), dtype=bool)
+
+    for _ in range(MAX_ITERATIONS):
+        todo = np.flatnonzero(~done)
+        if not len(todo):
+            break
+        s = sigma[todo]
+        model, d1 = black76(f[todo], k[todo], tt[todo], s, c[todo], d[todo])
+        diff = model - p[todo]
+        above = diff > 0
+        hi[todo] = np.where(above, np.minimum(hi[todo], s), hi[todo])
+        lo[todo] = np.where(above, lo[todo], np.maximum(lo[todo], s))
+
+        converged = (np.abs(diff) <= PRICE_TOLERANCE * p[todo]) | (hi[todo] - lo[todo] < IV_TOLERANCE)
+        done[todo[converged]] = True
+
+        vega = d[todo] * f[todo] * norm_pdf(d1) * np.sqrt(tt[todo])
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = s - diff / vega
+        inside = np.isfinite(newton) & (newton > lo[todo]) & (newton < hi[todo])
+        step = np.where(inside, newton, 0.5 * (lo[todo] + hi[todo]))
+        sigma[todo] = np.where(converged, s, step)
+
+    # Не сошедшиеся за MAX_ITERATIONS итераций (вырожденные цены) остаются NaN
+    iv[active[done]] = sigma[done]
+    return iv
+
+
+def greeks(forward, strike, t, sigma, is_call, discount=1.0):
+    """
+    Греки Black-76: delta, gamma, vega (на 1 п.п. волатильности) и theta (за календарный день).
+    """
+    sqrt_t = np.sqrt(t)
+    price, d1 = black76(forward, strike, t, sigma, is_call, discount)
+    pdf = norm_pdf(d1)
+    delta = np.where(is_call, discount * norm_cdf(d1), -discount * norm_cdf(-d1))
+    gamma = discount * pdf / (forward * sigma * sqrt_t)
+    vega = discount * forward * pdf * sqrt_t / 100
+    theta = (-discount * forward * pdf * sigma / (2 * sqrt_t) + RISK_FREE_RATE * price) / 365
+    return {'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta}
+
+
+def years_to_expiry(expiry, now=None):
+    """Срок до исполнения в годах по колонке datetime64 с датой истечения."""
+    now = pd.Timestamp(now or datetime.utcnow())
+    expiry_time = expiry + pd.Timedelta(hours=EXPIRY_HOUR_UTC)
+    return ((expiry_time - now).dt.total_seconds() / SECONDS_PER_YEAR).to_numpy(dtype=np.float64)
+
+
+def parity_forward(frame, inverse):
+    """
+    Форвард по паритету колла и пута для цепочек без цены базового актива (OKX не присылает её в тикерах).
+
+    Для каждого страйка, где есть и колл, и пут: F = K + (C - P) для премий в USD и F = K / (1 - (c - p))
+    для премий в монете; по цепочке (актив, дата) берётся медиана оценок.
+    """
+    quotes = frame[frame['last_price'] > 0].pivot_table(
+        index=['underlying', 'expiry_date', 'strike_price'], columns='option_type', values='last_price',
+        aggfunc='last')
+    if 'Call' not in quotes or 'Put' not in quotes:
+        return pd.Series(np.nan, index=frame.index)
+
+    quotes = quotes.dropna(subset=['Call', 'Put']).reset_index()
+    difference = quotes['Call'] - quotes['Put']
+    if inverse:
+        estimates = quotes['strike_price'] / (1 - difference)
+        estimates = estimates.where(difference < 1)
+    else:
+        estimates = quotes['strike_price'] + difference
+    forwards = estimates.where(estimates > 0).groupby([quotes['underlying'], quotes['expiry_date']]).median()
+    keys = pd.MultiIndex.from_frame(frame[['underlying', 'expiry_date']])
+    return pd.Series(forwards.reindex(keys).to_numpy(), index=frame.index)
+
+
+def add_greeks(frame, exchange, now=None):
+    """
+    Добавляет к DataFrame из options_frame.normalize_options колонки underlying_price, iv, delta, gamma,
+    vega и theta, рассчитанные одним векторным проходом по всем контрактам.
+
+    Для коин-маржинальных опционов (INVERSE_EXCHANGES) премия переводится в USD по форварду, так что
+    волатильность и греки относятся к USD-стоимости контракта.
+    """
+    if frame.empty:
+        for column in GREEK_COLUMNS:
+            frame[column] = pd.Series(dtype=np.float64)
+        return frame
+
+    inverse = exchange in INVERSE_EXCHANGES
+    forward = frame['underlying_price'].to_numpy(dtype=np.float64).copy()
+    missing = ~(forward > 0)
+    if missing.any():
+        forward[missing] = parity_forward(frame, inverse).to_numpy()[missing]
+    frame['underlying_price'] = forward
+
+    t = years_to_expiry(frame['expiry'], now)
+    discount = np.exp(-RISK_FREE_RATE * np.maximum(t, 0))
+    price = frame['last_price'].to_numpy(dtype=np.float64)
+    if inverse:
+        price = price * forward
+    strike = frame['strike_price'].to_numpy(dtype=np.float64)
+    is_call = (frame['option_type'] == 'Call').to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        iv = implied_volatility(price, forward, strike, t, is_call, discount)
+        values = greeks(forward, strike, t, iv, is_call, discount)
+
+    frame['iv'] = iv
+    for column, array in values.items():
+        frame[column] = np.where(np.isfinite(iv), array, np.nan)
+
+    solved = np.isfinite(iv).sum()
+    if solved < len(frame):
+        logging.info(f"{exchange}: волатильность рассчитана для {solved} из {len(frame)} контрактов "
+                     f"(остальные без цены, истекли или вне границ без арбитража).")
+    return frame
@@ -0,0 +1,163 @@
+import json
+import zlib
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from db_writer import connect
+from option_greeks import EXPIRY_HOUR_UTC
+
+OPTIONS_DB = 'opcion_data.db'
+# Колонки opcion_data, которые переносятся в архив (id не нужен)
+ARCHIVE_COLUMNS = ('symbol', 'exchange', 'market_type', 'last_price', 'volume_24h', 'options', 'price_usdt',
+                   'high_price_24h', 'low_price_24h', 'trades_24h', 'strike_price', 'option_type', 'expiry_date',
+                   'exercise_price', 'timestamp', 'updated_time', 'underlying_price', 'iv', 'delta', 'gamma', 'vega',
+                   'theta')
+COMPRESSION_LEVEL = 9
+
+
+def create_archive_table(conn):
+    # Одна строка на истёкшую цепочку: колонки контрактов в сжатом JSON, ключ цепочки — обычными колонками,
+    # чтобы отбирать цепочки по индексу без распаковки
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS opcion_archive (
+            exchange TEXT NOT NULL,
+            underlying TEXT NOT NULL,
+            expiry_date TEXT NOT NULL,
+            contracts INTEGER NOT NULL,
+            archived_at DATETIME NOT NULL,
+            data BLOB NOT NULL,           -- zlib(JSON {колонка: [значения]})
+            PRIMARY KEY (exchange, underlying, expiry_date)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_opcion_archive_expiry ON opcion_archive (expiry_date)')
+
+
+def pack(columns):
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def expired_before(now=None):
+    """Граница истечения: контракты с датой не позже этой уже исполнены (в 08:00 UTC даты истечения)."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(hours=EXPIRY_HOUR_UTC)).date().isoformat()
+
+
+def archive_expired(db_path=OPTIONS_DB, now=None):
+    """
+    Переносит истёкшие контракты из opcion_data в сжатый архив opcion_archive одной транзакцией.
+
+    Контракты группируются в цепочки (биржа, базовый актив, дата истечения); если цепочка уже
+    в архиве (например, строка пришла после прошлого архивирования), записи объединяются по символу.
+    :return: количество перенесённых контрактов.
+    """
+    cutoff = expired_before(now)
+    conn = connect(db_path)
+    try:
+        create_archive_table(conn)
+        available = {row[1] for row in conn.execute('PRAGMA table_info(opcion_data)')}
+        columns = [column for column in ARCHIVE_COLUMNS if column in available]
+        # Даты без формата YYYY-MM-DD (например, 'N/A') не архивируются
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM opcion_data "
+            f"WHERE expiry_date <= ? AND expiry_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'",
+            (cutoff,)).fetchall()
+        if not rows:
+            return 0
+
+        chains = {}
+        symbol_at, exchange_at, expiry_at = (columns.index(name) for name in ('symbol', 'exchange', 'expiry_date'))
+        for row in rows:
+            key = (row[exchange_at], row[symbol_at].split('-')[0], row[expiry_at])
+            chains.setdefault(key, {})[row[symbol_at]] = row
+
+        archived_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        with conn:
+            for key, contracts in chains.items():
+                existing = conn.execute(
+                    'SELECT data FROM opcion_archive WHERE exchange = ? AND underlying = ? AND expiry_date = ?',
+                    key).fetchone()
+                if existing is not None:
+                    previous = unpack(existing[0])
+                    names = list(previous)
+                    for values in zip(*previous.values()):
+                        record = dict(zip(names, values))
+                        if record['symbol'] not in contracts:
+                            contracts[record['symbol']] = tuple(record.get(column) for column in columns)
+
+                packed = pack({column: list(values) for column, values in zip(columns, zip(*contracts.values()))})
+                conn.execute('''
+                    INSERT INTO opcion_archive (exchange, underlying, expiry_date, contracts, archived_at, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(exchange, underlying, expiry_date) DO UPDATE SET
+                        contracts = excluded.contracts,
+                        archived_at = excluded.archived_at,
+                        data = excluded.data
+                ''', (*key, len(contracts), archived_at, packed))
+
+            conn.execute(
+                "DELETE FROM opcion_data "
+                "WHERE expiry_date <= ? AND expiry_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'",
+                (cutoff,))
+    except sqlite3.Error as e:
+        logging.error(f"Ошибка при архивировании истёкших опционов: {e}", exc_info=True)
+        raise
+    finally:
+        conn.close()
+
+    logging.info(f"В архив перенесено {len(rows)} истёкших контрактов ({len(chains)} цепочек).")
+    return len(rows)
+
+
+def load_archive(db_path=OPTIONS_DB, exchange=None, underlying=None, expiry_from=None, expiry_to=None):
+    """
+    Архивные контракты в DataFrame (колонки как в opcion_data).
+
+    Цепочки отбираются по ключу (биржа, актив, диапазон дат истечения) без распаковки, распаковываются
+    только подходящие.
+    """
+    conditions, params = [], []
+    for condition, value in (('exchange = ?', exchange), ('underlying = ?', underlying),
+                             ('expiry_date >= ?', expiry_from), ('expiry_date <= ?', expiry_to)):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(db_path)
+    try:
+        blobs = conn.execute(f"SELECT data FROM opcion_archive {where} ORDER BY expiry_date", params).fetchall()
+    except sqlite3.OperationalError:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)  # Архива ещё нет
+    finally:
+        conn.close()
+
+    frames = [pd.DataFrame(unpack(blob)) for blob, in blobs]
+    if not frames:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def archive_summary(db_path=OPTIONS_DB):
+    """Список архивных цепочек: биржа, актив, дата истечения, число контрактов и размер в байтах."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql_query(
+            'SELECT exchange, underlying, expiry_date, contracts, archived_at, length(data) AS size_bytes '
+            'FROM opcion_archive ORDER BY expiry_date', conn)
+    except (sqlite3.OperationalError, pd.errors.DatabaseError):
+        return pd.DataFrame(columns=['exchange', 'underlying', 'expiry_date', 'contracts', 'archived_at',
+                                     'size_bytes'])
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    archive_expired()
@@ -0,0 +1,139 @@
+import logging
+from datetime import date
+from functools import lru_cache
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+# Поля тикеров опционов: колонка таблицы -> ключ в ответе биржи
+OPTION_FIELDS = {
+    'Binance': {'symbol': 'symbol', 'last_price': 'lastPrice', 'volume_24h': 'volume', 'high_price_24h': 'high',
+                'low_price_24h': 'low', 'trades_24h': 'tradeCount', 'strike_price': 'strikePrice',
+                'exercise_price': 'exercisePrice'},
+    'Bybit': {'symbol': 'symbol', 'last_price': 'lastPrice', 'volume_24h': 'turnover24h',
+              'high_price_24h': 'highPrice24h', 'low_price_24h': 'lowPrice24h', 'underlying_price': 'underlyingPrice'},
+    'OKEx': {'symbol': 'instId', 'last_price': 'last', 'volume_24h': 'volCcy24h', 'high_price_24h': 'high24h',
+             'low_price_24h': 'low24h'},
+}
+
+# Разбор символа опциона: минимальное число частей через '-', позиции базового актива, даты, страйка и типа,
+# формат даты. Binance: BTC-241227-60000-C, Bybit: BTC-27DEC24-60000-C(-USDT), OKX: BTC-USD-241227-60000-C
+OPTION_SYMBOLS = {
+    'Binance': {'parts': 4, 'underlying': 0, 'expiry': 1, 'strike': 2, 'type': 3, 'format': 'yymmdd'},
+    'Bybit': {'parts': 4, 'underlying': 0, 'expiry': 1, 'strike': 2, 'type': 3, 'format': 'ddmonyy'},
+    'OKEx': {'parts': 5, 'underlying': 0, 'expiry': 2, 'strike': 3, 'type': 4, 'format': 'yymmdd'},
+}
+
+# Месяцы разбираются без strptime('%b'): он зависит от локали, а main.py ставит ru_RU
+MONTHS = {name: number for number, name in enumerate(
+    ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'), start=1)}
+
+NUMERIC_COLUMNS = ('last_price', 'volume_24h', 'high_price_24h', 'low_price_24h')
+# Расчётные колонки (option_greeks.add_greeks) в порядке записи после основных
+GREEK_COLUMNS = ('underlying_price', 'iv', 'delta', 'gamma', 'vega', 'theta')
+
+
+@lru_cache(maxsize=None)
+def parse_expiry(token, fmt):
+    """Дата истечения 'YYYY-MM-DD' из токена символа или None; кэшируется, уникальных дат немного."""
+    try:
+        if fmt == 'yymmdd':
+            return date(2000 + int(token[:2]), int(token[2:4]), int(token[4:6])).isoformat()
+        day, month, year = token[:-5], token[-5:-2], token[-2:]
+        return date(2000 + int(year), MONTHS[month.upper()], int(day)).isoformat()
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+def _numeric(series):
+    # Обычно все значения — числа в строках, и хватает одного astype; пустые и нечисловые значения
+    # (медленный путь через to_numeric) считаются нулём
+    try:
+        values = series.to_numpy().astype(np.float64)
+    except (TypeError, ValueError):
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    return np.nan_to_num(values, nan=0.0)
+
+
+def normalize_options(data, exchange):
+    """
+    Тикеры опционов биржи в DataFrame с типизированными колонками.
+
+    Символы разбираются векторными операциями над строками, даты истечения — один раз на уникальный
+    токен. Колонки: symbol, underlying, last_price, volume_24h, high_price_24h, low_price_24h (float64),
+    trades_24h (int64), strike_price, exercise_price, underlying_price (float64, NaN — нет данных),
+    option_type ('Call'/'Put'), expiry_date ('YYYY-MM-DD'), expiry (datetime64), price_usdt (float64).
+    """
+    fields = OPTION_FIELDS[exchange]
+    spec = OPTION_SYMBOLS[exchange]
+    raw = pd.DataFrame(data, columns=list(fields.values()))
+    raw.columns = list(fields)
+
+    symbols = raw['symbol'].astype(str)
+    # Недостающие части (короткие символы, пустой ответ) дополняются NaN
+    parts = symbols.str.split('-', expand=True).reindex(columns=range(spec['parts']))
+    valid = parts.notna().all(axis=1)
+    if not valid.all():
+        logging.error(f"{exchange}: пропущено {(~valid).sum()} символов неизвестного формата, "
+                      f"например {symbols[~valid].iloc[0]}")
+        raw, parts, symbols = raw[valid], parts[valid], symbols[valid]
+
+    tokens = parts[spec['expiry']]
+    expiry_dates = tokens.map({token: parse_expiry(token, spec['format']) for token in tokens.unique()})
+    parsed = expiry_dates.notna()
+    if not parsed.all():
+        logging.error(f"{exchange}: не удалось разобрать дату истечения у {(~parsed).sum()} символов, "
+                      f"например {symbols[~parsed].iloc[0]}")
+        raw, parts, symbols, expiry_dates = raw[parsed], parts[parsed], symbols[parsed], expiry_dates[parsed]
+
+    frame = pd.DataFrame({'symbol': symbols.to_numpy(), 'underlying': parts[spec['underlying']].to_numpy()})
+    for column in NUMERIC_COLUMNS:
+        frame[column] = _numeric(raw[column])
+    frame['trades_24h'] = (_numeric(raw['trades_24h']).astype(np.int64) if 'trades_24h' in raw
+                           else np.zeros(len(frame), dtype=np.int64))
+
+    symbol_strike = pd.to_numeric(parts[spec['strike']], errors='coerce').to_numpy(dtype=np.float64)
+    if 'strike_price' in raw:
+        strike = pd.to_numeric(raw['strike_price'], errors='coerce').to_numpy(dtype=np.float64)
+        symbol_strike = np.where(np.isnan(strike), symbol_strike, strike)
+    frame['strike_price'] = symbol_strike
+    frame['exercise_price'] = _numeric(raw['exercise_price']) if 'exercise_price' in raw else symbol_strike
+
+    # Цена базового актива: underlyingPrice у Bybit, оценочная цена исполнения (индекс) у Binance; у OKX её нет
+    if 'underlying_price' in raw:
+        underlying_price = _numeric(raw['underlying_price'])
+    elif exchange == 'Binance':
+        underlying_price = frame['exercise_price'].to_numpy()
+    else:
+        underlying_price = np.zeros(len(frame))
+    frame['underlying_price'] = np.where(underlying_price > 0, underlying_price, np.nan)
+
+    frame['option_type'] = np.where(parts[spec['type']].to_numpy() == 'C', 'Call', 'Put')
+    frame['expiry_date'] = expiry_dates.to_numpy()
+    frame['expiry'] = pd.to_datetime(frame['expiry_date'], format='%Y-%m-%d')
+    frame['price_usdt'] = frame['volume_24h'].to_numpy() * frame['last_price'].to_numpy()
+    return frame
+
+
+def frame_rows(frame, exchange, market_type, timestamp):
+    """
+    Строки для bulk_upsert в порядке opcion_modul.OPCION_DATA_COLUMNS.
+
+    Колонки переводятся в списки через tolist(), поэтому в базу уходят обычные float/int Python,
+    а не numpy-скаляры и не строки. В колонках GREEK_COLUMNS NaN записывается как NULL,
+    а если option_greeks.add_greeks не вызывался, они целиком NULL.
+    """
+    symbols = frame['symbol'].tolist()
+    greeks = [_nullable(frame[column]) if column in frame else repeat(None) for column in GREEK_COLUMNS]
+    return list(zip(
+        symbols, repeat(exchange), repeat(market_type), frame['last_price'].tolist(), frame['volume_24h'].tolist(),
+        symbols, frame['price_usdt'].tolist(), frame['high_price_24h'].tolist(), frame['low_price_24h'].tolist(),
+        frame['trades_24h'].tolist(), frame['strike_price'].tolist(), frame['option_type'].tolist(),
+        frame['expiry_date'].tolist(), frame['exercise_price'].tolist(), repeat(timestamp), repeat(timestamp),
+        *greeks,
+    ))
+
+
+def _nullable(series):
+    return series.astype(object).where(series.notna(), None).tolist()
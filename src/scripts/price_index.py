@@ -0,0 +1,81 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+# Максимальное число переходов при пересчёте валюты в USDT (например, XYZ -> BTC -> USDT = 2)
+MAX_HOPS = 3
+
+
+class PriceIndex:
+    """
+    Индекс цен одного снимка тикеров.
+
+    Хранит последнюю цену по символу и граф валют, где ребро base -> quote
+    имеет вес lastPrice. Курсы всех валют к USDT вычисляются одним обходом
+    в ширину при первом запросе, поэтому каждый следующий запрос выполняется за O(1).
+    """
+
+    def __init__(self, target='USDT', max_hops=MAX_HOPS):
+        self.target = target
+        self.max_hops = max_hops
+        self.prices = {}  # символ -> последняя цена
+        self.edges = {}   # валюта -> {соседняя валюта: сколько соседней валюты стоит 1 единица}
+        self._rates = None  # валюта -> цена 1 единицы в target
+
+    def add(self, symbol, base, quote, last_price):
+        """Добавляет торговую пару base/quote с последней ценой."""
+        self.prices[symbol] = last_price
+        if not base or not quote or not last_price or last_price <= 0:
+            return
+
+        self.edges.setdefault(base, {})[quote] = last_price
+        self.edges.setdefault(quote, {})[base] = 1 / last_price
+        self._rates = None  # граф изменился, курсы нужно пересчитать
+
+    def _resolve(self):
+        # Обход в ширину от target: курс соседа = вес ребра * курс текущей валюты
+        rates = {self.target: 1.0}
+        hops = {self.target: 0}
+        queue = deque([self.target])
+
+        while queue:
+            asset = queue.popleft()
+            if hops[asset] >= self.max_hops:
+                continue
+            for neighbour, neighbour_in_asset in self._neighbours(asset):
+                if neighbour in rates:
+                    continue
+                rates[neighbour] = neighbour_in_asset * rates[asset]
+                hops[neighbour] = hops[asset] + 1
+                queue.append(neighbour)
+
+        logging.debug(f"Индекс цен: курс к {self.target} найден для {len(rates)} валют.")
+        self._rates = rates
+
+    def _neighbours(self, asset):
+        # Для ребра asset -> other вес edges[asset][other] = цена 1 asset в other,
+        # значит 1 other = edges[other][asset] asset
+        for other in self.edges.get(asset, {}):
+            yield other, self.edges[other][asset]
+
+    def rate(self, asset):
+        """Цена 1 единицы валюты в target или None, если валюта недостижима."""
+        if self._rates is None:
+            self._resolve()
+        return self._rates.get(asset)
+
+    def rates(self, assets):
+        """Курсы валют к target массивом NumPy (NaN для недостижимых валют)."""
+        return np.array([self.rate(asset) for asset in assets], dtype=np.float64)
+
+    def volume_usdt(self, bases, quotes, base_volumes, quote_volumes):
+        """
+        Обороты пар в target по колонкам снимка (base_volumes, quote_volumes — массивы NumPy):
+        по курсу котируемой валюты, а если он неизвестен или оборот в ней нулевой — по курсу базовой.
+        Пары, ни одну из валют которых нельзя пересчитать, получают 0.0.
+        """
+        quote_rates = self.rates(quotes)
+        base_rates = self.rates(bases)
+        by_base = np.where(np.isfinite(base_rates), base_volumes * base_rates, 0.0)
+        return np.where(np.isfinite(quote_rates) & (quote_volumes != 0), quote_volumes * quote_rates, by_base)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+
+from instrument_cache import default_cache, load_instruments
+
+# Каталоги, из которых строится реестр: (биржа, тип инструмента) -> (market_type в базе, вид по умолчанию).
+# Вид по умолчанию нужен для записей кэша, сохранённых до появления поля kind
+REGISTRY_SOURCES = {
+    ('Binance', 'spot'): ('spot', 'spot'),
+    ('Binance', 'futures'): ('futures', 'perpetual'),
+    ('Bybit', 'spot'): ('spot', 'spot'),
+    ('Bybit', 'linear'): ('futures', 'perpetual'),
+    ('Bybit', 'inverse'): ('futures', 'perpetual'),
+    ('OKX', 'SPOT'): ('spot', 'spot'),
+    ('OKX', 'SWAP'): ('futures', 'perpetual'),
+    ('OKX', 'FUTURES'): ('futures', 'future'),
+    ('Binance', 'option'): ('options', 'option'),
+    ('Bybit', 'option'): ('options', 'option'),
+    # У OKX в каталоге опционов — базовые активы (BTC-USD), а не отдельные контракты
+    ('OKX', 'OPTION_UNDERLYING'): ('options', 'option'),
+}
+
+DEFAULT_KINDS = {'spot': 'spot', 'futures': 'perpetual', 'options': 'option'}
+
+
+def canonical_symbol(base, quote, kind):
+    """Единое имя инструмента для всех бирж: BTC/USDT для спота, BTC/USDT:perpetual для деривативов."""
+    if base is None or quote is None:
+        return None
+    return f"{base}/{quote}" if kind == 'spot' else f"{base}/{quote}:{kind}"
+
+
+class SymbolRegistry:
+    """
+    Реестр инструментов всех бирж, построенный по каталогам.
+
+    Символ биржи (BTCUSDT, BTC-USDT, BTC-USDT-SWAP) по ключу (биржа, market_type, символ)
+    сопоставляется с (base, quote, kind) одним обращением к словарю; по единому имени canonical_symbol
+    один и тот же инструмент объединяется между биржами.
+    """
+
+    def __init__(self):
+        self._entries = {}    # (биржа, market_type, символ) -> (base, quote, kind)
+        self._settle = {}     # (биржа, market_type, символ) -> валюта расчётов деривативов
+        self._sources = {}    # (биржа, тип инструмента) -> список записей, по которому построены строки
+        self._quote_lengths = {}  # длина -> множество котируемых валют такой длины
+        self._lengths = ()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def register(self, exchange, inst_type, records):
+        """Добавляет (или обновляет) каталог одной биржи; повторная регистрация того же списка ничего не делает."""
+        if self._sources.get((exchange, inst_type)) is records:
+            return
+        market_type, default_kind = REGISTRY_SOURCES[(exchange, inst_type)]
+
+        # Символы из прошлой версии каталога удаляются, чтобы снятые с торгов не оставались в реестре
+        previous = self._sources.get((exchange, inst_type)) or []
+        for record in previous:
+            self._entries.pop((exchange, market_type, record['symbol']), None)
+            self._settle.pop((exchange, market_type, record['symbol']), None)
+
+        for record in records:
+            base, quote = record.get('base'), record.get('quote')
+            if not base or not quote:
+                continue
+            assets = (base, quote, record.get('kind') or default_kind)
+            self._entries[(exchange, market_type, record['symbol'])] = assets
+            if record.get('settle'):
+                self._settle[(exchange, market_type, record['symbol'])] = record['settle']
+            self._quote_lengths.setdefault(len(quote), set()).add(quote)
+
+        self._lengths = sorted(self._quote_lengths, reverse=True)
+        self._sources[(exchange, inst_type)] = records
+        logging.info(f"Реестр символов: {exchange} ({inst_type}) — {len(records)} инструментов.")
+
+    def lookup(self, exchange, market_type, symbol):
+        """(base, quote, kind) символа биржи или None, если символа нет в каталогах."""
+        return self._entries.get((exchange, market_type, symbol))
+
+    def settle(self, exchange, market_type, symbol):
+        """Валюта расчётов контракта или None (у спота и контрактов без неё в каталоге)."""
+        return self._settle.get((exchange, market_type, symbol))
+
+    def symbols(self, exchange, inst_type, quote=None, settle=None):
+        """Символы каталога (биржа, тип инструмента), при необходимости только с данной котируемой/расчётной валютой."""
+        market_type = REGISTRY_SOURCES[(exchange, inst_type)][0]
+        symbols = []
+        for record in self._sources.get((exchange, inst_type)) or []:
+            key = (exchange, market_type, record['symbol'])
+            assets = self._entries.get(key)
+            if assets is None or (quote is not None and assets[1] != quote):
+                continue
+            if settle is not None and self._settle.get(key) != settle:
+                continue
+            symbols.append(record['symbol'])
+        return symbols
+
+    def bases(self, market_type, exchange=None):
+        """Базовые активы, по которым есть инструменты market_type (на одной бирже или на всех)."""
+        return {assets[0] for (venue, venue_market_type, _), assets in self._entries.items()
+                if venue_market_type == market_type and exchange in (None, venue)}
+
+    def split_symbol(self, symbol):
+        """
+        Разбор символа, которого ещё нет в каталоге (например, новый листинг).
+
+        OKX разделяет валюты дефисом; для слитных символов Binance/Bybit котируемая валюта ищется
+        среди известных по каталогам — по одному обращению к множеству на каждую длину, от длинных к коротким.
+        """
+        if '-' in symbol:
+            parts = symbol.split('-')
+            return parts[0], parts[1]
+        for length in self._lengths:
+            if length < len(symbol) and symbol[-length:] in self._quote_lengths[length]:
+                return symbol[:-length], symbol[-length:]
+        return None, None
+
+    def resolve(self, exchange, market_type, symbol):
+        """Как lookup, но для неизвестных символов пробует разобрать сам символ."""
+        assets = self._entries.get((exchange, market_type, symbol))
+        if assets is not None:
+            return assets
+        base, quote = self.split_symbol(symbol)
+        if base is None:
+            return None
+        return base, quote, DEFAULT_KINDS.get(market_type, market_type)
+
+
+
+_default_registry = None
+
+
+def default_registry():
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = SymbolRegistry()
+    return _default_registry
+
+
+async def load_registry(session, sources=None, cache=None, registry=None):
+    """
+    Загружает каталоги через кэш инструментов и регистрирует их в реестре.
+
+    :param sources: список ключей REGISTRY_SOURCES, например [('Bybit', 'linear')]; по умолчанию все.
+    """
+    registry = registry or default_registry()
+    sources = list(sources or REGISTRY_SOURCES)
+    catalogues = await asyncio.gather(
+        *(load_instruments(session, exchange, inst_type, cache) for exchange, inst_type in sources))
+    for (exchange, inst_type), records in zip(sources, catalogues):
+        registry.register(exchange, inst_type, records)
+    return registry
+
+
+def registry_from_cache(cache=None, registry=None):
+    """Реестр только по каталогам, уже сохранённым в кэше (без сетевых запросов) — для приложения."""
+    cache = cache or default_cache()
+    registry = registry or SymbolRegistry()
+    for exchange, inst_type in REGISTRY_SOURCES:
+        entry = cache.get(exchange, inst_type)
+        if entry is not None:
+            registry.register(exchange, inst_type, entry[0])
+    return registry
@@ -1,234 +1,175 @@
-import sqlite3
 import logging
 import requests
-import logging
 from datetime import datetime, timezone
 
+from db_writer import connect, replace_table
+from http_client import get_sync
+from instrument_cache import load_instruments_sync
+from symbol_registry import default_registry
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 
-def create_db():
-    conn = sqlite3.connect('futures_data.db')
-    cursor = conn.cursor()
-
-    # Удаление таблицы, если она существует
-    cursor.execute('DROP TABLE IF EXISTS futures_data')
-    logging.info("Таблица futures_data удалена.")
-
-    # Создание таблицы с обновлённой структурой
-    cursor.execute('''
-        CREATE TABLE futures_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            exchange TEXT NOT NULL,
-            market_type TEXT NOT NULL,
-            last_price REAL,
-            low_price REAL,
-            high_price REAL,
-            volume_24h_contracts REAL,
-            volume_24h_base_currency REAL,
-            turnover_24h_usd REAL,
-            open_interest_contracts REAL,
-            open_interest_base_currency REAL,
-            contract_size REAL,
-            contract_type TEXT,
-            timestamp DATETIME
-        );
-    ''')
-    logging.info("Таблица market_data создана заново.")
+DB_PATH = 'futures_data.db'
+
+# Схема снимка фьючерсов; {table} — futures_data или теневая таблица при замене снимка
+FUTURES_DATA_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL,
+        exchange TEXT NOT NULL,
+        market_type TEXT NOT NULL,
+        last_price REAL,
+        low_price REAL,
+        high_price REAL,
+        volume_24h_contracts REAL,
+        volume_24h_base_currency REAL,
+        turnover_24h_usd REAL,
+        open_interest_contracts REAL,
+        open_interest_base_currency REAL,
+        contract_size REAL,
+        contract_type TEXT,
+        timestamp DATETIME,
+        UNIQUE(symbol, exchange)
+    );
+'''
+FUTURES_DATA_COLUMNS = ('symbol', 'exchange', 'market_type', 'last_price', 'low_price', 'high_price',
+                        'volume_24h_contracts', 'volume_24h_base_currency', 'turnover_24h_usd',
+                        'open_interest_contracts', 'open_interest_base_currency', 'contract_size', 'contract_type',
+                        'timestamp')
 
+
+def create_db():
+    # Таблица больше не пересоздаётся перед сбором: новый снимок подменяет её атомарно в save_to_db
+    conn = connect(DB_PATH)
+    conn.execute(FUTURES_DATA_SCHEMA.format(table='futures_data'))
     conn.commit()
     conn.close()
 
-def save_to_db(data, exchange, market_type):
-    conn = sqlite3.connect('okx_futures.db')
-    cursor = conn.cursor()
 
+def save_to_db(data, exchange, market_type):
+    """Записывает снимок целиком: теневая таблица и переименование в одной транзакции (db_writer.replace_table)."""
     logging.info(f"Сохранение данных для {exchange} ({market_type})")
+    if not data:
+        # Пустой снимок (биржа недоступна) не должен стирать предыдущий
+        logging.warning(f"Нет данных для {exchange} ({market_type}), предыдущий снимок сохранён.")
+        return
+
+    rows = [(item['symbol'], exchange, market_type) + tuple(item.get(column) for column in FUTURES_DATA_COLUMNS[3:])
+            for item in data]
+    conn = connect(DB_PATH)
+    try:
+        replace_table(conn, 'futures_data', FUTURES_DATA_SCHEMA, FUTURES_DATA_COLUMNS, rows)
+    finally:
+        conn.close()
+    logging.info(f"Снимок futures_data обновлён: {len(rows)} контрактов {exchange} ({market_type}).")
 
-    for item in data:
-        try:
-            symbol = item.get('symbol')
-            last_price = float(item.get('last_price') or 0)
-            low_price = float(item.get('low_price') or 0)
-            high_price = float(item.get('high_price') or 0)
-            # (другие поля остаются без изменений)
-
-            cursor.execute("SELECT id FROM market_data WHERE symbol = ?", (symbol,))
-            existing_record = cursor.fetchone()
-
-            if existing_record:
-                # Обновление записи
-                cursor.execute('''
-                    UPDATE market_data
-                    SET last_price = ?, low_price = ?, high_price = ?, volume_24h_contracts = ?, 
-                        volume_24h_base_currency = ?, turnover_24h_usd = ?, open_interest_contracts = ?, 
-                        open_interest_base_currency = ?, contract_size = ?, contract_type = ?, timestamp = ?
-                    WHERE symbol = ?
-                ''', (last_price, low_price, high_price, ...))
-            else:
-                # Вставка новой записи
-                cursor.execute('''
-                    INSERT INTO market_data (symbol, exchange, market_type, last_price, low_price, high_price, ...)
-                    VALUES (?, ?, ?, ?, ?, ?, ...)
-                ''', (symbol, exchange, market_type, last_price, low_price, high_price, ...))
-
-        except Exception as e:
-            logging.error(f"Ошибка при обработке данных для {symbol}: {e}", exc_info=True)
 
-    conn.commit()
-    conn.close()
+# Массовые эндпоинты OKX: тикеры и открытый интерес всех контрактов типа одним запросом
+OKX_TICKERS_URL = "https://www.okx.com/api/v5/market/tickers"
+OKX_OPEN_INTEREST_URL = "https://www.okx.com/api/v5/public/open-interest"
+OKX_FUTURES_CATEGORIES = ('SWAP', 'FUTURES')
 
 
-def fetch_contract_data(inst_id):
-    url = f"https://www.okx.com/api/v5/market/ticker?instId={inst_id}"
+def fetch_bulk(url, inst_type):
+    """Все записи эндпоинта для типа инструментов (instType) одним запросом: {instId: запись}."""
     try:
-        response = requests.get(url)
+        response = get_sync(url, params={'instType': inst_type})
         response.raise_for_status()
-        data = response.json().get('data', [])
-        if not data:
-            logging.error(f"Данные для контракта {inst_id} не получены.")
-        return data
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Ошибка при запросе данных для контракта {inst_id}: {e}")
-        return []
+        payload = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Ошибка при запросе {url} ({inst_type}): {e}")
+        return {}
 
+    if payload.get('code') != '0':
+        logging.error(f"Ошибка API OKX ({url}, {inst_type}): {payload.get('msg')}")
+        return {}
+    return {item['instId']: item for item in payload.get('data', []) if item.get('instId')}
 
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
 
 
-def process_contract_data(contract_data):
-    """
-    Получает и логирует данные по всем SWAP контрактам.
+def process_contract_data(registry, instruments, tickers, open_interest, timestamp):
     """
-    url_instruments = "https://www.okx.com/api/v5/public/instruments?instType=SWAP"
+    Объединяет каталог инструментов, тикеры и открытый интерес по instId.
 
-    try:
-        # Получаем список всех SWAP инструментов
-        response_instruments = requests.get(url_instruments)
-        response_instruments.raise_for_status()
-        data_instruments = response_instruments.json()
-
-        if not data_instruments.get('data'):
-            logging.error("Не удалось получить список SWAP инструментов.")
-            return
-
-        instruments = data_instruments['data']
-        processed_data = []
-
-        # Собираем данные для каждого инструмента
-        for instrument in instruments:
-            inst_id = instrument['instId']
-            contract_size = float(instrument.get('ctVal', 0))
-            ctValCcy = instrument.get('ctValCcy', '')
-
-            if contract_size == 0:
-                logging.warning(f"Размер контракта для {inst_id} равен нулю, пропускаем.")
-                continue
-
-            # Получаем данные по тикеру
-            url_ticker = f"https://www.okx.com/api/v5/market/ticker?instId={inst_id}"
-            try:
-                response_ticker = requests.get(url_ticker)
-                response_ticker.raise_for_status()
-                data_ticker = response_ticker.json()
-
-                if not data_ticker.get('data'):
-                    logging.error(f"Данные для контракта {inst_id} не получены.")
-                    continue
-
-                # Извлекаем необходимые значения из тикера
-                item = data_ticker['data'][0]
-                last_price = float(item.get('last', 0))
-                low_price = float(item.get('low24h', 0))  # Низкая цена за 24 часа
-                high_price = float(item.get('high24h', 0))  # Высокая цена за 24 часа
-                volume_24h_contracts = float(item.get('vol24h', 0))
-                volCcy24h = float(item.get('volCcy24h', 0))
-
-                # Объём за 24 часа в базовой валюте
-                volume_24h_base_currency = volume_24h_contracts * contract_size
-
-                # Оборот за 24 часа в USD
-                volume_24h_usd = volume_24h_base_currency * last_price
-
-                # Получаем открытый интерес
-                url_open_interest = f"https://www.okx.com/api/v5/public/open-interest?instId={inst_id}"
-                try:
-                    response_oi = requests.get(url_open_interest)
-                    response_oi.raise_for_status()
-                    data_oi = response_oi.json()
-
-                    if not data_oi.get('data'):
-                        logging.error(f"Данные об открытом интересе для {inst_id} не получены.")
-                        continue
-
-                    open_interest_contracts = float(data_oi['data'][0]['oi'])
-                    open_interest_base_currency = open_interest_contracts * contract_size
-
-                    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-                    logging.info(
-                        f"{inst_id}: Последняя цена: {last_price}, Низкая цена за 24ч: {low_price}, "
-                        f"Высокая цена за 24ч: {high_price}, Объём за 24ч в контрактах: {volume_24h_contracts}, "
-                        f"Объём за 24ч в {ctValCcy}: {volume_24h_base_currency}, Оборот за 24ч в USD: {volume_24h_usd}, "
-                        f"Открытый интерес: {open_interest_contracts} контрактов "
-                        f"({open_interest_base_currency} {ctValCcy}), Размер контракта: {contract_size} {ctValCcy}, "
-                        f"Время: {timestamp}"
-                    )
-
-                    # Добавляем данные в список для сохранения в БД
-                    processed_data.append({
-                        'symbol': inst_id,
-                        'last_price': last_price,
-                        'low_price': low_price,
-                        'high_price': high_price,
-                        'volume_24h_contracts': volume_24h_contracts,
-                        'volume_24h_base_currency': volume_24h_base_currency,
-                        'turnover_24h_usd': volume_24h_usd,
-                        'open_interest_contracts': open_interest_contracts,
-                        'open_interest_base_currency': open_interest_base_currency,
-                        'contract_size': contract_size,
-                        'contract_type': ctValCcy,
-                        'timestamp': timestamp
-                    })
-
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"Ошибка при запросе открытого интереса для {inst_id}: {e}")
-                    continue
-
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Ошибка при запросе данных для контракта {inst_id}: {e}")
-                continue
-
-        return processed_data
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Ошибка при выполнении запросов: {e}")
-        return []
+    Контракты без тикера или с нулевым размером пропускаются; без данных об открытом интересе
+    записываются с нулевым открытым интересом. Базовая валюта контракта берётся из реестра символов:
+    размер инверсных контрактов задан не в ней, а в USD, и переводится в базовую валюту по цене.
+    """
+    processed_data = []
+    skipped = 0
+
+    for instrument in instruments:
+        inst_id = instrument['symbol']
+        contract_size = _to_float(instrument.get('contract_size'))
+        ctValCcy = instrument.get('contract_ccy') or ''
+        item = tickers.get(inst_id)
+
+        if contract_size == 0 or item is None:
+            skipped += 1
+            continue
+
+        last_price = _to_float(item.get('last'))
+        assets = registry.lookup('OKX', 'futures', inst_id)
+        # Размер контракта в базовой валюте
+        base_size = contract_size
+        if assets is not None and ctValCcy and ctValCcy != assets[0]:
+            base_size = contract_size / last_price if last_price else 0.0
+        volume_24h_contracts = _to_float(item.get('vol24h'))
+        # Объём за 24 часа в базовой валюте и оборот в USD
+        volume_24h_base_currency = volume_24h_contracts * base_size
+        open_interest_contracts = _to_float(open_interest.get(inst_id, {}).get('oi'))
+
+        processed_data.append({
+            'symbol': inst_id,
+            'last_price': last_price,
+            'low_price': _to_float(item.get('low24h')),
+            'high_price': _to_float(item.get('high24h')),
+            'volume_24h_contracts': volume_24h_contracts,
+            'volume_24h_base_currency': volume_24h_base_currency,
+            'turnover_24h_usd': volume_24h_base_currency * last_price,
+            'open_interest_contracts': open_interest_contracts,
+            'open_interest_base_currency': open_interest_contracts * base_size,
+            'contract_size': contract_size,
+            'contract_type': ctValCcy,
+            'timestamp': timestamp
+        })
+
+    if skipped:
+        logging.warning(f"Пропущено {skipped} контрактов без тикера или с нулевым размером контракта.")
+    return processed_data
 
 
 def get_okx_futures_data():
-    categories = ['SWAP', 'FUTURES']
+    """
+    Снимок всех SWAP и FUTURES контрактов OKX: на каждый тип — каталог инструментов (из общего кэша,
+    регистрируется в реестре символов), один запрос тикеров и один запрос открытого интереса, объединённые в памяти.
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    registry = default_registry()
     data = []
 
-    for category in categories:
-        url = f"https://www.okx.com/api/v5/public/instruments?instType={category}"
+    for category in OKX_FUTURES_CATEGORIES:
         logging.info(f"Запрос данных с OKX (фьючерсы) ({category})...")
-
-        response = requests.get(url)
-        response.raise_for_status()
-        result = response.json().get('data', [])
-
-        for item in result:
-            symbol = item.get('instId')
-
-            contract_data = fetch_contract_data(symbol)
-            if contract_data:
-                processed_contract_data = process_contract_data(contract_data, )
-                if processed_contract_data:  # Проверяем, что данные не пустые
-                    data.extend(processed_contract_data)
+        instruments = load_instruments_sync(None, 'OKX', category)
+        if not instruments:
+            logging.error(f"Не удалось получить список {category} инструментов.")
+            continue
+        registry.register('OKX', category, instruments)
+
+        tickers = fetch_bulk(OKX_TICKERS_URL, category)
+        open_interest = fetch_bulk(OKX_OPEN_INTEREST_URL, category)
+        processed = process_contract_data(registry, instruments, tickers, open_interest, timestamp)
+        logging.info(f"OKX ({category}): {len(processed)} контрактов из {len(instruments)} инструментов, "
+                     f"тикеров {len(tickers)}, открытый интерес по {len(open_interest)}.")
+        data.extend(processed)
 
     logging.info(f"Всего получено {len(data)} обработанных контрактов с OKX (фьючерсы).")
     return data
@@ -237,6 +178,5 @@ def get_okx_futures_data():
 if __name__ == "__main__":
     create_db()
 
-
     futures_data = get_okx_futures_data()
     save_to_db(futures_data, exchange='OKX', market_type='futures')
@@ -0,0 +1,181 @@
+import re
+import codecs
+from array import array
+
+import numpy as np
+
+# Соответствие полей JSON тикера колонкам для каждой биржи
+BINANCE_TICKER_FIELDS = {
+    'lastPrice': 'last', 'highPrice': 'high', 'lowPrice': 'low',
+    'volume': 'volume', 'quoteVolume': 'quote_volume', 'count': 'count',
+}
+BYBIT_TICKER_FIELDS = {
+    'lastPrice': 'last', 'highPrice24h': 'high', 'lowPrice24h': 'low',
+    'volume24h': 'volume', 'turnover24h': 'quote_volume',
+}
+OKX_TICKER_FIELDS = {
+    'last': 'last', 'high24h': 'high', 'low24h': 'low',
+    'vol24h': 'volume', 'volCcy24h': 'quote_volume',
+}
+
+# Числовые колонки снимка (price_usdt заполняется при обработке)
+TICKER_COLUMNS = ('last', 'high', 'low', 'volume', 'quote_volume', 'count', 'price_usdt')
+
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+# Плоский JSON-объект: тикеры всех бирж не содержат вложенных объектов
+_OBJECT_RE = re.compile(r'\{((?:[^{}"]|"(?:[^"\\]|\\.)*")*)\}')
+_PAIR_RE = re.compile(r'"([^"\\]*)"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)')
+# Запас на случай, если ключ массива разрезан границей блока
+_KEY_TAIL = 64
+
+
+class TickerColumns:
+    """
+    Колоночное представление снимка тикеров.
+
+    Инструмент адресуется индексом символа; числовые значения хранятся
+    в типизированных массивах, базовая и котируемая валюты — в списках той же длины.
+    """
+
+    def __init__(self):
+        self.symbols = []
+        self.index = {}  # символ -> индекс строки
+        self.base = []
+        self.quote = []
+        self._columns = {name: array('d') for name in TICKER_COLUMNS}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add_symbol(self, symbol):
+        row = len(self.symbols)
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        self.base.append(None)
+        self.quote.append(None)
+        for values in self._columns.values():
+            values.append(0.0)
+        return row
+
+    def column(self, name):
+        """Типизированный массив колонки (array('d'))."""
+        return self._columns[name]
+
+    def numpy(self, name):
+        """Колонка как массив NumPy без копирования; таблицу нельзя расширять, пока он используется."""
+        return np.frombuffer(self._columns[name], dtype=np.float64)
+
+    def subset(self, rows):
+        """Новый снимок из указанных строк (например, только изменившихся инструментов)."""
+        part = TickerColumns()
+        for row in rows:
+            new_row = part.add_symbol(self.symbols[row])
+            part.base[new_row] = self.base[row]
+            part.quote[new_row] = self.quote[row]
+        for name, values in self._columns.items():
+            part._columns[name] = array('d', (values[row] for row in rows))
+        return part
+
+    def extend(self, other):
+        """Добавляет строки другого снимка (например, категории inverse к linear)."""
+        offset = len(self.symbols)
+        for row, symbol in enumerate(other.symbols):
+            self.index[symbol] = offset + row
+        self.symbols.extend(other.symbols)
+        self.base.extend(other.base)
+        self.quote.extend(other.quote)
+        for name, values in self._columns.items():
+            values.extend(other._columns[name])
+
+
+def _to_float(raw):
+    if raw[0] == '"':
+        raw = raw[1:-1]
+    try:
+        return float(raw) if raw else 0.0
+    except ValueError:
+        return 0.0
+
+
+class TickerStreamDecoder:
+    """
+    Потоковый разбор массива тикеров из JSON-ответа по частям.
+
+    Объекты массива разбираются по мере поступления байтов и сразу пишутся
+    в TickerColumns; словарь на каждый инструмент не создаётся.
+    """
+
+    def __init__(self, columns, symbol_key, fields, array_key=None):
+        self.columns = columns
+        self._symbol_key = symbol_key
+        self._fields = fields
+        if array_key is None:
+            self._array_start = re.compile(r'\[')
+        else:
+            self._array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._in_array = False
+        self.done = False
+
+    def feed(self, chunk, final=False):
+        if self.done:
+            return
+        self._buffer += self._text_decoder.decode(chunk, final)
+        pos = self._scan()
+        self._buffer = self._buffer[pos:]
+
+    def close(self):
+        self.feed(b'', final=True)
+        if not self.done:
+            raise ValueError("Массив тикеров не найден в ответе или ответ оборван.")
+
+    def _scan(self):
+        buffer = self._buffer
+        pos = 0
+
+        if not self._in_array:
+            match = self._array_start.search(buffer)
+            if not match:
+                return max(0, len(buffer) - _KEY_TAIL)
+            self._in_array = True
+            pos = match.end()
+
+        while True:
+            pos = _SEPARATOR_RE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                return pos
+            if buffer[pos] == ']':
+                self.done = True
+                return len(buffer)
+            if buffer[pos] != '{':
+                raise ValueError(f"Неожиданный символ в массиве тикеров: {buffer[pos]!r}")
+
+            match = _OBJECT_RE.match(buffer, pos)
+            if not match:
+                return pos  # объект ещё не пришёл целиком
+            self._append(match.group(1))
+            pos = match.end()
+
+    def _append(self, body):
+        pairs = _PAIR_RE.findall(body)
+        symbol = next((raw.strip('"') for key, raw in pairs if key == self._symbol_key), None)
+        if symbol is None:
+            return
+
+        columns = self.columns
+        row = columns.add_symbol(symbol)
+        for key, raw in pairs:
+            name = self._fields.get(key)
+            if name is not None:
+                columns.column(name)[row] = _to_float(raw)
+
+
+async def read_tickers(response, symbol_key, fields, array_key=None, chunk_size=64 * 1024):
+    """Читает тикеры из ответа aiohttp по частям прямо в колонки."""
+    columns = TickerColumns()
+    decoder = TickerStreamDecoder(columns, symbol_key, fields, array_key)
+    async for chunk in response.content.iter_chunked(chunk_size):
+        decoder.feed(chunk)
+    decoder.close()
+    return columns
@@ -0,0 +1,177 @@
+import json
+import asyncio
+import logging
+
+import aiohttp
+
+from http_client import resolve_url
+from ticker_stream import BYBIT_TICKER_FIELDS, OKX_TICKER_FIELDS
+
+# Как часто накопленные обновления потоков записываются в базу (мс)
+STREAM_FLUSH_MS = 500
+# Интервал прикладного ping для Bybit и OKX (сек): без него биржи закрывают соединение
+PING_INTERVAL = 20
+# Сообщение !ticker@arr со всеми символами Binance весит несколько мегабайт
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+# Поля потокового тикера Binance (<symbol>@ticker / !ticker@arr)
+BINANCE_WS_TICKER_FIELDS = {
+    'c': 'last', 'h': 'high', 'l': 'low',
+    'v': 'volume', 'q': 'quote_volume', 'n': 'count',
+}
+
+
+def _ticker_values(ticker, fields):
+    # В дельтах Bybit приходят только изменившиеся поля, отсутствующие колонки не трогаем
+    values = {}
+    for key, name in fields.items():
+        raw = ticker.get(key)
+        if raw in (None, ''):
+            continue
+        try:
+            values[name] = float(raw)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def _load(message):
+    try:
+        return json.loads(message)
+    except ValueError:
+        return None  # например, текстовый 'pong' от OKX
+
+
+# Разбор сообщений потоков: возвращают список (символ, {колонка: значение})
+def parse_binance_message(message):
+    payload = _load(message)
+    if not isinstance(payload, list):
+        return []
+    return [(t['s'], _ticker_values(t, BINANCE_WS_TICKER_FIELDS)) for t in payload if 's' in t]
+
+
+def parse_bybit_message(message):
+    payload = _load(message)
+    if not isinstance(payload, dict) or not str(payload.get('topic', '')).startswith('tickers.'):
+        return []
+    ticker = payload.get('data') or {}
+    if 'symbol' not in ticker:
+        return []
+    return [(ticker['symbol'], _ticker_values(ticker, BYBIT_TICKER_FIELDS))]
+
+
+def parse_okx_message(message):
+    payload = _load(message)
+    if not isinstance(payload, dict) or payload.get('arg', {}).get('channel') != 'tickers':
+        return []
+    return [(t['instId'], _ticker_values(t, OKX_TICKER_FIELDS)) for t in payload.get('data', []) if 'instId' in t]
+
+
+# Подписки: список сообщений, которые нужно отправить после подключения
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def subscribe_bybit(symbols):
+    # Спотовый поток Bybit принимает не больше 10 топиков в одном запросе подписки
+    return [{'op': 'subscribe', 'args': [f"tickers.{symbol}" for symbol in chunk]} for chunk in _chunks(symbols, 10)]
+
+
+def subscribe_okx(symbols):
+    return [{'op': 'subscribe', 'args': [{'channel': 'tickers', 'instId': symbol} for symbol in chunk]}
+            for chunk in _chunks(symbols, 100)]
+
+
+# Источники потоков: (биржа, поток) -> URL, подписка, разбор, ping и колонки оборота для пересчёта в USDT
+STREAM_SOURCES = {
+    ('Binance', 'spot'): {
+        'url': "wss://stream.binance.com:9443/ws/!ticker@arr",
+        'subscribe': None, 'parse': parse_binance_message, 'ping': None,
+    },
+    ('Binance', 'futures'): {
+        'url': "wss://fstream.binance.com/ws/!ticker@arr",
+        'subscribe': None, 'parse': parse_binance_message, 'ping': None,
+    },
+    ('Bybit', 'spot'): {
+        'url': "wss://stream.bybit.com/v5/public/spot",
+        'subscribe': subscribe_bybit, 'parse': parse_bybit_message, 'ping': '{"op":"ping"}',
+    },
+    ('Bybit', 'linear'): {
+        'url': "wss://stream.bybit.com/v5/public/linear",
+        'subscribe': subscribe_bybit, 'parse': parse_bybit_message, 'ping': '{"op":"ping"}',
+    },
+    ('Bybit', 'inverse'): {
+        'url': "wss://stream.bybit.com/v5/public/inverse",
+        'subscribe': subscribe_bybit, 'parse': parse_bybit_message, 'ping': '{"op":"ping"}',
+        # Для коин-маржинальных контрактов оборот (turnover24h) указан в базовой валюте
+        'valuation': ('quote_volume', None),
+    },
+    ('OKX', 'spot'): {
+        'url': "wss://ws.okx.com:8443/ws/v5/public",
+        'subscribe': subscribe_okx, 'parse': parse_okx_message, 'ping': 'ping',
+    },
+}
+
+
+class StreamState:
+    """
+    Снимок тикеров одного потока, который поддерживается обновлениями WebSocket.
+
+    Обновления записываются прямо в колонки начального снимка (TickerColumns), а номера
+    изменившихся строк собираются в множество: сколько бы обновлений ни пришло по символу
+    между сбросами, в базу уйдёт одна строка с последними значениями.
+    """
+
+    def __init__(self, tickers, valuation=('volume', 'quote_volume')):
+        self.tickers = tickers
+        self.base_volume, self.quote_volume = valuation
+        self._dirty = set()
+        self.updates = 0
+        self.unknown = 0
+
+    def apply(self, symbol, values):
+        row = self.tickers.index.get(symbol)
+        if row is None:
+            # Новые инструменты появятся после переподключения со свежим снимком
+            self.unknown += 1
+            return
+        for name, value in values.items():
+            self.tickers.column(name)[row] = value
+        self._dirty.add(row)
+        self.updates += 1
+
+    def has_changes(self):
+        return bool(self._dirty)
+
+    def take_changed(self):
+        """Номера строк, изменившихся с прошлого сброса."""
+        rows, self._dirty = sorted(self._dirty), set()
+        return rows
+
+
+async def _send_pings(ws, message):
+    while True:
+        await asyncio.sleep(PING_INTERVAL)
+        await ws.send_str(message)
+
+
+async def run_stream(session, source, state):
+    """Подключается к потоку, подписывается на символы снимка и применяет обновления до закрытия соединения."""
+    async with session.ws_connect(resolve_url(source['url']), max_msg_size=MAX_MESSAGE_SIZE) as ws:
+        if source['subscribe'] is not None:
+            for message in source['subscribe'](state.tickers.symbols):
+                await ws.send_str(json.dumps(message))
+
+        pinger = asyncio.create_task(_send_pings(ws, source['ping'])) if source['ping'] else None
+        try:
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    for symbol, values in source['parse'](message.data):
+                        state.apply(symbol, values)
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    raise ws.exception()
+        finally:
+            if pinger is not None:
+                pinger.cancel()
+
+    logging.warning(f"Поток {source['url']} закрыт сервером (код {ws.close_code}).")
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class TradeAggregator:
+    """
+    Потоковая агрегация сделок одного символа: количество, объём, VWAP и разбивка покупок/продаж.
+
+    Страницы истории сделок (новые сделки первыми, как у OKX history-trades) сворачиваются
+    в счётчики по мере поступления, сами сделки не хранятся, поэтому память не зависит
+    от числа сделок в окне. Повторно пришедшие сделки отсекаются по tradeId: при листании
+    назад он строго убывает, достаточно помнить самый старый уже учтённый.
+    """
+
+    __slots__ = ('count', 'volume', 'notional', 'buy_count', 'buy_volume', 'sell_count', 'sell_volume',
+                 'first_ts', 'last_ts', 'oldest_trade_id', 'newest_trade_id', 'floor_trade_id')
+
+    def __init__(self):
+        self.count = 0
+        self.volume = 0.0
+        self.notional = 0.0         # сумма px * sz для VWAP
+        self.buy_count = 0
+        self.buy_volume = 0.0
+        self.sell_count = 0
+        self.sell_volume = 0.0
+        self.first_ts = None        # время самой старой учтённой сделки, мс
+        self.last_ts = None         # время самой новой учтённой сделки, мс
+        self.oldest_trade_id = None
+        self.newest_trade_id = None
+        self.floor_trade_id = None  # сделки с tradeId <= floor уже учтены раньше (контрольная точка)
+
+    @property
+    def vwap(self):
+        return self.notional / self.volume if self.volume else 0.0
+
+    def add(self, trade_id, ts, price, size, side):
+        self.count += 1
+        self.volume += size
+        self.notional += price * size
+        if side == 'buy':
+            self.buy_count += 1
+            self.buy_volume += size
+        else:
+            self.sell_count += 1
+            self.sell_volume += size
+
+        if self.first_ts is None or ts < self.first_ts:
+            self.first_ts = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+        if self.oldest_trade_id is None or trade_id < self.oldest_trade_id:
+            self.oldest_trade_id = trade_id
+        if self.newest_trade_id is None or trade_id > self.newest_trade_id:
+            self.newest_trade_id = trade_id
+
+    def add_arrays(self, trade_id, ts, px, sz, is_buy, start_time, end_time):
+        """
+        То же, что add_page, для колонок NumPy из кэша сделок (trade_cache), одной векторной операцией.
+
+        :return: True, если среди сделок есть сделка старше start_time или не новее floor_trade_id.
+        """
+        reached = bool(len(ts)) and bool((ts < start_time).any())
+        mask = (ts >= start_time) & (ts <= end_time)
+        if self.oldest_trade_id is not None:
+            mask &= trade_id < self.oldest_trade_id
+        if self.floor_trade_id is not None:
+            reached = reached or bool((trade_id <= self.floor_trade_id).any())
+            mask &= trade_id > self.floor_trade_id
+        if not mask.any():
+            return reached
+
+        self._add_columns(trade_id[mask], ts[mask], px[mask], sz[mask], is_buy[mask].astype(bool))
+        return reached
+
+    def _add_columns(self, trade_id, ts, px, sz, is_buy):
+        self.count += len(ts)
+        self.volume += float(sz.sum())
+        self.notional += float((px * sz).sum())
+        self.buy_count += int(is_buy.sum())
+        self.buy_volume += float(sz[is_buy].sum())
+        self.sell_count += int((~is_buy).sum())
+        self.sell_volume += float(sz[~is_buy].sum())
+
+        for name, value, pick in (('first_ts', int(ts.min()), min), ('last_ts', int(ts.max()), max),
+                                  ('oldest_trade_id', int(trade_id.min()), min),
+                                  ('newest_trade_id', int(trade_id.max()), max)):
+            current = getattr(self, name)
+            setattr(self, name, value if current is None else pick(current, value))
+
+    def add_page(self, trades, start_time, end_time):
+        """
+        Сворачивает страницу сделок (новые первыми) с временем в [start_time, end_time].
+
+        :return: True, если страница дошла до границы окна (сделка старше start_time или
+                 уже учтённая до контрольной точки floor_trade_id) — листать дальше не нужно.
+        """
+        for trade in trades:
+            ts = int(trade['ts'])
+            trade_id = int(trade['tradeId'])
+            if ts < start_time or (self.floor_trade_id is not None and trade_id <= self.floor_trade_id):
+                return True
+            if ts > end_time or (self.oldest_trade_id is not None and trade_id >= self.oldest_trade_id):
+                continue
+            self.add(trade_id, ts, float(trade['px']), float(trade['sz']), trade.get('side'))
+        return False
+
+
+# Ширина корзины скользящих агрегатов, мс
+BUCKET_MS = 60 * 1000
+
+
+class MinuteBuckets(TradeAggregator):
+    """
+    TradeAggregator, который дополнительно раскладывает сделки по минутным корзинам.
+
+    Корзины (minute -> [count, volume, notional, buy_volume, sell_volume]) складываются
+    в trade_checkpoints и дают скользящие агрегаты за 1 и 24 часа; их не больше
+    1440 на символ за сутки, независимо от числа сделок.
+    """
+
+    __slots__ = ('minutes',)
+
+    def __init__(self):
+        super().__init__()
+        self.minutes = {}
+
+    def _bucket(self, minute):
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = [0, 0.0, 0.0, 0.0, 0.0]
+        return bucket
+
+    def add(self, trade_id, ts, price, size, side):
+        super().add(trade_id, ts, price, size, side)
+        bucket = self._bucket(ts // BUCKET_MS)
+        bucket[0] += 1
+        bucket[1] += size
+        bucket[2] += price * size
+        bucket[3 if side == 'buy' else 4] += size
+
+    def _add_columns(self, trade_id, ts, px, sz, is_buy):
+        super()._add_columns(trade_id, ts, px, sz, is_buy)
+        minutes, index = np.unique(ts // BUCKET_MS, return_inverse=True)
+        sums = (np.bincount(index, minlength=len(minutes)),
+                np.bincount(index, weights=sz, minlength=len(minutes)),
+                np.bincount(index, weights=px * sz, minlength=len(minutes)),
+                np.bincount(index, weights=np.where(is_buy, sz, 0.0), minlength=len(minutes)),
+                np.bincount(index, weights=np.where(is_buy, 0.0, sz), minlength=len(minutes)))
+        for position, minute in enumerate(minutes.tolist()):
+            bucket = self._bucket(minute)
+            for column, values in enumerate(sums):
+                bucket[column] += values[position].item()
@@ -0,0 +1,186 @@
+import zlib
+import logging
+import threading
+
+import numpy as np
+
+from db_writer import connect
+
+CACHE_DB = 'trade_cache.db'
+# Сделки старше этого срока удаляются из кэша (prune)
+DEFAULT_RETENTION_MS = 48 * 60 * 60 * 1000
+
+# Колонки блока сделок и их типы; tradeId и ts хранятся разностями (мелкие числа хорошо сжимаются)
+CHUNK_COLUMNS = (('trade_id', np.int64), ('ts', np.int64), ('px', np.float64), ('sz', np.float64),
+                 ('is_buy', np.int8))
+
+
+def encode_trades(trades):
+    """Сделки в ответе OKX (новые первыми) -> сжатый колоночный блок."""
+    trade_id = np.array([int(trade['tradeId']) for trade in trades], dtype=np.int64)
+    ts = np.array([int(trade['ts']) for trade in trades], dtype=np.int64)
+    px = np.array([float(trade['px']) for trade in trades], dtype=np.float64)
+    sz = np.array([float(trade['sz']) for trade in trades], dtype=np.float64)
+    is_buy = np.array([trade.get('side') == 'buy' for trade in trades], dtype=np.int8)
+    columns = (np.diff(trade_id, prepend=0), np.diff(ts, prepend=0), px, sz, is_buy)
+    return zlib.compress(b''.join(column.tobytes() for column in columns))
+
+
+def decode_trades(blob, count):
+    """Сжатый блок -> словарь колонок NumPy (в том же порядке сделок, новые первыми)."""
+    raw = zlib.decompress(blob)
+    columns, offset = {}, 0
+    for name, dtype in CHUNK_COLUMNS:
+        size = count * np.dtype(dtype).itemsize
+        columns[name] = np.frombuffer(raw, dtype=dtype, count=count, offset=offset)
+        offset += size
+    columns['trade_id'] = np.cumsum(columns['trade_id'])
+    columns['ts'] = np.cumsum(columns['ts'])
+    return columns
+
+
+class TradeCache:
+    """
+    Дисковый кэш сделок по символу, адресуемый диапазонами tradeId/времени.
+
+    Сделки хранятся блоками (обычно одна страница API) в сжатом колоночном виде. Таблица
+    trade_ranges описывает непрерывные диапазоны [lo_id, hi_id]: внутри диапазона в кэше есть
+    все сделки символа, поэтому любое окно времени, попадающее в диапазон, читается из кэша,
+    а из API догружаются только недостающие участки (обычно новый хвост).
+
+    Методы синхронные и защищены блокировкой: асинхронные сборщики вызывают их через
+    asyncio.to_thread, чтобы сжатие и запись на диск не останавливали цикл событий.
+    """
+
+    def __init__(self, db_path=CACHE_DB, retention_ms=DEFAULT_RETENTION_MS):
+        self.db_path = db_path
+        self.retention_ms = retention_ms
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, check_same_thread=False)
+            self._create_tables()
+        return self._conn
+
+    def _create_tables(self):
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS trade_chunks (
+                    symbol TEXT NOT NULL,
+                    first_id INTEGER NOT NULL,    -- самый старый tradeId блока
+                    last_id INTEGER NOT NULL,     -- самый новый tradeId блока
+                    first_ts INTEGER NOT NULL,
+                    last_ts INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    data BLOB NOT NULL,           -- zlib(колонки tradeId, ts, px, sz, is_buy)
+                    PRIMARY KEY (symbol, last_id)
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS trade_ranges (
+                    symbol TEXT NOT NULL,
+                    lo_id INTEGER NOT NULL,
+                    hi_id INTEGER NOT NULL,
+                    lo_ts INTEGER NOT NULL,
+                    hi_ts INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, hi_id)
+                )
+            ''')
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def ranges(self, symbol):
+        """Непрерывные диапазоны символа [lo_id, hi_id, lo_ts, hi_ts], от новых к старым."""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT lo_id, hi_id, lo_ts, hi_ts FROM trade_ranges WHERE symbol = ? ORDER BY hi_id DESC',
+                (symbol,)).fetchall()
+        return [list(row) for row in rows]
+
+    def store(self, symbol, trades, covered=None, absorbed=()):
+        """
+        Сохраняет блок сделок (одна страница API, новые первыми); если передан covered,
+        той же транзакцией записывает и диапазон (см. save_range).
+        """
+        if not trades:
+            if covered is not None:
+                self.save_range(symbol, covered, absorbed)
+            return
+        blob = encode_trades(trades)
+        ids = [int(trade['tradeId']) for trade in trades]
+        times = [int(trade['ts']) for trade in trades]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO trade_chunks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (symbol, min(ids), max(ids), min(times), max(times), len(trades), blob))
+                if covered is not None:
+                    self._write_range(conn, symbol, covered, absorbed)
+
+    def save_range(self, symbol, covered, absorbed):
+        """Записывает диапазон covered, поглотивший диапазоны absorbed (они удаляются)."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._write_range(conn, symbol, covered, absorbed)
+
+    @staticmethod
+    def _write_range(conn, symbol, covered, absorbed):
+        conn.executemany('DELETE FROM trade_ranges WHERE symbol = ? AND hi_id = ?',
+                         [(symbol, item[1]) for item in absorbed])
+        conn.execute('INSERT OR REPLACE INTO trade_ranges VALUES (?, ?, ?, ?, ?)', (symbol, *covered))
+
+    def read(self, symbol, lo_id, hi_id, start_time=None):
+        """
+        Колонки сделок символа с tradeId в [lo_id, hi_id] (от новых к старым).
+
+        Если задан start_time, блоки целиком старше него не читаются.
+        """
+        query = 'SELECT data, count FROM trade_chunks WHERE symbol = ? AND last_id >= ? AND first_id <= ?'
+        params = [symbol, lo_id, hi_id]
+        if start_time is not None:
+            query += ' AND last_ts >= ?'
+            params.append(start_time)
+        with self._lock:
+            rows = self._connect().execute(query + ' ORDER BY last_id DESC', params).fetchall()
+
+        chunks = [decode_trades(blob, count) for blob, count in rows]
+        if not chunks:
+            return {name: np.array([], dtype=dtype) for name, dtype in CHUNK_COLUMNS}
+        columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name, _ in CHUNK_COLUMNS}
+        mask = (columns['trade_id'] >= lo_id) & (columns['trade_id'] <= hi_id)
+        return {name: values[mask] for name, values in columns.items()}
+
+    def prune(self, now_ms):
+        """Удаляет блоки старше срока хранения и подрезает диапазоны."""
+        cutoff = now_ms - self.retention_ms
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                removed = conn.execute('DELETE FROM trade_chunks WHERE last_ts < ?', (cutoff,)).rowcount
+                conn.execute('DELETE FROM trade_ranges WHERE hi_ts < ?', (cutoff,))
+                conn.execute('''
+                    DELETE FROM trade_ranges WHERE NOT EXISTS (
+                        SELECT 1 FROM trade_chunks c
+                        WHERE c.symbol = trade_ranges.symbol AND c.last_id BETWEEN trade_ranges.lo_id AND trade_ranges.hi_id)
+                ''')
+                # Нижняя граница диапазона сдвигается к самому старому оставшемуся блоку
+                conn.execute('''
+                    UPDATE trade_ranges SET
+                        lo_id = (SELECT MIN(first_id) FROM trade_chunks c
+                                 WHERE c.symbol = trade_ranges.symbol
+                                 AND c.last_id BETWEEN trade_ranges.lo_id AND trade_ranges.hi_id),
+                        lo_ts = (SELECT MIN(first_ts) FROM trade_chunks c
+                                 WHERE c.symbol = trade_ranges.symbol
+                                 AND c.last_id BETWEEN trade_ranges.lo_id AND trade_ranges.hi_id)
+                    WHERE lo_ts < ?
+                ''', (cutoff,))
+        if removed:
+            logging.info(f"Из кэша сделок удалено {removed} блоков старше срока хранения.")
+        return removed
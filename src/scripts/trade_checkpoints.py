@@ -0,0 +1,170 @@
+import logging
+import threading
+from datetime import datetime
+
+from db_writer import connect
+from trade_aggregate import BUCKET_MS
+
+CHECKPOINT_DB = 'trades_data_okx.db'
+
+# Окно первого сбора по символу без контрольной точки (как раньше — последний час), мс
+BOOTSTRAP_MS = 60 * 60 * 1000
+# Скользящие окна агрегатов, мс; корзины старше самого длинного удаляются
+ROLLING_WINDOWS = {'1h': 60 * 60 * 1000, '24h': 24 * 60 * 60 * 1000}
+RETENTION_MS = max(ROLLING_WINDOWS.values())
+
+
+class TradeCheckpoints:
+    """
+    Контрольные точки сбора сделок OKX по символам и минутные корзины для скользящих агрегатов.
+
+    Контрольная точка — tradeId и время последней учтённой сделки и since_ts, начало непрерывного
+    покрытия. Следующий запуск листает историю только до контрольной точки и добавляет новые сделки
+    в корзины, из которых складываются агрегаты за 1 и 24 часа. Корзины и контрольная точка
+    обновляются одной транзакцией, поэтому сделки не учитываются дважды.
+
+    Как и TradeCache, методы синхронные: из асинхронного кода они вызываются через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path=CHECKPOINT_DB):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, check_same_thread=False)
+            self._create_tables()
+        return self._conn
+
+    def _create_tables(self):
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS trade_checkpoints (
+                    symbol TEXT PRIMARY KEY,
+                    last_trade_id INTEGER,         -- последняя учтённая сделка (NULL — сделок ещё не было)
+                    last_ts INTEGER NOT NULL,      -- её время или конец окна, если сделок не было, мс
+                    since_ts INTEGER NOT NULL,     -- начало непрерывного покрытия корзинами, мс
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS trade_buckets (
+                    symbol TEXT NOT NULL,
+                    minute INTEGER NOT NULL,       -- ts // 60000
+                    count INTEGER NOT NULL,
+                    volume REAL NOT NULL,
+                    notional REAL NOT NULL,        -- сумма px * sz для VWAP
+                    buy_volume REAL NOT NULL,
+                    sell_volume REAL NOT NULL,
+                    PRIMARY KEY (symbol, minute)
+                )
+            ''')
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, symbol):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT last_trade_id, last_ts, since_ts FROM trade_checkpoints WHERE symbol = ?',
+                (symbol,)).fetchone()
+        if row is None:
+            return None
+        return {'last_trade_id': row[0], 'last_ts': row[1], 'since_ts': row[2]}
+
+    def window(self, symbol, now_ms):
+        """
+        (start_time, floor_trade_id, since_ts) для очередного запуска по символу.
+
+        С контрольной точкой листается только то, что новее неё; без неё или если она старше
+        самого длинного окна, покрытие начинается заново с последнего часа.
+        """
+        return self._window(self.get(symbol), now_ms)
+
+    def windows(self, symbols, now_ms):
+        """window для многих символов одним запросом: {symbol: (start_time, floor_trade_id, since_ts)}."""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT symbol, last_trade_id, last_ts, since_ts FROM trade_checkpoints').fetchall()
+        checkpoints = {row[0]: {'last_trade_id': row[1], 'last_ts': row[2], 'since_ts': row[3]} for row in rows}
+        return {symbol: self._window(checkpoints.get(symbol), now_ms) for symbol in symbols}
+
+    @staticmethod
+    def _window(checkpoint, now_ms):
+        if checkpoint is None or checkpoint['last_ts'] < now_ms - RETENTION_MS:
+            start_time = now_ms - BOOTSTRAP_MS
+            return start_time, None, start_time
+        return checkpoint['last_ts'], checkpoint['last_trade_id'], checkpoint['since_ts']
+
+    def commit(self, symbol, aggregator, since_ts, end_time):
+        """Добавляет корзины MinuteBuckets и сдвигает контрольную точку одной транзакцией."""
+        rows = [(symbol, minute, *bucket) for minute, bucket in aggregator.minutes.items()]
+        with self._lock:
+            conn = self._connect()
+            previous = conn.execute('SELECT last_trade_id, last_ts FROM trade_checkpoints WHERE symbol = ?',
+                                    (symbol,)).fetchone()
+            if aggregator.newest_trade_id is not None:
+                last_trade_id, last_ts = aggregator.newest_trade_id, aggregator.last_ts
+            elif previous is not None and previous[0] is not None:
+                last_trade_id, last_ts = previous
+            else:
+                last_trade_id, last_ts = None, end_time
+
+            with conn:
+                # Корзины до начала покрытия (остались от прерванного покрытия) и старше окна удаляются
+                cutoff = max(since_ts, end_time - RETENTION_MS) // BUCKET_MS
+                conn.execute('DELETE FROM trade_buckets WHERE symbol = ? AND minute < ?', (symbol, cutoff))
+                conn.executemany('''
+                    INSERT INTO trade_buckets (symbol, minute, count, volume, notional, buy_volume, sell_volume)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(symbol, minute) DO UPDATE SET
+                        count = count + excluded.count,
+                        volume = volume + excluded.volume,
+                        notional = notional + excluded.notional,
+                        buy_volume = buy_volume + excluded.buy_volume,
+                        sell_volume = sell_volume + excluded.sell_volume
+                ''', rows)
+                conn.execute('''
+                    INSERT OR REPLACE INTO trade_checkpoints (symbol, last_trade_id, last_ts, since_ts, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (symbol, last_trade_id, last_ts, since_ts))
+
+    def rolling(self, symbol, now_ms):
+        """
+        Скользящие агрегаты символа по окнам ROLLING_WINDOWS (с точностью до минуты).
+
+        hours — сколько часов окна реально покрыто корзинами: пока покрытие короче окна,
+        агрегат за 24 часа собран за меньший срок и масштабируется вызывающим.
+        """
+        with self._lock:
+            conn = self._connect()
+            checkpoint = conn.execute('SELECT since_ts FROM trade_checkpoints WHERE symbol = ?',
+                                      (symbol,)).fetchone()
+            result = {}
+            for name, window_ms in ROLLING_WINDOWS.items():
+                start = max(now_ms - window_ms, checkpoint[0] if checkpoint else now_ms)
+                count, volume, notional, buy_volume, sell_volume = conn.execute('''
+                    SELECT COALESCE(SUM(count), 0), COALESCE(SUM(volume), 0), COALESCE(SUM(notional), 0),
+                           COALESCE(SUM(buy_volume), 0), COALESCE(SUM(sell_volume), 0)
+                    FROM trade_buckets WHERE symbol = ? AND minute >= ?
+                ''', (symbol, start // BUCKET_MS)).fetchone()
+                result[name] = {
+                    'count': count, 'volume': volume, 'vwap': notional / volume if volume else 0.0,
+                    'buy_volume': buy_volume, 'sell_volume': sell_volume,
+                    'hours': (now_ms - start) / (60 * 60 * 1000),
+                }
+        return result
+
+    def summary(self):
+        """Число символов с контрольной точкой и время самой старой из них."""
+        with self._lock:
+            count, oldest = self._connect().execute(
+                'SELECT COUNT(*), MIN(last_ts) FROM trade_checkpoints').fetchone()
+        if count:
+            oldest = datetime.utcfromtimestamp(oldest / 1000).strftime('%Y-%m-%d %H:%M:%S')
+            logging.info(f"Контрольные точки сделок: {count} символов, самая старая {oldest}.")
+        return count, oldest